@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming bulk export of API resources.
+
+The paginated API lists are meant for browsing, not for pulling whole
+tables. `ExportMixin` adds an ``export`` endpoint to a viewset (e.g.
+``/api/swid-stats/export/``) which streams the columns of all rows as NDJSON
+(one JSON object per line, the default) or CSV (``?output=csv``), optionally
+gzip compressed (``?gzip=1``). The rows may be filtered with the same
+parameters as the list.
+
+The rows are read as tuples with `QuerySet.iterator`, i.e. with a server
+side cursor where the database supports it, and encoded while the response
+is sent, so the memory used does not depend on the number of rows.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import csv
+import zlib
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from rest_framework import status
+from rest_framework.decorators import action
+
+from apps.api.utils import make_message
+
+
+"""
+Number of rows fetched from the database at once
+"""
+CHUNK_SIZE = 2000
+
+"""
+Approximate size of the chunks of the streamed response
+"""
+BUFFER_SIZE = 64 * 1024
+
+"""
+Content types by output format
+"""
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def export_columns(model):
+    """
+    Return the names of the exported columns of a model, i.e. its concrete
+    fields (foreign keys are exported as id).
+    """
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def ndjson_lines(columns, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(columns, row))) + '\n'
+
+
+class _Line(object):
+    """
+    A file-like object that returns what is written to it, for `csv.writer`.
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([value.isoformat() if isinstance(value, datetime) else value
+                               for value in row])
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """
+    Join lines to chunks of about the given size and encode them.
+    """
+    buf = []
+    length = 0
+    for line in lines:
+        buf.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buf).encode('utf-8')
+            buf = []
+            length = 0
+    if buf:
+        yield ''.join(buf).encode('utf-8')
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class ExportMixin(object):
+    """
+    A viewset mixin that adds a streaming ``export`` endpoint.
+
+    The exported columns default to the concrete fields of the model and
+    may be set with the `export_fields` attribute.
+    """
+    export_fields = None
+
+    def get_export_fields(self):
+        return self.export_fields or export_columns(self.get_queryset().model)
+
+    @action(detail=False)
+    def export(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in CONTENT_TYPES:
+            return make_message('Invalid output format, use ndjson or csv', status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        columns = self.get_export_fields()
+        queryset = self.filter_queryset(self.get_queryset())
+        # Nested objects are not exported, don't join or prefetch them
+        queryset = queryset.select_related(None).prefetch_related(None).order_by('pk')
+        rows = queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+
+        lines = ndjson_lines(columns, rows) if output == 'ndjson' else csv_lines(columns, rows)
+        chunks = buffered(lines)
+        filename = '%s.%s' % (self.basename, output)
+        content_type = CONTENT_TYPES[output]
+        if compress:
+            chunks = gzipped(chunks)
+            filename += '.gz'
+            content_type = 'application/gzip'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+        return response
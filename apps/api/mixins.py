@@ -1,10 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 
+import calendar
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from rest_framework.relations import HyperlinkedIdentityField, ManyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
 try:
-    from djangorestframework_camel_case.parser import camel_to_underscore
+    from djangorestframework_camel_case.util import camel_to_underscore
 except ImportError:
-    camel_to_underscore = lambda x: x
+    try:
+        from djangorestframework_camel_case.parser import camel_to_underscore
+    except ImportError:
+        camel_to_underscore = lambda x: x
 
 
 class DynamicFieldsMixin(object):
@@ -35,3 +49,137 @@ class DynamicFieldsMixin(object):
                 existing = set(self.fields.keys())
                 for field_name in existing - allowed:
                     self.fields.pop(field_name)
+
+
+def get_query_shape(serializer, prefix=''):
+    """
+    Determine how to query the objects of a model serializer, based on the
+    fields it renders.
+
+    Args:
+        serializer:
+            A model serializer instance (with its fields already restricted
+            by `DynamicFieldsMixin`).
+        prefix (str):
+            Lookup prefix of a nested serializer, e.g. ``session__``.
+
+    Returns:
+        A tuple with the set of the model fields read by the serializer
+        (None if that can't be determined, e.g. for fields with a dotted
+        source or properties), and the lists of relations to select and to
+        prefetch.
+
+    """
+    opts = serializer.Meta.model._meta
+    only = set([prefix + opts.pk.name])
+    select = []
+    prefetch = []
+    for field in serializer.fields.values():
+        if isinstance(field, HyperlinkedIdentityField):
+            continue  # Only needs the primary key
+        source = field.source
+        if source == '*' or '.' in source:
+            only = None
+            continue
+        path = prefix + source
+        if isinstance(field, ListSerializer):
+            child_only, child_select, child_prefetch = get_query_shape(field.child)
+            related = field.child.Meta.model.objects.select_related(*child_select)
+            prefetch.append(Prefetch(path, queryset=related.prefetch_related(*child_prefetch)))
+        elif isinstance(field, BaseSerializer):
+            child_only, child_select, child_prefetch = get_query_shape(field, path + '__')
+            select.append(path)
+            select.extend(child_select)
+            prefetch.extend(child_prefetch)
+            if child_only is None:
+                only = None
+            elif only is not None:
+                only |= child_only | set([path])
+        elif isinstance(field, ManyRelatedField):
+            prefetch.append(path)
+        else:
+            try:
+                model_field = opts.get_field(source)
+            except FieldDoesNotExist:
+                only = None
+                continue
+            if model_field.concrete and only is not None:
+                only.add(path)
+            elif model_field.many_to_many or model_field.one_to_many:
+                prefetch.append(path)
+    return only, select, prefetch
+
+
+class QueryShapingMixin(object):
+    """
+    A viewset mixin that shapes the queryset to the fields rendered by the
+    serializer (see `DynamicFieldsMixin`): Nested serializers are fetched
+    with ``select_related``, nested lists and many-to-many relations with
+    ``prefetch_related``. If only some fields are requested with the
+    `fields` parameter, only the columns of these fields are loaded.
+
+    Usage::
+
+        class MyViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
+            queryset = MyModel.objects.all()
+            serializer_class = MySerializer
+
+    """
+    def get_queryset(self):
+        queryset = super(QueryShapingMixin, self).get_queryset()
+        only, select, prefetch = get_query_shape(self.get_serializer())
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if only is not None and self.request.query_params.get('fields'):
+            queryset = queryset.only(*only)
+        return queryset
+
+
+class ConditionalGetMixin(object):
+    """
+    A viewset mixin that answers conditional GET requests for single objects
+    (``If-None-Match`` and ``If-Modified-Since``) with the modification time
+    stored in the `last_modified_field` of the model. If the object didn't
+    change, a 304 response is returned after a single primary key lookup,
+    without loading and serializing the object.
+    """
+    last_modified_field = 'modified'
+
+    def get_last_modified(self):
+        """
+        Return the modification time of the requested object, None if it
+        doesn't exist.
+        """
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset()).select_related(None).prefetch_related(None)
+        return queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]}) \
+                       .values_list(self.last_modified_field, flat=True).first()
+
+    def get_etag(self, request, last_modified):
+        # The representation depends on the resource, its fields and format
+        key = '%s|%s|%s' % (request.get_full_path(), request.accepted_renderer.media_type,
+                            last_modified.isoformat())
+        return '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def conditional_response(self, request, view):
+        """
+        Return a 304 response if the object is unchanged, else the response of
+        the given view, with the ``ETag`` and ``Last-Modified`` headers.
+        """
+        last_modified = self.get_last_modified()
+        if last_modified is None:
+            return view()
+        etag = self.get_etag(request, last_modified)
+        timestamp = calendar.timegm(last_modified.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = view()
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super(ConditionalGetMixin, self)
+        return self.conditional_response(request, lambda: parent.retrieve(request, *args, **kwargs))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Pagination of the API list endpoints.
+
+Most tables (sessions, results, tags, files etc.) grow without bounds, so
+their lists are paginated with a cursor: Every page is fetched with an
+indexed range query (``WHERE id > ...``), independent of how deep the page
+is. The small lookup tables (policies, products, algorithms) may also be
+paginated with ``limit`` and ``offset``.
+
+The page size defaults to ``API_PAGE_SIZE`` and can be chosen with the
+``page_size`` (cursor) or ``limit`` (offset) parameter, up to
+``API_MAX_PAGE_SIZE``.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.conf import settings
+
+from rest_framework import pagination
+
+
+class CursorPagination(pagination.CursorPagination):
+    """
+    Cursor pagination, ordered by the primary key (or the ``ordering`` of
+    the view, which must be unique and unchanging).
+    """
+    ordering = 'pk'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', None) or self.ordering
+        if isinstance(ordering, str):
+            return (ordering,)
+        return tuple(ordering)
+
+
+class LimitOffsetPagination(pagination.LimitOffsetPagination):
+    """
+    Limit/offset pagination for small tables, ordered by the primary key.
+    """
+    default_limit = settings.API_PAGE_SIZE
+    max_limit = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return super(LimitOffsetPagination, self).paginate_queryset(queryset.order_by('pk'), request, view)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+JSON renderer with camelCase keys.
+
+The renderer of `djangorestframework_camel_case` first copies the whole
+response data to new ordered dicts, running a regex substitution on every
+key of every object, and then lets `json` encode the copy. `CamelCaseJSONRenderer`
+instead walks the data once and writes the JSON text directly. The encoded
+keys (camelCase and quoted) are memoized, as a list response repeats the same
+few keys for every object. Strings are escaped with the C accelerated
+functions of `json` where available.
+
+The output is identical to the one of the library renderer. Pretty printed
+output (e.g. in the browsable API) is still rendered by the library.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from functools import lru_cache
+
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+
+from djangorestframework_camel_case.settings import api_settings as camel_case_settings
+from djangorestframework_camel_case.util import camelize, camelize_re, is_iterable, underscore_to_camel
+from rest_framework import renderers
+from rest_framework.utils import encoders
+
+try:
+    from json.encoder import c_encode_basestring as encode_basestring
+except ImportError:
+    from json.encoder import py_encode_basestring as encode_basestring
+try:
+    from json.encoder import c_encode_basestring_ascii as encode_basestring_ascii
+except ImportError:
+    from json.encoder import py_encode_basestring_ascii as encode_basestring_ascii
+
+
+"""
+Number of memoized key translations
+"""
+KEY_CACHE_SIZE = 4096
+
+
+def camelize_key(key):
+    """
+    Translate a key to camelCase, like `djangorestframework_camel_case`.
+    """
+    if '_' in key:
+        return camelize_re.sub(underscore_to_camel, key)
+    return key
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def encoded_key(key, ensure_ascii):
+    """
+    Return a string key translated to camelCase and encoded as JSON string.
+    """
+    if ensure_ascii:
+        return encode_basestring_ascii(camelize_key(key))
+    return encode_basestring(camelize_key(key))
+
+
+class CamelCaseEncoder(object):
+    """
+    Encode data as JSON (without indentation), translating the keys of all
+    dicts to camelCase.
+
+    Objects that aren't JSON types, lists, dicts or other iterables are
+    encoded with `encoder_class` (without translating keys), as are the
+    values of the ``ignore_fields`` configured for the camelCase library.
+    """
+    def __init__(self, encoder_class=encoders.JSONEncoder, ensure_ascii=False, allow_nan=False,
+                 separators=renderers.SHORT_SEPARATORS):
+        self.ensure_ascii = ensure_ascii
+        self.allow_nan = allow_nan
+        self.item_separator, self.key_separator = separators
+        self.encode_string = encode_basestring_ascii if ensure_ascii else encode_basestring
+        self.fallback = encoder_class(ensure_ascii=ensure_ascii, allow_nan=allow_nan, separators=separators)
+        options = camel_case_settings.JSON_UNDERSCOREIZE
+        self.ignore_fields = options.get('ignore_fields') or ()
+
+    def encode(self, o):
+        chunks = []
+        self._encode(o, chunks.append)
+        return ''.join(chunks)
+
+    def _encode(self, o, append):
+        if type(o) is str:
+            append(self.encode_string(o))
+            return
+        if isinstance(o, Promise):
+            o = force_str(o)
+        if isinstance(o, str):
+            append(self.encode_string(o))
+        elif o is None:
+            append('null')
+        elif o is True:
+            append('true')
+        elif o is False:
+            append('false')
+        elif isinstance(o, int):
+            append(int.__repr__(o))
+        elif isinstance(o, float):
+            append(self._float(o))
+        elif isinstance(o, dict):
+            self._encode_dict(o, append)
+        elif isinstance(o, (list, tuple)) or is_iterable(o):
+            self._encode_list(o, append)
+        else:
+            # e.g. dates or decimals, which are mostly converted to strings
+            value = self.fallback.default(o)
+            if isinstance(value, str):
+                append(self.encode_string(value))
+            else:
+                append(self.fallback.encode(value))
+
+    def _encode_list(self, items, append):
+        append('[')
+        first = True
+        for item in items:
+            if first:
+                first = False
+            else:
+                append(self.item_separator)
+            self._encode(item, append)
+        append(']')
+
+    def _encode_dict(self, dct, append):
+        append('{')
+        first = True
+        for key, value in dct.items():
+            if first:
+                first = False
+            else:
+                append(self.item_separator)
+            if isinstance(key, Promise):
+                key = force_str(key)
+            if isinstance(key, str):
+                append(encoded_key(key, self.ensure_ascii))
+                ignored = self.ignore_fields and {key, camelize_key(key)} & set(self.ignore_fields)
+            else:
+                append(self.encode_string(self._key(key)))
+                ignored = self.ignore_fields and key in self.ignore_fields
+            append(self.key_separator)
+            if ignored:
+                append(self.fallback.encode(value))
+            else:
+                self._encode(value, append)
+        append('}')
+
+    def _key(self, key):
+        # Non-string keys are converted like json does
+        if key is True:
+            return 'true'
+        elif key is False:
+            return 'false'
+        elif key is None:
+            return 'null'
+        elif isinstance(key, int):
+            return int.__repr__(key)
+        elif isinstance(key, float):
+            return self._float(key)
+        raise TypeError('keys must be str, int, float, bool or None, not %s' % key.__class__.__name__)
+
+    def _float(self, o):
+        if o != o:
+            text = 'NaN'
+        elif o == float('inf'):
+            text = 'Infinity'
+        elif o == -float('inf'):
+            text = '-Infinity'
+        else:
+            return float.__repr__(o)
+        if not self.allow_nan:
+            raise ValueError('Out of range float values are not JSON compliant: %r' % o)
+        return text
+
+
+class CamelCaseJSONRenderer(renderers.JSONRenderer):
+    """
+    Renderer which serializes to JSON with camelCase keys.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            data = camelize(data, **camel_case_settings.JSON_UNDERSCOREIZE)
+            return super(CamelCaseJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+
+        separators = renderers.SHORT_SEPARATORS if self.compact else renderers.LONG_SEPARATORS
+        encoder = CamelCaseEncoder(self.encoder_class, ensure_ascii=self.ensure_ascii,
+                                   allow_nan=not self.strict, separators=separators)
+        ret = encoder.encode(data)
+
+        # Escape \u2028 and \u2029 like JSONRenderer
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
@@ -7,7 +7,7 @@ from rest_framework import routers
 
 from apps.core.api_views import IdentityViewSet, SessionViewSet, ResultViewSet
 from apps.swid.api_views import EventViewSet, EntityViewSet, TagViewSet, TagStatsViewSet, TagAddView
-from apps.swid.api_views import SwidMeasurementView, SwidEventsView
+from apps.swid.api_views import SwidMeasurementView, SwidEventsView, SwidResolveView
 from apps.devices.api_views import ProductViewSet, DeviceViewSet
 from apps.policies.api_views import PolicyViewSet
 from apps.packages.api_views import PackageViewSet, VersionViewSet
@@ -46,6 +46,10 @@ urlpatterns += [
     re_path(r'^swid/add-tags/', TagAddView.as_view(), name='swid-add-tags'),
     re_path(r'^swid/add-tags/\.(?P<format>[a-z0-9]+)', TagAddView.as_view(), name='swid-add-tags'),
 
+    # Resolve software IDs
+    re_path(r'^swid/resolve/', SwidResolveView.as_view(), name='swid-resolve'),
+    re_path(r'^swid/resolve/\.(?P<format>[a-z0-9]+)', SwidResolveView.as_view(), name='swid-resolve'),
+
     # Register SW ID inventory upload
     re_path(r'^sessions/(?P<pk>[^/]+)/swid-measurement/',
         SwidMeasurementView.as_view(), name='session-swid-measurement'),
@@ -3,23 +3,26 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 
 from rest_framework import viewsets
 
+from apps.api.export import ExportMixin
+from apps.api.mixins import QueryShapingMixin
+
 from . import models, serializers
 
 
-class IdentityViewSet(viewsets.ReadOnlyModelViewSet):
+class IdentityViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Identity
     queryset = model.objects.all()
     serializer_class = serializers.IdentitySerializer
     filter_fields = ('type', 'data',)
 
 
-class SessionViewSet(viewsets.ReadOnlyModelViewSet):
+class SessionViewSet(ExportMixin, QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Session
     queryset = model.objects.all()
     serializer_class = serializers.SessionSerializer
 
 
-class ResultViewSet(viewsets.ReadOnlyModelViewSet):
+class ResultViewSet(ExportMixin, QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Result
     queryset = model.objects.all()
     serializer_class = serializers.ResultSerializer
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+class CoreConfig(AppConfig):
+    name = 'apps.core'
+
+    def ready(self):
+        from apps.core import search
+
+        # Look up the installed search indexes once per request
+        request_started.connect(search.clear_caches, dispatch_uid='search_clear_caches')
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Query expressions shared by the apps.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.db.models import F, Func, IntegerField, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset):
+    """
+    Return the number of rows of a (correlated) queryset as expression, to
+    annotate counts without joins and GROUP BY.
+
+    Args:
+        queryset (QuerySet):
+            The counted queryset, usually filtered with `OuterRef`.
+
+    Returns:
+        An expression evaluating to an integer.
+
+    """
+    counts = queryset.order_by().annotate(count=Func(F('pk'), function='COUNT')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
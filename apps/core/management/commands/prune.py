@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to prune old sessions and their results, work
+items, SWID tag links and tag changes.
+
+Usage: ./manage.py prune [--keep-sessions N] [--keep-days D] [--archive DIR]
+                         [--chunk-size SIZE] [--dry-run]
+
+A session is pruned if it is older than D days and not one of the N most
+recent sessions of its device. Sessions referenced by the SWID tag stats
+are always kept.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.core import retention
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Delete sessions (and the rows depending on them) that are older than the ' \
+           'given number of days and not among the most recent sessions of their device.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-sessions', type=int, default=None,
+                            help='Number of most recent sessions kept per device')
+        parser.add_argument('--keep-days', type=int, default=None,
+                            help='Sessions younger than this number of days are kept')
+        parser.add_argument('--archive', default=None, metavar='DIR',
+                            help='Archive the pruned rows to a gzip compressed NDJSON file in DIR')
+        parser.add_argument('--chunk-size', type=int, default=retention.CHUNK_SIZE,
+                            help='Number of sessions deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only show the number of prunable sessions')
+
+    def handle(self, *args, **kwargs):
+        try:
+            policy = retention.RetentionPolicy(kwargs['keep_sessions'], kwargs['keep_days'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if kwargs['chunk_size'] < 1:
+            raise CommandError('The chunk size must be positive')
+
+        archive = None
+        if kwargs['archive'] and not kwargs['dry_run']:
+            if not os.path.isdir(kwargs['archive']):
+                raise CommandError('Archive directory "%s" does not exist' % kwargs['archive'])
+            filename = timezone.now().strftime('prune-%Y%m%d-%H%M%S.ndjson.gz')
+            archive = retention.NdjsonArchive(os.path.join(kwargs['archive'], filename))
+
+        pruned = retention.prune(policy, kwargs['chunk_size'], archive, kwargs['dry_run'])
+
+        verb = 'Would prune' if kwargs['dry_run'] else 'Pruned'
+        self.stdout.write('%s %d sessions of %d devices' % (verb, sum(pruned.values()), len(pruned)))
+        if archive is not None:
+            self.stdout.write('Archived %d rows to %s' % (archive.count, archive.path))
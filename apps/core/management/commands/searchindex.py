@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to manage the substring search indexes.
+
+Usage: ./manage.py searchindex install|rebuild|drop
+
+install: Create the indexes (and the triggers keeping them in sync) and fill them.
+rebuild: Refill the installed indexes from the indexed tables.
+drop:    Remove the indexes, searches fall back to LIKE queries.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+
+from apps.core import search
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    args = 'install|rebuild|drop'
+    help = 'Install, rebuild or drop the trigram indexes used for substring searches.'
+
+    actions = {
+        'install': search.install_indexes,
+        'rebuild': search.rebuild_indexes,
+        'drop': search.drop_indexes,
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*')
+
+    def handle(self, *args, **kwargs):
+        if len(args) != 1 or args[0] not in self.actions:
+            raise CommandError('Usage: ./manage.py searchindex install|rebuild|drop')
+
+        try:
+            with transaction.atomic():
+                self.actions[args[0]]()
+        except (DatabaseError, NotImplementedError) as e:
+            raise CommandError('Unable to %s the search indexes: %s' % (args[0], e))
+
+        for model, field_name in search.get_indexes():
+            installed = search.get_backend(model).is_installed(model, field_name)
+            self.stdout.write('%s.%s: %s' % (model.__name__, field_name,
+                                             'installed' if installed else 'not installed'))
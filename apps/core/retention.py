@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Retention of sessions and the rows depending on them.
+
+A session is pruned if it is older than the retention period *and* not one
+of the most recent sessions of its device. Sessions referenced by `TagStats`
+(as first or last session a tag was seen) are always kept, deleting them
+would delete the stats of the device.
+
+The sessions are deleted in chunks, each in its own short transaction, so
+that the strongSwan daemon writing to the same database is never blocked
+for long. The rows of a chunk (sessions, results, work items, SWID tag links
+and tag changes) can be archived to a gzip compressed file with one JSON
+object per line (NDJSON), written once their deletion is committed.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.core.serializers import serialize
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from apps.core.models import Result, Session, WorkItem
+from apps.devices import counters
+from apps.devices.models import Device
+from apps.swid.models import Tag, TagChange, TagStats
+
+
+"""
+Number of sessions deleted per transaction
+"""
+CHUNK_SIZE = 500
+
+
+class RetentionPolicy(object):
+    """
+    Which sessions to keep.
+
+    Args:
+        keep_sessions (int):
+            Number of most recent sessions kept per device, None to only
+            consider the age.
+        keep_days (int):
+            Sessions younger than this number of days are kept, None to only
+            consider the number of sessions.
+
+    """
+    def __init__(self, keep_sessions=None, keep_days=None):
+        if keep_sessions is None and keep_days is None:
+            raise ValueError('A retention policy needs a number of sessions or days to keep')
+        if (keep_sessions is not None and keep_sessions < 0) or (keep_days is not None and keep_days < 0):
+            raise ValueError('The numbers of sessions and days to keep must not be negative')
+        self.keep_sessions = keep_sessions
+        self.keep_days = keep_days
+
+    def prunable_sessions(self, device_id, now=None):
+        """
+        Return the sessions of a device that may be pruned.
+
+        Returns:
+            A queryset of sessions.
+
+        """
+        sessions = Session.objects.filter(device=device_id)
+        if self.keep_days is not None:
+            now = now or timezone.now()
+            sessions = sessions.filter(time__lt=now - timedelta(days=self.keep_days))
+        if self.keep_sessions is not None:
+            # Sessions not newer than the first one that isn't kept (the pk breaks ties)
+            newest = Session.objects.filter(device=device_id).order_by('-time', '-pk')
+            first_pruned = newest.values_list('time', 'pk')[self.keep_sessions:self.keep_sessions + 1]
+            if not first_pruned:
+                return Session.objects.none()
+            time, pk = first_pruned[0]
+            sessions = sessions.filter(Q(time__lt=time) | Q(time=time, pk__lte=pk))
+
+        referenced = TagStats.objects.filter(Q(first_seen=OuterRef('pk')) | Q(last_seen=OuterRef('pk')))
+        return sessions.annotate(referenced=Exists(referenced)).filter(referenced=False)
+
+
+class NdjsonArchive(object):
+    """
+    Gzip compressed archive with one serialized object per line.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+
+    def serialize(self, queryset):
+        """
+        Return the lines of the objects of a queryset.
+        """
+        return [json.dumps(obj, cls=DjangoJSONEncoder, sort_keys=True)
+                for obj in serialize('python', queryset.order_by('pk').iterator())]
+
+    def write(self, lines):
+        """
+        Append lines to the archive and flush them to disk.
+        """
+        if lines:
+            with open(self.path, 'ab') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+                f.flush()
+                os.fsync(raw.fileno())
+        self.count += len(lines)
+
+
+def prune_chunk(session_ids, archive=None):
+    """
+    Delete (and archive) the given sessions and the rows depending on them,
+    in a single transaction.
+
+    The rows are serialized in the transaction, but only written to the
+    archive once it is committed, so that a rolled back chunk is not
+    archived.
+    """
+    tag_links = Tag.sessions.through.objects.filter(session__in=session_ids)
+    dependents = [
+        Result.objects.filter(session__in=session_ids),
+        WorkItem.objects.filter(session__in=session_ids),
+        TagChange.objects.filter(session__in=session_ids),
+        tag_links,
+    ]
+    with transaction.atomic():
+        sessions = Session.objects.filter(pk__in=session_ids)
+        if archive is not None:
+            lines = []
+            for queryset in [sessions] + dependents:
+                lines.extend(archive.serialize(queryset))
+            transaction.on_commit(lambda: archive.write(lines))
+        for queryset in dependents:
+            queryset.delete()
+        return sessions.delete()[1].get(Session._meta.label, 0)
+
+
+def prune(policy, chunk_size=CHUNK_SIZE, archive=None, dry_run=False):
+    """
+    Prune the sessions of all devices according to the retention policy.
+
+    Args:
+        policy (RetentionPolicy):
+            The retention policy.
+        chunk_size (int):
+            The number of sessions deleted per transaction.
+        archive (NdjsonArchive):
+            Archive the deleted rows to this archive, None to not archive
+            them.
+        dry_run (bool):
+            Only count the prunable sessions.
+
+    Returns:
+        A dict mapping the device ids to the number of pruned sessions.
+
+    """
+    now = timezone.now()
+    pruned = {}
+    for device_id in Device.objects.order_by('pk').values_list('pk', flat=True):
+        sessions = policy.prunable_sessions(device_id, now)
+        if dry_run:
+            count = sessions.count()
+        else:
+            count = 0
+            while True:
+                session_ids = list(sessions.order_by('time', 'pk').values_list('pk', flat=True)[:chunk_size])
+                if not session_ids:
+                    break
+                count += prune_chunk(session_ids, archive)
+            if count:
+                counters.update([device_id])
+        if count:
+            pruned[device_id] = count
+    return pruned
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Substring search on indexed text columns.
+
+Filtering with ``__icontains`` results in a ``LIKE '%term%'`` query, which
+can't use a regular index and scans the whole table. For the columns listed
+in `SEARCH_INDEXES`, a trigram index may be installed with
+``./manage.py searchindex install``:
+
+* SQLite: An external content FTS5 table with the ``trigram`` tokenizer per
+  column, kept in sync by triggers on the indexed table.
+* PostgreSQL: A GIN index using the ``pg_trgm`` operator class, which is
+  used by the database for the ``UPPER(column) LIKE UPPER(%term%)`` queries
+  Django generates for ``__icontains``.
+
+Use `contains` to build the filter for a substring search. If no index is
+installed for a column (or the backend does not support one), it falls back
+to ``__icontains``. The installed indexes are looked up once per request (see
+`clear_caches`), so indexes installed or dropped while the server is running
+are used or no longer used by the next request.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+"""
+Indexed text columns as (model, field) tuples
+"""
+SEARCH_INDEXES = (
+    ('swid.Tag', 'unique_id'),
+    ('swid.Entity', 'regid'),
+    ('filesystem.File', 'name'),
+    ('filesystem.Directory', 'path'),
+    ('devices.Device', 'description'),
+    ('devices.Device', 'value'),
+    ('packages.Package', 'name'),
+)
+
+
+class LikeBackend(object):
+    """
+    Fallback backend, filters with ``__icontains``.
+    """
+    def __init__(self, alias):
+        self.alias = alias
+        self._installed = None
+
+    @property
+    def connection(self):
+        # Connections are per thread, the backend may be used by several threads
+        return connections[self.alias]
+
+    def index_name(self, model, field_name):
+        field = model._meta.get_field(field_name)
+        return 'search_%s_%s' % (model._meta.db_table, field.column)
+
+    def installed(self):
+        """
+        Return the set of installed index names. The result is cached until
+        `clear_cache` is called, i.e. until the next request.
+        """
+        if self._installed is None:
+            self._installed = set(self.installed_indexes())
+        return self._installed
+
+    def clear_cache(self):
+        self._installed = None
+
+    def installed_indexes(self):
+        return []
+
+    def is_installed(self, model, field_name):
+        return self.index_name(model, field_name) in self.installed()
+
+    def contains(self, model, field_name, query, prefix=''):
+        return Q(**{'%s%s__icontains' % (prefix, field_name): query})
+
+    def install(self, model, field_name):
+        raise NotImplementedError('Search indexes are not supported by the "%s" database backend' %
+                                  self.connection.vendor)
+
+    def rebuild(self, model, field_name):
+        pass
+
+    def drop(self, model, field_name):
+        pass
+
+
+class SqliteTrigramBackend(LikeBackend):
+    """
+    SQLite FTS5 trigram index. Search terms shorter than a trigram can't be
+    looked up in the index and fall back to ``__icontains``.
+    """
+    min_length = 3
+
+    def installed_indexes(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'search\\_%' "
+                           "ESCAPE '\\'")
+            return [row[0] for row in cursor.fetchall()]
+
+    def contains(self, model, field_name, query, prefix=''):
+        if len(query) < self.min_length or not self.is_installed(model, field_name):
+            return super(SqliteTrigramBackend, self).contains(model, field_name, query, prefix)
+        index = self.index_name(model, field_name)
+        # Quote the search term as FTS5 string, i.e. search for the literal term
+        term = '"%s"' % query.replace('"', '""')
+        sql = 'SELECT rowid FROM %s WHERE %s MATCH %%s' % (index, index)
+        return Q(**{'%spk__in' % prefix: RawSQL(sql, (term,))})
+
+    def install(self, model, field_name):
+        index = self.index_name(model, field_name)
+        table = model._meta.db_table
+        column = model._meta.get_field(field_name).column
+        pk = model._meta.pk.column
+        params = {'index': index, 'table': table, 'column': column, 'pk': pk}
+        statements = [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %(index)s USING fts5(%(column)s, content='%(table)s', "
+            "content_rowid='%(pk)s', tokenize='trigram')",
+            "CREATE TRIGGER IF NOT EXISTS %(index)s_ai AFTER INSERT ON %(table)s BEGIN "
+            "INSERT INTO %(index)s (rowid, %(column)s) VALUES (new.%(pk)s, new.%(column)s); END",
+            "CREATE TRIGGER IF NOT EXISTS %(index)s_ad AFTER DELETE ON %(table)s BEGIN "
+            "INSERT INTO %(index)s (%(index)s, rowid, %(column)s) "
+            "VALUES ('delete', old.%(pk)s, old.%(column)s); END",
+            "CREATE TRIGGER IF NOT EXISTS %(index)s_au AFTER UPDATE OF %(column)s ON %(table)s BEGIN "
+            "INSERT INTO %(index)s (%(index)s, rowid, %(column)s) "
+            "VALUES ('delete', old.%(pk)s, old.%(column)s); "
+            "INSERT INTO %(index)s (rowid, %(column)s) VALUES (new.%(pk)s, new.%(column)s); END",
+        ]
+        with self.connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement % params)
+        self.rebuild(model, field_name)
+
+    def rebuild(self, model, field_name):
+        index = self.index_name(model, field_name)
+        with self.connection.cursor() as cursor:
+            cursor.execute("INSERT INTO %s (%s) VALUES ('rebuild')" % (index, index))
+
+    def drop(self, model, field_name):
+        index = self.index_name(model, field_name)
+        with self.connection.cursor() as cursor:
+            for trigger in ('ai', 'ad', 'au'):
+                cursor.execute('DROP TRIGGER IF EXISTS %s_%s' % (index, trigger))
+            cursor.execute('DROP TABLE IF EXISTS %s' % index)
+
+
+class PostgresTrigramBackend(LikeBackend):
+    """
+    PostgreSQL ``pg_trgm`` GIN index. The index is used by the database for
+    ``__icontains`` lookups, no special filter is needed.
+    """
+    def installed_indexes(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE indexname LIKE 'search\\_%'")
+            return [row[0] for row in cursor.fetchall()]
+
+    def install(self, model, field_name):
+        index = self.index_name(model, field_name)
+        table = model._meta.db_table
+        column = model._meta.get_field(field_name).column
+        with self.connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute('CREATE INDEX IF NOT EXISTS %s ON %s USING gin (UPPER(%s) gin_trgm_ops)' %
+                           (index, table, column))
+
+    def drop(self, model, field_name):
+        with self.connection.cursor() as cursor:
+            cursor.execute('DROP INDEX IF EXISTS %s' % self.index_name(model, field_name))
+
+
+"""
+Search backends by database vendor
+"""
+SEARCH_BACKENDS = {
+    'sqlite': SqliteTrigramBackend,
+    'postgresql': PostgresTrigramBackend,
+}
+
+_backends = {}
+
+
+def get_backend(model):
+    """
+    Return the search backend for the database of the given model.
+    """
+    alias = router.db_for_read(model)
+    if alias not in _backends:
+        backend_class = LikeBackend
+        if getattr(settings, 'USE_SEARCH_INDEX', True):
+            backend_class = SEARCH_BACKENDS.get(connections[alias].vendor, LikeBackend)
+        _backends[alias] = backend_class(alias)
+    return _backends[alias]
+
+
+def clear_caches(**kwargs):
+    """
+    Forget the installed indexes of all backends. Connected to the
+    `request_started` signal.
+    """
+    for backend in _backends.values():
+        backend.clear_cache()
+
+
+def get_indexes():
+    """
+    Return the indexed columns as (model class, field name) tuples.
+    """
+    return [(apps.get_model(model), field_name) for model, field_name in SEARCH_INDEXES]
+
+
+def contains(model, field_path, query):
+    """
+    Return a filter for the objects of a model whose field contains the given
+    search term (case insensitive), equivalent to ``field_path__icontains``.
+
+    Args:
+        model:
+            The model class of the filtered queryset.
+        field_path (str):
+            The searched field, related fields may be given like in
+            queryset lookups, e.g. ``directory__path``.
+        query (str):
+            The search term.
+
+    Returns:
+        A `Q` object.
+
+    """
+    relations = field_path.split('__')
+    field_name = relations.pop()
+    target = model
+    for relation in relations:
+        target = target._meta.get_field(relation).related_model
+    prefix = ''.join('%s__' % relation for relation in relations)
+    return get_backend(target).contains(target, field_name, query, prefix)
+
+
+def install_indexes():
+    """
+    Install (or update) the search indexes of all indexed columns.
+    """
+    for model, field_name in get_indexes():
+        backend = get_backend(model)
+        backend.install(model, field_name)
+        backend.clear_cache()
+
+
+def rebuild_indexes():
+    """
+    Rebuild the contents of the installed search indexes.
+    """
+    for model, field_name in get_indexes():
+        backend = get_backend(model)
+        if backend.is_installed(model, field_name):
+            backend.rebuild(model, field_name)
+
+
+def drop_indexes():
+    """
+    Drop the search indexes of all indexed columns.
+    """
+    for model, field_name in get_indexes():
+        backend = get_backend(model)
+        backend.drop(model, field_name)
+        backend.clear_cache()
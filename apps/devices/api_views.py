@@ -1,20 +1,68 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
-from . import models, serializers
+from apps.api.mixins import QueryShapingMixin
+from apps.api.pagination import LimitOffsetPagination
+from apps.api.utils import make_message
+from apps.swid.api_views import validate_data_param
 
+from . import bulk, models, serializers
 
-class ProductViewSet(viewsets.ReadOnlyModelViewSet):
+
+"""
+Maximum number of devices per bulk request
+"""
+MAX_BULK_DEVICES = 10000
+
+
+class ProductViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Product
     queryset = model.objects.all()
     serializer_class = serializers.ProductSerializer
     filter_fields = ('name',)
+    pagination_class = LimitOffsetPagination
 
 
-class DeviceViewSet(viewsets.ReadOnlyModelViewSet):
+class DeviceViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Device
     queryset = model.objects.all()
     serializer_class = serializers.DeviceSerializer
     filter_fields = ('value', 'description', 'product', 'created', 'trusted', 'inactive',)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, format=None):
+        """
+        Create or update devices and their group memberships.
+
+        Devices are identified by their value and product, products and
+        groups by their names. Missing products are created (and a device
+        with another product is a new device), the given groups replace the
+        current memberships of a device. Either all devices are stored or,
+        if any is invalid, none (the errors are returned per item).
+
+            {"data": [{"value": "a1b2c3", "description": "Laptop", "product": "Debian 10",
+                       "trusted": true, "groups": ["Default"]}]}
+
+        """
+        try:
+            items = validate_data_param(request, 'devices')
+        except ValueError as e:
+            return e.args[0]
+        if len(items) > MAX_BULK_DEVICES:
+            msg = 'Too many devices, at most %d are allowed per request' % MAX_BULK_DEVICES
+            return make_message(msg, status.HTTP_400_BAD_REQUEST)
+
+        serializer = serializers.DeviceBulkSerializer(data=items, many=True)
+        if not serializer.is_valid():
+            return Response({'detail': 'Invalid devices', 'errors': serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            results = bulk.upsert_devices(serializer.validated_data)
+        except bulk.BulkValidationError as e:
+            return Response({'detail': 'Invalid devices', 'errors': e.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results}, status=status.HTTP_200_OK)
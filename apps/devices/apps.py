@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+class DevicesConfig(AppConfig):
+    name = 'apps.devices'
+
+    def ready(self):
+        from apps.devices import cache
+        from apps.devices.models import Group
+        from apps.policies.models import Enforcement, Policy
+
+        # Invalidate the cached enforcement sets of the devices
+        for model in (Group, Policy, Enforcement):
+            post_save.connect(cache.enforcements_changed, sender=model,
+                              dispatch_uid='enforcements_changed_%s' % model.__name__)
+            post_delete.connect(cache.enforcements_changed, sender=model,
+                                dispatch_uid='enforcements_deleted_%s' % model.__name__)
+        m2m_changed.connect(cache.memberships_changed, sender=Group.devices.through,
+                            dispatch_uid='memberships_changed')
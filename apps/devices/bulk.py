@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk creation and update of devices and their group memberships.
+
+Used by the ``/api/devices/bulk/`` endpoint to provision devices from asset
+management systems. Like for the strongSwan daemon, a device is identified
+by its value and its product (the same value may be used by devices of
+different products), products and groups by their names. Products that don't
+exist yet are created, groups have to exist.
+
+The whole batch is validated before anything is written, so a batch is
+either stored completely or not at all. Devices, products and memberships
+are read and written with a few chunked queries per batch instead of
+several queries per device.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.devices import cache
+from apps.devices.models import Device, Group, Product
+from apps.swid import vulnerabilities
+from apps.swid.utils import chunked_filter_in
+
+
+"""
+Maximum number of values per ``IN`` query (sqlite allows 999 parameters)
+"""
+BLOCK_SIZE = 980
+
+"""
+Device fields that may be updated
+"""
+UPDATE_FIELDS = ('description', 'trusted', 'inactive')
+
+CREATED = 'created'
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+
+
+class BulkValidationError(ValueError):
+    """
+    Raised if items of a batch are invalid. `errors` contains a dict of
+    errors for every item (empty for valid items).
+    """
+    def __init__(self, errors):
+        super(BulkValidationError, self).__init__('Invalid items')
+        self.errors = errors
+
+
+def _by_name(model, names):
+    """
+    Look up objects by name.
+
+    Returns:
+        A tuple with a dict mapping the names to object ids and the set of
+        names used by several objects.
+
+    """
+    ids, ambiguous = {}, set()
+    rows = chunked_filter_in(model.objects.order_by('pk').values_list('name', 'pk'), 'name',
+                             sorted(names), BLOCK_SIZE)
+    for name, pk in rows:
+        if name in ids:
+            ambiguous.add(name)
+        else:
+            ids[name] = pk
+    return ids, ambiguous
+
+
+def _validate(items):
+    """
+    Resolve the devices, products and groups of a batch.
+
+    Returns:
+        A tuple with a dict mapping (value, product id) tuples to the
+        existing devices, a dict mapping product names to ids and a dict
+        mapping group names to ids.
+
+    Raises:
+        BulkValidationError: If an item can't be resolved.
+
+    """
+    errors = [defaultdict(list) for _ in items]
+
+    first_index = {}
+    for index, item in enumerate(items):
+        key = (item['value'], item['product'])
+        if key in first_index:
+            errors[index]['value'].append('Duplicate of item %d.' % first_index[key])
+        else:
+            first_index[key] = index
+
+    products, ambiguous_products = _by_name(Product, set(item['product'] for item in items))
+    group_names = set(name for item in items for name in item.get('groups', ()))
+    groups, ambiguous_groups = _by_name(Group, group_names)
+
+    devices, ambiguous_devices = {}, set()
+    values = sorted(set(item['value'] for item in items if item['product'] in products))
+    product_ids = set(products.values())
+    for device in chunked_filter_in(Device.objects.order_by('pk'), 'value', values, BLOCK_SIZE):
+        if device.product_id not in product_ids:
+            continue
+        key = (device.value, device.product_id)
+        if key in devices:
+            ambiguous_devices.add(key)
+        else:
+            devices[key] = device
+
+    for index, item in enumerate(items):
+        if item['product'] in ambiguous_products:
+            errors[index]['product'].append('Several products with this name exist.')
+        elif (item['value'], products.get(item['product'])) in ambiguous_devices:
+            errors[index]['value'].append('Several devices with this value and product exist.')
+        for name in item.get('groups', ()):
+            if name in ambiguous_groups:
+                errors[index]['groups'].append('Several groups named "%s" exist.' % name)
+            elif name not in groups:
+                errors[index]['groups'].append('Group "%s" does not exist.' % name)
+
+    if any(errors):
+        raise BulkValidationError([dict(e) for e in errors])
+    return devices, products, groups
+
+
+def _create_products(items, products):
+    names = set(item['product'] for item in items) - set(products)
+    if names:
+        Product.objects.bulk_create([Product(name=name) for name in sorted(names)])
+        products.update(_by_name(Product, names)[0])
+
+
+def _set_memberships(memberships):
+    """
+    Replace the group memberships of devices.
+
+    Args:
+        memberships (dict):
+            Mapping of device ids to sets of group ids.
+
+    Returns:
+        The set of ids of the devices whose memberships changed.
+
+    """
+    through = Group.devices.through
+    current = defaultdict(dict)
+    rows = chunked_filter_in(through.objects.values_list('pk', 'device_id', 'group_id'), 'device_id',
+                             list(memberships), BLOCK_SIZE)
+    for pk, device_id, group_id in rows:
+        current[device_id][group_id] = pk
+
+    delete, add, changed = [], [], set()
+    for device_id, group_ids in memberships.items():
+        existing = current[device_id]
+        removed = [pk for group_id, pk in existing.items() if group_id not in group_ids]
+        added = [through(device_id=device_id, group_id=group_id) for group_id in group_ids
+                 if group_id not in existing]
+        if removed or added:
+            changed.add(device_id)
+        delete.extend(removed)
+        add.extend(added)
+
+    for i in range(0, len(delete), BLOCK_SIZE):
+        through.objects.filter(pk__in=delete[i:i + BLOCK_SIZE]).delete()
+    through.objects.bulk_create(add, batch_size=500)
+    return changed
+
+
+def upsert_devices(items):
+    """
+    Create or update devices and set their group memberships.
+
+    Args:
+        items (list):
+            Validated data of `DeviceBulkSerializer` instances: dicts with the
+            ``value`` and the ``product`` (name) of a device and optionally
+            its ``description``, ``trusted`` and ``inactive`` flags and
+            ``groups`` (names, replacing the current memberships).
+
+    Returns:
+        A list with a dict for every item, with the ``value``, ``product``
+        and ``id`` of the device and the ``status`` (created, updated or
+        unchanged).
+
+    Raises:
+        BulkValidationError: If items are invalid, nothing is stored.
+
+    """
+    devices, products, groups = _validate(items)
+
+    with transaction.atomic():
+        _create_products(items, products)
+
+        def key(item):
+            return item['value'], products[item['product']]
+
+        new, changed, toggled = [], [], []
+        now = timezone.now()
+        for item in items:
+            fields = dict((field, item[field]) for field in UPDATE_FIELDS if field in item)
+            device = devices.get(key(item))
+            if device is None:
+                new.append(Device(value=item['value'], product_id=products[item['product']], created=now,
+                                  **fields))
+            elif any(getattr(device, field) != value for field, value in fields.items()):
+                if device.inactive != fields.get('inactive', device.inactive):
+                    toggled.append(device.pk)
+                for field, value in fields.items():
+                    setattr(device, field, value)
+                changed.append(device)
+
+        Device.objects.bulk_create(new, batch_size=500)
+        Device.objects.bulk_update(changed, UPDATE_FIELDS, batch_size=500)
+        if new:
+            new_keys = set((d.value, d.product_id) for d in new)
+            created = chunked_filter_in(Device.objects.order_by('pk'), 'value',
+                                        sorted(set(d.value for d in new)), BLOCK_SIZE)
+            devices.update(((d.value, d.product_id), d) for d in created
+                           if (d.value, d.product_id) in new_keys)
+
+        memberships = dict((devices[key(item)].pk, set(groups[name] for name in item['groups']))
+                           for item in items if 'groups' in item)
+        regrouped = _set_memberships(memberships)
+
+        # Bulk operations don't send the signals that maintain the active
+        # flags of the vulnerability index and invalidate the cache
+        for i in range(0, len(toggled), BLOCK_SIZE):
+            vulnerabilities.refresh(device_ids=toggled[i:i + BLOCK_SIZE])
+        cache.invalidate(list(regrouped))
+
+    created_keys = set((d.value, d.product_id) for d in new)
+    updated_ids = set(d.pk for d in changed) | regrouped
+    results = []
+    for item in items:
+        device = devices[key(item)]
+        if key(item) in created_keys:
+            status = CREATED
+        elif device.pk in updated_ids:
+            status = UPDATED
+        else:
+            status = UNCHANGED
+        results.append({'value': device.value, 'product': item['product'], 'id': device.pk,
+                        'status': status})
+    return results
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the effective enforcements of the devices.
+
+The enforcements that apply to a device only depend on its group
+memberships, the group hierarchy and the enforcements (and their policies),
+which rarely change. The effective enforcements are therefore computed once
+per device and stored in the Django cache.
+
+Instead of tracking which devices are affected by a change, every change of
+a group, policy or enforcement increments a generation number that is part
+of the cache keys, i.e. all cached sets are invalidated at once. Changes of
+the group memberships of a device only invalidate the sets of the affected
+devices. The signal handlers are connected in `DevicesConfig.ready`.
+
+Note that bulk operations (e.g. `QuerySet.update`) don't send signals, call
+`invalidate` after such changes. The cache is invalidated when the current
+transaction commits, before that other processes still read the old data.
+
+Changes made by one process (or a management command) have to be seen by
+all others, so the cache backend must be shared by all processes (the
+default database cache, see the ``[cache]`` section of settings.ini). With
+a process-local backend (e.g. `LocMemCache`) nothing is cached and the
+enforcements are always computed, as they are if the cache table wasn't
+created yet.
+
+The hits and misses are counted per process and only added to the counts
+in the cache every `STATS_INTERVAL` seconds.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import threading
+import time
+import uuid
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import DatabaseError, transaction
+
+
+"""
+Seconds a cached enforcement set is kept, None to keep it until invalidated
+"""
+CACHE_TIMEOUT = 24 * 3600
+
+"""
+Cache backends whose contents aren't shared by the processes of a server
+"""
+PROCESS_LOCAL_BACKENDS = (LocMemCache,)
+
+"""
+Seconds between the updates of the hit and miss counts in the cache
+"""
+STATS_INTERVAL = 60
+
+GENERATION_KEY = 'enforcements:generation'
+HITS_KEY = 'enforcements:hits'
+MISSES_KEY = 'enforcements:misses'
+
+_stats_lock = threading.Lock()
+_stats = {HITS_KEY: 0, MISSES_KEY: 0}
+_stats_flushed = [time.time()]
+
+
+def is_shared():
+    """
+    Return whether the configured cache backend is shared by all processes.
+    """
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], PROCESS_LOCAL_BACKENDS)
+
+
+def _new_generation():
+    return uuid.uuid4().hex
+
+
+def _generation():
+    # A random value instead of a counter, so that sets cached before the
+    # generation was evicted are never used again
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, _new_generation(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _device_key(device_id, generation):
+    return 'enforcements:%s:%s' % (generation, device_id)
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+        due = time.time() - _stats_flushed[0] >= STATS_INTERVAL
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """
+    Add the hits and misses counted by this process to the counts in the
+    cache.
+    """
+    with _stats_lock:
+        counts = dict(_stats)
+        _stats.update((key, 0) for key in counts)
+        _stats_flushed[0] = time.time()
+    try:
+        for key, count in counts.items():
+            if count and not cache.add(key, count, None):
+                try:
+                    cache.incr(key, count)
+                except ValueError:
+                    # Evicted in the meantime
+                    cache.add(key, count, None)
+    except DatabaseError:
+        pass
+
+
+def get_enforcements(device):
+    """
+    Return the effective enforcements of a device.
+
+    If a policy is enforced on several groups of the device, the enforcement
+    with the smallest max_age applies.
+
+    Args:
+        device (apps.devices.models.Device):
+            The device.
+
+    Returns:
+        A list of `Enforcement` instances (with their policy), ordered by
+        max_age and policy.
+
+    """
+    if not is_shared():
+        return device.get_effective_enforcements()
+
+    try:
+        # The generation is read before computing the set, a set computed
+        # during an invalidation is stored under the outdated generation
+        key = _device_key(device.pk, _generation())
+        enforcements = cache.get(key)
+    except DatabaseError:
+        # The cache table doesn't exist (yet)
+        return device.get_effective_enforcements()
+    if enforcements is not None:
+        _count(HITS_KEY)
+        return enforcements
+
+    _count(MISSES_KEY)
+    enforcements = device.get_effective_enforcements()
+    cache.set(key, enforcements, CACHE_TIMEOUT)
+    return enforcements
+
+
+def invalidate(device_ids=None):
+    """
+    Invalidate cached enforcement sets when the current transaction (of the
+    default database) commits, or immediately outside a transaction.
+
+    Args:
+        device_ids (list):
+            Only invalidate the sets of these devices. None to invalidate
+            all sets.
+
+    """
+    if device_ids is not None:
+        device_ids = list(device_ids)
+    transaction.on_commit(lambda: _invalidate(device_ids))
+
+
+def _invalidate(device_ids):
+    try:
+        if device_ids is None:
+            cache.set(GENERATION_KEY, _new_generation(), None)
+        else:
+            generation = _generation()
+            cache.delete_many([_device_key(pk, generation) for pk in device_ids])
+    except DatabaseError:
+        # Nothing is cached without cache table
+        pass
+
+
+def get_stats():
+    """
+    Return the hits and misses of the cache since the last `reset_stats`
+    (those of other processes as of their last update).
+
+    Returns:
+        A dict with the keys ``hits``, ``misses`` and ``hit_rate`` (None if
+        there were no lookups).
+
+    """
+    flush_stats()
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / lookups if lookups else None,
+    }
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.update((key, 0) for key in _stats)
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+# Signal handlers
+
+def enforcements_changed(sender, **kwargs):
+    """
+    Invalidate all sets if a group, policy or enforcement changed.
+    """
+    invalidate()
+
+
+def memberships_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalidate the sets of the devices whose groups changed.
+    """
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # The groups of a device changed
+        invalidate([instance.pk])
+    elif pk_set is not None:
+        # The devices of a group changed
+        invalidate(pk_set)
+    else:
+        # All devices were removed from a group
+        invalidate()
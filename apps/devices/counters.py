@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Maintenance of the denormalized `DeviceCounters`.
+
+The counters are recomputed per device, with one query for the expected
+values of all given devices, instead of being incremented. Recomputing can't
+accumulate errors, and counting the rows of a single device is cheap with
+the device indexes.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.db.models import OuterRef, Subquery
+
+from apps.core.expressions import count_subquery
+from apps.core.models import Session
+from apps.devices.models import Device, DeviceCounters
+from apps.swid.models import DeviceVulnerability, TagStats
+
+
+"""
+Counter fields of `DeviceCounters`
+"""
+COUNTER_FIELDS = ('installed_count', 'vulnerable_count', 'session_count', 'last_session_time')
+
+
+def expected_counters(devices):
+    """
+    Annotate the devices with the expected values of their counters.
+
+    Args:
+        devices (QuerySet):
+            A queryset of devices.
+
+    Returns:
+        The annotated queryset.
+
+    """
+    installed = TagStats.objects.exclude(first_installed=None).filter(last_deleted=None,
+                                                                     device=OuterRef('pk'))
+    vulnerable = DeviceVulnerability.objects.filter(device=OuterRef('pk'))
+    sessions = Session.objects.filter(device=OuterRef('pk'))
+    last_session_time = sessions.order_by('-time').values('time')[:1]
+    return devices.annotate(expected_installed_count=count_subquery(installed),
+                            expected_vulnerable_count=count_subquery(vulnerable),
+                            expected_session_count=count_subquery(sessions),
+                            expected_last_session_time=Subquery(last_session_time))
+
+
+def _diff(devices):
+    """
+    Return the counters (saved or new) of the devices whose counters differ
+    from the expected values.
+    """
+    devices = expected_counters(devices).select_related('counters').order_by('pk')
+    changed = []
+    for device in devices.iterator():
+        counters = device.get_counters()
+        modified = False
+        for field in COUNTER_FIELDS:
+            expected = getattr(device, 'expected_%s' % field)
+            if getattr(counters, field) != expected:
+                setattr(counters, field, expected)
+                modified = True
+        if modified or counters._state.adding:
+            changed.append(counters)
+    return changed
+
+
+def _save(counters_list):
+    new = [c for c in counters_list if c._state.adding]
+    DeviceCounters.objects.bulk_create(new, batch_size=500)
+    existing = [c for c in counters_list if not c._state.adding]
+    DeviceCounters.objects.bulk_update(existing, COUNTER_FIELDS, batch_size=500)
+
+
+def update(device_ids):
+    """
+    Recompute the counters of the given devices.
+
+    Args:
+        device_ids (list):
+            The ids of the devices.
+
+    """
+    device_ids = list(device_ids)
+    if device_ids:
+        _save(_diff(Device.objects.filter(pk__in=device_ids)))
+
+
+def verify(fix=False, chunk_size=1000):
+    """
+    Compare the counters of all devices with the expected values.
+
+    Args:
+        fix (bool):
+            Correct the differing counters.
+        chunk_size (int):
+            The number of devices checked per query.
+
+    Returns:
+        A list of the differing (or missing) `DeviceCounters`, with the
+        expected values.
+
+    """
+    drifted = []
+    last_pk = 0
+    while True:
+        device_ids = list(Device.objects.filter(pk__gt=last_pk).order_by('pk')
+                          .values_list('pk', flat=True)[:chunk_size])
+        if not device_ids:
+            break
+        last_pk = device_ids[-1]
+        changed = _diff(Device.objects.filter(pk__in=device_ids))
+        if fix:
+            _save(changed)
+        drifted.extend(changed)
+    return drifted
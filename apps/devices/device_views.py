@@ -11,9 +11,11 @@ from django.contrib.auth.decorators import login_required, permission_required
 from django.shortcuts import get_object_or_404, render, redirect
 from django.utils.translation import gettext_lazy as _
 
-from apps.core.models import Session, Result
+from apps.core.models import Session
+from apps.core.types import ACTION_CHOICES
 from apps.swid.models import Event, TagEvent
-from .models import Device, Group, Product
+from . import cache
+from .models import Device, Group, Product, is_due
 
 
 @require_GET
@@ -184,19 +186,21 @@ def report(request, deviceID):
     """
     Generate device report for given device
     """
-    current_device = get_object_or_404(Device, pk=deviceID)
+    # The session and software counts are taken from the denormalized counters
+    current_device = get_object_or_404(Device.objects.select_related('counters'), pk=deviceID)
+    device_counters = current_device.get_counters()
 
     context = {}
     context['device'] = current_device
     context['title'] = _('Report for ') + str(current_device)
     context['paging_args'] = {'device_id': current_device.pk}
 
-    context['session_count'] = Session.objects.filter(device=current_device).count()
-    context['definition_set'] = list(current_device.groups.all())
-    context['inherit_set'] = list(current_device.get_inherit_set())
+    context['session_count'] = device_counters.session_count
+    context['definition_set'], context['inherit_set'] = current_device.get_group_memberships()
 
-    if context['session_count'] > 0:
-        latest_session = Session.objects.filter(device=deviceID).latest()
+    latest_session = Session.objects.filter(device=current_device).select_related('identity') \
+                                    .order_by('-time').first()
+    if latest_session:
         context['last_session'] = latest_session
         context['last_user'] = latest_session.identity.data
         context['last_result'] = latest_session.get_recommendation_display()
@@ -205,19 +209,21 @@ def report(request, deviceID):
         context['last_user'] = _('None')
         context['last_result'] = _('None')
 
+    # Only the effective enforcements are tested
     enforcements = []
-    for group in context['definition_set'] + context['inherit_set']:
-        for e in group.enforcements.all():
-            try:
-                result = Result.objects.filter(session__device=current_device, policy=e.policy).latest()
-                enforcements.append((e, result.get_recommendation_display(),
-                    current_device.is_due_for(e)))
-            except Result.DoesNotExist:
-                enforcements.append((e, _('None'), True))
+    effective = cache.get_enforcements(current_device)
+    latest_results = current_device.get_latest_results([e.policy_id for e in effective])
+    for e in effective:
+        if e.policy_id in latest_results:
+            result_time, recommendation = latest_results[e.policy_id]
+            enforcements.append((e, dict(ACTION_CHOICES)[recommendation],
+                is_due(e, result_time, recommendation)))
+        else:
+            enforcements.append((e, _('None'), True))
     context['enforcements'] = enforcements
 
-    context['installed_count'] = current_device.get_installed_count()
-    context['vulnerability_count'] = current_device.get_vulnerabilities().count()
+    context['installed_count'] = device_counters.installed_count
+    context['vulnerability_count'] = device_counters.vulnerable_count
 
     return render(request, 'devices/device_report.html', context)
 
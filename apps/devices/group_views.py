@@ -126,7 +126,11 @@ def save(request):
         group = get_object_or_404(Group, pk=groupID)
         group.name = name
         group.parent = parent
-        group.save()
+        try:
+            group.save()
+        except ValueError:
+            # The new parent is a child of the group
+            return HttpResponse(status=400)
 
     group.devices.clear()
     devices = Device.objects.filter(id__in=group_members)
@@ -189,29 +193,30 @@ def group_tree():
     """
     Returns a tree-view of all groups as <dl>-Tag.
     """
+    children = {}
+    for group in Group.objects.all():
+        children.setdefault(group.parent_id, []).append(group)
 
     dl = '<dl>\n'
-    roots = Group.objects.filter(parent=None)
-
-    for root in roots:
-        dl += add_children(root)
+    for root in children.get(None, []):
+        dl += add_children(root, children)
 
     dl += '</dl>'
 
     return dl
 
 
-def add_children(parent):
+def add_children(parent, children):
     """
     Recursion method for group_tree()
     """
     sub = ''
     url = reverse('devices:group_detail', args=[parent.id])
-    if parent.membergroups.all():
+    if parent.id in children:
         sub += '<dd><dl>\n'
         sub += '<dt><a href="%s">%s</a></dt>\n' % (url, parent)
-        for child in parent.membergroups.all():
-            sub += add_children(child)
+        for child in children[parent.id]:
+            sub += add_children(child, children)
         sub += '</dl></dd>'
     else:
         sub += '<dd><a href="%s">%s</a></dd>\n' % (url, parent)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to monitor and clear the cache of the effective
+enforcements of the devices.
+
+Usage: ./manage.py enforcementcache [stats|reset|clear]
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.devices import cache
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    args = '[stats|reset|clear]'
+    help = 'Show the hit rate of the enforcement cache (stats), reset the ' \
+           'statistics (reset) or invalidate all cached enforcement sets (clear).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*')
+
+    def handle(self, *args, **kwargs):
+        action = args[0] if args else 'stats'
+        if action == 'stats':
+            stats = cache.get_stats()
+            hit_rate = '-' if stats['hit_rate'] is None else '%.1f%%' % (stats['hit_rate'] * 100)
+            self.stdout.write('hits: %d\nmisses: %d\nhit rate: %s' %
+                              (stats['hits'], stats['misses'], hit_rate))
+        elif action == 'reset':
+            cache.reset_stats()
+            self.stdout.write('Reset enforcement cache statistics')
+        elif action == 'clear':
+            cache.invalidate()
+            self.stdout.write('Invalidated all cached enforcement sets')
+        else:
+            raise CommandError('Unknown action "%s", use stats, reset or clear' % action)
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to rebuild the closure table of the group hierarchy.
+
+Usage: ./manage.py rebuildgroups
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.devices import cache
+from apps.devices.models import GroupClosure
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Rebuild the ancestor/descendant table of the group hierarchy ' \
+           'from the parent relations of the groups.'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            count = GroupClosure.rebuild()
+        cache.invalidate()
+        self.stdout.write('Rebuilt group hierarchy with {0} links'.format(count))
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to verify the denormalized software and session
+counters of the devices.
+
+Usage: ./manage.py verifycounters [--fix]
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.devices import counters
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Compare the software and session counters of all devices with the actual ' \
+           'counts and optionally correct them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Correct the differing counters')
+
+    def handle(self, *args, **kwargs):
+        fix = kwargs['fix']
+        with transaction.atomic():
+            drifted = counters.verify(fix=fix)
+        for device_counters in drifted:
+            self.stdout.write('%s: installed %d, vulnerable %d, sessions %d, last session %s' % (
+                device_counters.device, device_counters.installed_count,
+                device_counters.vulnerable_count, device_counters.session_count,
+                device_counters.last_session_time))
+        action = 'Corrected' if fix else 'Found'
+        self.stdout.write('%s %d devices with outdated counters' % (action, len(drifted)))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def closure_links(parents):
+    # Copy of `apps.devices.models.closure_links` at the time of this migration
+    parent_of = dict(parents)
+    links = []
+    for group_id in parent_of:
+        ancestor, depth, seen = group_id, 0, set()
+        while ancestor is not None and ancestor not in seen:
+            links.append((ancestor, group_id, depth))
+            seen.add(ancestor)
+            ancestor, depth = parent_of.get(ancestor), depth + 1
+    return links
+
+
+def build_group_closure(apps, schema_editor):
+    Group = apps.get_model('devices', 'Group')
+    GroupClosure = apps.get_model('devices', 'GroupClosure')
+
+    links = closure_links(Group.objects.values_list('pk', 'parent'))
+    GroupClosure.objects.bulk_create([
+        GroupClosure(ancestor_id=a, descendant_id=d, depth=depth) for a, d, depth in links
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0002_device_inactive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupClosure',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(related_name='descendant_links', to='devices.Group',
+                                               on_delete=models.CASCADE)),
+                ('descendant', models.ForeignKey(related_name='ancestor_links', to='devices.Group',
+                                                 on_delete=models.CASCADE)),
+            ],
+            options={
+                'db_table': 'groups_closure',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='groupclosure',
+            unique_together=set([('ancestor', 'descendant')]),
+        ),
+        migrations.RunPython(build_group_closure, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils.timezone import utc
+
+import apps.core.fields
+
+
+def populate(apps, schema_editor):
+    Device = apps.get_model('devices', 'Device')
+    DeviceCounters = apps.get_model('devices', 'DeviceCounters')
+    TagStats = apps.get_model('swid', 'TagStats')
+    DeviceVulnerability = apps.get_model('swid', 'DeviceVulnerability')
+
+    installed = TagStats.objects.exclude(first_installed=None).filter(last_deleted=None)
+    installed = dict(installed.values_list('device').annotate(count=Count('pk')).order_by())
+    vulnerable = dict(DeviceVulnerability.objects.values_list('device').annotate(count=Count('pk'))
+                      .order_by())
+    # The core app has no migrations, query the sessions table directly
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT device, COUNT(*), MAX(time) FROM sessions GROUP BY device')
+        sessions = dict((device_id, (count, datetime.fromtimestamp(time, utc)))
+                        for device_id, count, time in cursor.fetchall())
+    DeviceCounters.objects.bulk_create([
+        DeviceCounters(device_id=pk, installed_count=installed.get(pk, 0),
+                       vulnerable_count=vulnerable.get(pk, 0),
+                       session_count=sessions.get(pk, (0, None))[0],
+                       last_session_time=sessions.get(pk, (0, None))[1])
+        for pk in Device.objects.values_list('pk', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_groupclosure'),
+        ('swid', '0006_devicevulnerability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceCounters',
+            fields=[
+                ('device', models.OneToOneField(related_name='counters', primary_key=True, serialize=False,
+                                                to='devices.Device', on_delete=models.CASCADE)),
+                ('installed_count', models.PositiveIntegerField(default=0, db_index=True)),
+                ('vulnerable_count', models.PositiveIntegerField(default=0, db_index=True)),
+                ('session_count', models.PositiveIntegerField(default=0)),
+                ('last_session_time', apps.core.fields.EpochField(null=True, blank=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'devices_counters',
+                'verbose_name_plural': 'device counters',
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -5,11 +5,14 @@ from datetime import timedelta, datetime
 
 from django.utils import timezone
 from django.db import models
+from django.db.models import Exists, OuterRef, Subquery
 
 from apps.core.fields import EpochField
-from apps.core.models import Result
+from apps.devices import cache
+from apps.core.models import Result, WorkItem
 from apps.core.types import Action
-from apps.swid.models import TagStats
+from apps.policies.models import Enforcement, Policy
+from apps.swid.models import DeviceVulnerability, TagStats
 
 
 class Product(models.Model):
@@ -65,25 +68,34 @@ class Device(models.Model):
 
     def get_group_set(self):
         """
-        Get all groups of the device
+        Get all groups of the device, including the inherited ones
         """
-        groups = []
-        for g in self.groups.all():
-            groups.append(g)
-            groups += g.get_parents()
-
-        groups = set(groups)
-        return groups
+        return set(Group.objects.filter(descendant_links__descendant__devices=self).distinct())
 
     def get_inherit_set(self):
         """
         Get the groups which the device has inherited
         """
-        group_set = self.get_group_set()
-        for group in (group_set & set(self.groups.all())):
-            group_set.remove(group)
+        return set(Group.objects.filter(descendant_links__descendant__devices=self)
+                   .exclude(devices=self).distinct())
+
+    def get_group_memberships(self):
+        """
+        Get the groups of the device by definition and by inheritance, in a
+        single query.
+
+        Returns:
+            A tuple with the list of groups the device is a member of and
+            the list of groups it has inherited.
 
-        return group_set
+        """
+        membership = Group.devices.through.objects.filter(group=OuterRef('pk'), device=self.pk)
+        groups = Group.objects.filter(descendant_links__descendant__devices=self).distinct() \
+                              .annotate(is_member=Exists(membership))
+        definition_set, inherit_set = [], []
+        for group in groups:
+            (definition_set if group.is_member else inherit_set).append(group)
+        return definition_set, inherit_set
 
     def is_due_for(self, enforcement):
         """
@@ -96,37 +108,67 @@ class Device(models.Model):
         except Result.DoesNotExist:
             return True
 
-        deadline = timezone.now() - timedelta(seconds=enforcement.max_age)
-
-        if result.session.time < deadline or (result.recommendation != Action.ALLOW):
-            return True
+        return is_due(enforcement, result.session.time, result.recommendation)
 
-        return False
+    def get_effective_enforcements(self):
+        """
+        Get the enforcements that apply to the device. If a policy is
+        enforced on several groups of the device, the enforcement with the
+        smallest max_age applies.
 
-    def create_work_items(self, session):
+        Use `apps.devices.cache.get_enforcements` for the cached set.
         """
-        Creates workitems for every policy that is due
+        enforcements = Enforcement.objects \
+            .filter(group__descendant_links__descendant__devices=self).distinct() \
+            .select_related('policy', 'group').order_by('max_age', 'policy_id', 'pk')
+
+        policies = set()
+        effective = []
+        for enforcement in enforcements:
+            if enforcement.policy_id not in policies:
+                policies.add(enforcement.policy_id)
+                effective.append(enforcement)
+        return effective
+
+    def get_latest_results(self, policy_ids):
         """
+        Get the session time and recommendation of the latest result of
+        every given policy, in a single query.
 
-        enforcements = []
-        for group in self.get_group_set():
-            enforcements += group.enforcements.all()
+        Returns:
+            A dict mapping the policy ids to (time, recommendation) tuples,
+            policies without results are missing.
+
+        """
+        latest_results = Result.objects.filter(session__device=self, policy=OuterRef('pk')) \
+                                       .order_by('-session__time')
+        policies = Policy.objects.filter(pk__in=policy_ids) \
+            .annotate(result_time=Subquery(latest_results.values('session__time')[:1]),
+                      result_recommendation=Subquery(latest_results.values('recommendation')[:1])) \
+            .filter(result_time__isnull=False) \
+            .values_list('pk', 'result_time', 'result_recommendation')
+        return dict((pk, (time, recommendation)) for pk, time, recommendation in policies)
 
-        minforcements = []
+    def create_work_items(self, session):
+        """
+        Creates workitems for every policy that is due
 
-        while enforcements:
-            emin = enforcements.pop()
-            for e in enforcements:
-                if emin.policy == e.policy:
-                    emin = min(emin, e, key=lambda x: x.max_age)
-                    if emin == e:
-                        enforcements.remove(e)
+        The effective enforcements are taken from the enforcement cache, the
+        latest results of their policies are fetched in a single query and
+        the work items are inserted at once.
+        """
+        enforcements = cache.get_enforcements(self)
+        if not enforcements:
+            return
+        latest_results = self.get_latest_results([e.policy_id for e in enforcements])
 
-            minforcements.append(emin)
+        work_items = []
+        for enforcement in enforcements:
+            result_time, recommendation = latest_results.get(enforcement.policy_id, (None, None))
+            if is_due(enforcement, result_time, recommendation):
+                work_items.append(enforcement.policy.build_work_item(enforcement, session))
 
-        for enforcement in minforcements:
-            if self.is_due_for(enforcement):
-                enforcement.policy.create_work_item(enforcement, session)
+        WorkItem.objects.bulk_create(work_items)
 
     def get_sessions_in_range(self, from_timestamp, to_timestamp):
         dt_from = datetime.utcfromtimestamp(from_timestamp).replace(hour=0, minute=0, second=0)
@@ -134,14 +176,49 @@ class Device(models.Model):
         return self.sessions.filter(time__gte=dt_from, time__lte=dt_to).order_by('-time')
 
     def get_vulnerabilities(self):
-        return TagStats.objects.exclude(first_installed=None).filter(last_deleted=None,
-                                device=self.pk, tag__version__security=1)
+        return DeviceVulnerability.objects.filter(device=self.pk)
+
+    def get_counters(self):
+        """
+        Get the denormalized counters of the device. Devices without
+        software measurements may have no counters yet, an unsaved instance
+        with zero counts is returned for them.
+        """
+        try:
+            return self.counters
+        except DeviceCounters.DoesNotExist:
+            return DeviceCounters(device=self)
 
     def get_installed_count(self):
         return TagStats.objects.exclude(first_installed=None).filter(last_deleted=None,
                                 device=self.pk).count()
 
 
+def is_due(enforcement, result_time, recommendation):
+    """
+    Check if the measurement defined by the enforcement is due, given the
+    session time and recommendation of the latest result of its policy.
+
+    Args:
+        enforcement (apps.policies.models.Enforcement):
+            The enforcement.
+        result_time (datetime):
+            Time of the session of the latest result, None if there is none.
+        recommendation (int):
+            Recommendation of the latest result.
+
+    """
+    if result_time is None:
+        return True
+
+    deadline = timezone.now() - timedelta(seconds=enforcement.max_age)
+
+    if result_time < deadline or (recommendation != Action.ALLOW):
+        return True
+
+    return False
+
+
 class Group(models.Model):
     """
     Group of devices, for management purposes.
@@ -165,20 +242,138 @@ class Group(models.Model):
         """
         return self.name
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        moved = False
+        if not adding:
+            old_parent = Group.objects.filter(pk=self.pk).values_list('parent', flat=True).first()
+            moved = old_parent != self.parent_id
+            if moved and self.parent_id is not None and GroupClosure.objects.filter(
+                    ancestor=self.pk, descendant=self.parent_id).exists():
+                raise ValueError('Group "%s" can\'t be moved below itself' % self)
+        super(Group, self).save(*args, **kwargs)
+        if adding:
+            GroupClosure.add_group(self)
+        elif moved:
+            GroupClosure.move_group(self)
+
     def get_parents(self):
         """
-        Recursively get all parent groups.
+        Get all parent groups, the nearest one first.
         """
-        if not self.parent:
-            return []
-        return [self.parent] + self.parent.get_parents()
+        return list(Group.objects.filter(descendant_links__descendant=self, descendant_links__depth__gt=0)
+                    .order_by('descendant_links__depth'))
 
     def get_children(self):
         """
-        Recursively get all child groups.
+        Get all child groups, the nearest ones first.
         """
-        result = list(Group.objects.filter(parent=self))
-        for child in result:
-            result += list(child.get_children())
+        return list(Group.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gt=0)
+                    .order_by('ancestor_links__depth', 'name'))
 
-        return result
+
+class DeviceCounters(models.Model):
+    """
+    Denormalized counters of a device, so that device reports and lists
+    don't need to count the software and sessions of the devices.
+
+    The counters are updated by `apps.devices.counters` when software
+    measurements and events are received and when the vulnerability index
+    changes. Sessions are created by the strongSwan daemon, so the session
+    counters are only current as of the last software measurement; run
+    ``./manage.py verifycounters --fix`` periodically to correct any drift.
+    """
+    device = models.OneToOneField(Device, primary_key=True, on_delete=models.CASCADE,
+                        related_name='counters')
+    installed_count = models.PositiveIntegerField(default=0, db_index=True)
+    vulnerable_count = models.PositiveIntegerField(default=0, db_index=True)
+    session_count = models.PositiveIntegerField(default=0)
+    last_session_time = EpochField(null=True, blank=True, db_index=True)
+
+    class Meta(object):
+        db_table = 'devices_counters'
+        verbose_name_plural = 'device counters'
+
+    def __str__(self):
+        return 'Counters of %s' % self.device
+
+
+class GroupClosure(models.Model):
+    """
+    Transitive closure of the group hierarchy: One row per group and each of
+    its ancestors (including the group itself at depth 0).
+    """
+    ancestor = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta(object):
+        db_table = 'groups_closure'
+        unique_together = ('ancestor', 'descendant')
+
+    def __str__(self):
+        return '%s > %s' % (self.ancestor, self.descendant)
+
+    @classmethod
+    def add_group(cls, group):
+        """
+        Add the rows of a new group.
+        """
+        links = [cls(ancestor_id=group.pk, descendant_id=group.pk, depth=0)]
+        if group.parent_id is not None:
+            ancestors = cls.objects.filter(descendant=group.parent_id).values_list('ancestor', 'depth')
+            links += [cls(ancestor_id=a, descendant_id=group.pk, depth=depth + 1)
+                      for a, depth in ancestors]
+        cls.objects.bulk_create(links)
+
+    @classmethod
+    def move_group(cls, group):
+        """
+        Update the rows of a group and its subtree after a change of its parent.
+        """
+        subtree = list(cls.objects.filter(ancestor=group.pk).values_list('descendant', 'depth'))
+        subtree_ids = [d for d, _ in subtree]
+        cls.objects.filter(descendant__in=subtree_ids).exclude(ancestor__in=subtree_ids).delete()
+        if group.parent_id is not None:
+            ancestors = cls.objects.filter(descendant=group.parent_id).values_list('ancestor', 'depth')
+            cls.objects.bulk_create([cls(ancestor_id=a, descendant_id=d, depth=a_depth + d_depth + 1)
+                                     for a, a_depth in ancestors for d, d_depth in subtree])
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rebuild all rows from the parent relations of the groups.
+
+        Returns:
+            The number of rows.
+
+        """
+        cls.objects.all().delete()
+        links = [cls(ancestor_id=a, descendant_id=d, depth=depth)
+                 for a, d, depth in closure_links(Group.objects.values_list('pk', 'parent'))]
+        cls.objects.bulk_create(links, batch_size=500)
+        return len(links)
+
+
+def closure_links(parents):
+    """
+    Compute the transitive closure of a group hierarchy.
+
+    Args:
+        parents:
+            Iterable of (group id, parent id) tuples.
+
+    Returns:
+        A list of (ancestor id, descendant id, depth) tuples.
+
+    """
+    parent_of = dict(parents)
+    links = []
+    for group_id in parent_of:
+        ancestor, depth, seen = group_id, 0, set()
+        # A cycle in inconsistent data must not loop forever
+        while ancestor is not None and ancestor not in seen:
+            links.append((ancestor, group_id, depth))
+            seen.add(ancestor)
+            ancestor, depth = parent_of.get(ancestor), depth + 1
+    return links
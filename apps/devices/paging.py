@@ -5,7 +5,7 @@ import math
 
 from .models import Device, Product
 from apps.core.models import Session
-from apps.swid.models import Event
+from apps.swid.models import Event, Tag
 from apps.front.paging import ProducerFactory
 
 
@@ -47,16 +47,14 @@ def device_event_stat_producer(page_size, filter_query, dynamic_params=None,
 def device_vulnerability_list_producer(from_idx, to_idx, filter_query, dynamic_params=None,
                                                                         static_params=None):
     device_id = dynamic_params['device_id']
-    device = Device.objects.get(pk=device_id)
-    vulnerabilities = device.get_vulnerabilities()
+    vulnerabilities = Tag.annotate_matching_package(Device(pk=device_id).get_vulnerabilities(), 'tag')
     return vulnerabilities[from_idx:to_idx]
 
 
 def device_vulnerability_stat_producer(page_size, filter_query, dynamic_params=None,
                                                                  static_params=None):
     device_id = dynamic_params['device_id']
-    device = Device.objects.get(pk=device_id)
-    count = device.get_vulnerabilities().count()
+    count = Device(pk=device_id).get_vulnerabilities().count()
     return math.ceil(count / page_size)
 
 
@@ -132,6 +130,8 @@ device_vulnerability_list_paging = {
     'list_producer': device_vulnerability_list_producer,
     'stat_producer': device_vulnerability_stat_producer,
     'static_producer_args': None,
+    'select_related': ('tag', 'tag_stats__first_installed'),
+    'defer': ('tag__swid_xml',),
     'var_name': 'vulnerabilities',
     'url_name': None,
     'page_size': 10,
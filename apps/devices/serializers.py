@@ -26,3 +26,18 @@ class DeviceMiniSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSeria
     class Meta(object):
         model = models.Device
         fields = ('uri', 'value', 'description')
+
+
+class DeviceBulkSerializer(serializers.Serializer):
+    """
+    A device of a bulk request, see `apps.devices.bulk.upsert_devices`.
+    """
+    value = serializers.RegexField(r'^[a-fA-F0-9]+$', max_length=255)
+    description = serializers.RegexField(r'^[\S ]{0,50}$', required=False, allow_blank=True)
+    product = serializers.CharField(max_length=255)
+    trusted = serializers.BooleanField(required=False)
+    inactive = serializers.BooleanField(required=False)
+    groups = serializers.ListField(child=serializers.CharField(max_length=50), required=False)
+
+    def validate_value(self, value):
+        return value.lower()
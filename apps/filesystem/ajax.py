@@ -7,6 +7,7 @@ from django.http import HttpResponse
 from django.views.decorators.http import require_POST
 
 from apps.core.decorators import ajax_login_required
+from apps.core import search
 from .models import File, Directory
 
 
@@ -76,6 +77,6 @@ def directories_autocomplete(request):
 
     """
     search_term = request.POST.get('search_term')
-    dirs = Directory.objects.filter(path__icontains=search_term)
+    dirs = Directory.objects.filter(search.contains(Directory, 'path', search_term))
     results = {'results': [{'id': d.id, 'directory': d.path} for d in dirs]}
     return HttpResponse(json.dumps(results), content_type="application/x-json")
@@ -3,31 +3,36 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 
 from rest_framework import viewsets
 
+from apps.api.export import ExportMixin
+from apps.api.mixins import QueryShapingMixin
+from apps.api.pagination import LimitOffsetPagination
+
 from . import models, serializers
 
 
-class AlgorithmViewSet(viewsets.ReadOnlyModelViewSet):
+class AlgorithmViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Algorithm
     queryset = model.objects.all()
     serializer_class = serializers.AlgorithmSerializer
     filter_fields = ('name',)
+    pagination_class = LimitOffsetPagination
 
 
-class DirectoryViewSet(viewsets.ReadOnlyModelViewSet):
+class DirectoryViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Directory
     queryset = model.objects.all()
     serializer_class = serializers.DirectorySerializer
     filter_fields = ('path',)
 
 
-class FileViewSet(viewsets.ReadOnlyModelViewSet):
+class FileViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.File
     queryset = model.objects.all()
     serializer_class = serializers.FileSerializer
     filter_fields = ('name', 'directory__path')
 
 
-class FileHashViewSet(viewsets.ReadOnlyModelViewSet):
+class FileHashViewSet(ExportMixin, QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.FileHash
     queryset = model.objects.all()
     serializer_class = serializers.FileHashSerializer
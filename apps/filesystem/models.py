@@ -5,6 +5,8 @@ import os
 
 from django.db import models
 
+from apps.core import search
+
 
 class Directory(models.Model):
     """
@@ -62,15 +64,15 @@ class File(models.Model):
 
         # collecting the data from two tables
         if file_part and not path_part:
-            files = cls.objects.filter(name__icontains=file_part)
-            dirs = Directory.objects.filter(path__icontains=file_part)
+            files = cls.objects.filter(search.contains(cls, 'name', file_part))
+            dirs = Directory.objects.filter(search.contains(Directory, 'path', file_part))
 
         if path_part and not file_part:
-            dirs = Directory.objects.filter(path__icontains=path_part)
+            dirs = Directory.objects.filter(search.contains(Directory, 'path', path_part))
 
         if path_part and file_part:
-            files = cls.objects.filter(name__icontains=file_part)
-            dirs = Directory.objects.filter(path__icontains=search_term)
+            files = cls.objects.filter(search.contains(cls, 'name', file_part))
+            dirs = Directory.objects.filter(search.contains(Directory, 'path', search_term))
 
         resulting_files = []
 
@@ -4,6 +4,7 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 import math
 
 from .models import Directory, File
+from apps.core import search
 from apps.front.paging import ProducerFactory
 
 # PAGING PRODUCER
@@ -35,7 +36,7 @@ def file_simple_list_producer(from_idx, to_idx, filter_query, dynamic_params=Non
     directory_id = dynamic_params['directory_id']
     file_list = File.objects.filter(directory__id=int(directory_id))
     if filter_query:
-        file_list = file_list.filter(name__icontains=filter_query)
+        file_list = file_list.filter(search.contains(File, 'name', filter_query))
     return file_list[from_idx:to_idx]
 
 
@@ -46,7 +47,7 @@ def file_simple_stat_producer(page_size, filter_query, dynamic_params=None, stat
     file_list = File.objects.filter(directory__id=directory_id)
     count = file_list.filter(directory__id=directory_id).count()
     if filter_query:
-        count = file_list.filter(name__icontains=filter_query).count()
+        count = file_list.filter(search.contains(File, 'name', filter_query)).count()
     return math.ceil(count / page_size)
 
 
@@ -75,6 +76,7 @@ file_list_paging = {
     'list_producer': file_list_producer,
     'stat_producer': file_stat_producer,
     'static_producer_args': None,
+    'select_related': ('directory',),
     'var_name': 'object_list',
     'url_name': 'filesystem:file_detail',
     'page_size': 50,
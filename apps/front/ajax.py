@@ -14,6 +14,7 @@ from apps.swid.paging import regid_detail_paging, regid_list_paging, swid_list_p
 from apps.swid.paging import swid_inventory_list_paging, swid_log_list_paging
 from apps.swid.paging import swid_inventory_session_paging
 from apps.swid.paging import swid_files_list_paging, swid_devices_list_paging
+from apps.swid.paging import vulnerability_list_paging
 from apps.filesystem.paging import dir_list_paging, file_list_paging, dir_file_list_paging
 from apps.policies.paging import policy_list_paging, enforcement_list_paging
 from apps.packages.paging import package_list_paging
@@ -23,6 +24,33 @@ from apps.devices.paging import device_vulnerability_list_paging
 from apps.tpm.paging import tpm_devices_list_paging
 
 
+# Registered paging configs, the key is the config name used by the paged blocks
+paging_conf_dict = {
+    'regid_list_config': regid_list_paging,
+    'regid_detail_config': regid_detail_paging,
+    'swid_list_config': swid_list_paging,
+    'dir_list_config': dir_list_paging,
+    'file_list_config': file_list_paging,
+    'policy_list_config': policy_list_paging,
+    'enforcement_list_config': enforcement_list_paging,
+    'package_list_config': package_list_paging,
+    'device_list_config': device_list_paging,
+    'product_list_config': product_list_paging,
+    'device_session_list_config': device_session_list_paging,
+    'device_event_list_config': device_event_list_paging,
+    'device_vulnerability_list_config': device_vulnerability_list_paging,
+    'swid_inventory_list_config': swid_inventory_list_paging,
+    'swid_log_list_config': swid_log_list_paging,
+    'swid_inventory_session_list_config': swid_inventory_session_paging,
+    'dir_file_list_config': dir_file_list_paging,
+    'swid_files_list_config': swid_files_list_paging,
+    'product_devices_list_config': product_devices_list_paging,
+    'swid_devices_list_config': swid_devices_list_paging,
+    'vulnerability_list_config': vulnerability_list_paging,
+    'tpm_devices_list_config': tpm_devices_list_paging,
+}
+
+
 @require_POST
 @ajax_login_required
 def paging(request):
@@ -34,7 +62,9 @@ def paging(request):
             Name of the paging config to be used. This name is the key in of the config
             dictionary.
             The config holds values such as the list/stat-producer, template_name,
-            var_name, url_name, page_size and so on.
+            var_name, url_name, page_size and so on. It may also declare the
+            select_related, prefetch_related, only and defer hints applied to
+            the queryset returned by the list producer.
 
         current_page (int):
             Current page index, 0 based.
@@ -62,31 +92,6 @@ def paging(request):
     filter_query = request.POST.get('filter_query')
     pager_id = int(request.POST.get('pager_id'))
     producer_args = json.loads(request.POST.get('producer_args'))
-    # TODO: extract this to somewhere else
-    # register configs
-    paging_conf_dict = {
-        'regid_list_config': regid_list_paging,
-        'regid_detail_config': regid_detail_paging,
-        'swid_list_config': swid_list_paging,
-        'dir_list_config': dir_list_paging,
-        'file_list_config': file_list_paging,
-        'policy_list_config': policy_list_paging,
-        'enforcement_list_config': enforcement_list_paging,
-        'package_list_config': package_list_paging,
-        'device_list_config': device_list_paging,
-        'product_list_config': product_list_paging,
-        'device_session_list_config': device_session_list_paging,
-        'device_event_list_config': device_event_list_paging,
-        'device_vulnerability_list_config': device_vulnerability_list_paging,
-        'swid_inventory_list_config': swid_inventory_list_paging,
-        'swid_log_list_config': swid_log_list_paging,
-        'swid_inventory_session_list_config': swid_inventory_session_paging,
-        'dir_file_list_config': dir_file_list_paging,
-        'swid_files_list_config': swid_files_list_paging,
-        'product_devices_list_config': product_devices_list_paging,
-        'swid_devices_list_config': swid_devices_list_paging,
-        'tpm_devices_list_config': tpm_devices_list_paging,
-    }
 
     conf = paging_conf_dict[config_name]
     page_size = conf.get('page_size', 50)
@@ -105,6 +110,7 @@ def paging(request):
     if lp is None:
         raise ValueError('Invalid list producer')
     element_list = lp(from_idx, to_idx, filter_query, producer_args, conf.get('static_producer_args'))
+    element_list = paging_functions.shape_queryset(element_list, conf)
 
     var_name = conf.get('var_name', 'object_list')
     template_context = {
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+class FrontConfig(AppConfig):
+    name = 'apps.front'
+
+    def ready(self):
+        from apps.front import statistics
+        from apps.packages.models import Version
+
+        # Keep the counts of the statistics snapshot current
+        for model in statistics.TRACKED_COUNTS:
+            post_save.connect(statistics.object_saved, sender=model,
+                              dispatch_uid='statistics_saved_%s' % model.__name__)
+            post_delete.connect(statistics.object_deleted, sender=model,
+                                dispatch_uid='statistics_deleted_%s' % model.__name__)
+        post_save.connect(statistics.version_saved, sender=Version,
+                          dispatch_uid='statistics_version_saved')
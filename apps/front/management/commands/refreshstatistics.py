@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to recompute the snapshot of the statistics page.
+
+Usage: ./manage.py refreshstatistics [--requested]
+
+Run it periodically from a cron job, e.g. hourly, and additionally every
+minute with ``--requested`` to handle the refresh button of the statistics
+page.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from apps.front import statistics
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Recompute the statistics snapshot shown on the statistics page. Run it periodically, ' \
+           'e.g. from a cron job.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requested', action='store_true',
+                            help='Only refresh if requested on the statistics page')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['requested'] and not statistics.refresh_requested():
+            self.stdout.write('No refresh requested')
+            return
+        refreshed = statistics.refresh()
+        self.stdout.write('Statistics refreshed at %s' % refreshed)
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to maintain the hourly and daily session rollups.
+
+Usage: ./manage.py rollups update
+       ./manage.py rollups backfill [--days DAYS]
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.front import rollups
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    args = 'update|backfill'
+    help = 'Roll up the new sessions (update) or recompute the rollups of all sessions or the ' \
+           'last days (backfill).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*')
+        parser.add_argument('--days', type=int, help='Only recompute the rollups of the last days')
+
+    def handle(self, *args, **kwargs):
+        if len(args) != 1 or args[0] not in ('update', 'backfill'):
+            raise CommandError('Usage: ./manage.py rollups update|backfill [--days DAYS]')
+        days = kwargs['days']
+        if days is not None and days < 1:
+            raise CommandError('The number of days must be positive')
+
+        if args[0] == 'update':
+            count = rollups.update()
+        else:
+            count = rollups.backfill(days)
+        self.stdout.write('Recomputed %d hourly rollups' % count)
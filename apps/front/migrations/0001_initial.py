@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Statistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('count', models.BigIntegerField(default=0)),
+                ('data', models.TextField(blank=True, default='')),
+                ('refreshed', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'statistics',
+                'ordering': ('name',),
+            },
+        ),
+    ]
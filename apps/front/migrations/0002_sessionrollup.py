@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import apps.core.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0004_devicecounters'),
+        ('front', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(3600, 'hour'), (86400, 'day')])),
+                ('start', apps.core.fields.EpochField()),
+                ('recommendation', models.IntegerField(blank=True, choices=[(0, 'Allow'), (1, 'Block'), (2, 'Isolate'), (3, 'None')], null=True)),
+                ('session_count', models.PositiveIntegerField(default=0)),
+                ('result_count', models.PositiveIntegerField(default=0)),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='devices.group')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='devices.product')),
+            ],
+            options={
+                'db_table': 'session_rollups',
+                'ordering': ('resolution', 'start'),
+                'index_together': {('resolution', 'start')},
+            },
+        ),
+    ]
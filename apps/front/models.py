@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import json
+
+from django.db import models
+
+from apps.core.fields import EpochField
+from apps.core.types import ACTION_CHOICES
+from apps.devices.models import Group, Product
+
+
+class Statistic(models.Model):
+    """
+    A value of the statistics snapshot, either a count or a JSON encoded
+    list of grouped counts (e.g. devices per product).
+
+    The snapshot is computed by `apps.front.statistics.refresh`, some of the
+    counts are additionally kept current by signal handlers.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    count = models.BigIntegerField(default=0)
+    data = models.TextField(blank=True, default='')
+    refreshed = models.DateTimeField()
+
+    class Meta(object):
+        db_table = 'statistics'
+        ordering = ('name',)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def value(self):
+        return json.loads(self.data) if self.data else self.count
+
+
+class SessionRollup(models.Model):
+    """
+    Number of sessions and results with a recommendation within an hour or
+    a day (UTC), either per product (``group`` is None) or per group,
+    including the devices of its subgroups (``product`` is None).
+
+    The rollups are maintained by `apps.front.rollups`.
+    """
+    HOUR = 3600
+    DAY = 86400
+    RESOLUTION_CHOICES = (
+        (HOUR, 'hour'),
+        (DAY, 'day'),
+    )
+
+    resolution = models.PositiveIntegerField(choices=RESOLUTION_CHOICES)
+    start = EpochField()
+    product = models.ForeignKey(Product, null=True, blank=True, on_delete=models.CASCADE,
+                                related_name='+')
+    group = models.ForeignKey(Group, null=True, blank=True, on_delete=models.CASCADE,
+                              related_name='+')
+    recommendation = models.IntegerField(null=True, blank=True, choices=ACTION_CHOICES)
+    session_count = models.PositiveIntegerField(default=0)
+    result_count = models.PositiveIntegerField(default=0)
+
+    class Meta(object):
+        db_table = 'session_rollups'
+        index_together = [('resolution', 'start')]
+        ordering = ('resolution', 'start')
+
+    def __str__(self):
+        return '%s %s' % (self.get_resolution_display(), self.start)
@@ -3,6 +3,10 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 
 import math
 
+from django.db.models.query import QuerySet
+
+from apps.core import search
+
 
 # **************** #
 # PRODUCER FACTORY #
@@ -38,10 +42,7 @@ class ProducerFactory(object):
         Return a list producer function.
         """
         def _func(from_idx, to_idx, filter_query, *args):
-            qs = self.model.objects.all()
-            if filter_query:
-                kwargs = {self.filter_target: filter_query}
-                qs = qs.filter(**kwargs)
+            qs = self.filter(filter_query)
             return qs[from_idx:to_idx]
         return _func
 
@@ -50,17 +51,63 @@ class ProducerFactory(object):
         Return a list producer function.
         """
         def _func(page_size, filter_query, *args):
-            qs = self.model.objects.all()
-            if filter_query:
-                kwargs = {self.filter_target: filter_query}
-                qs = qs.filter(**kwargs)
+            qs = self.filter(filter_query)
             return math.ceil(qs.count() / page_size)
         return _func
 
+    def filter(self, filter_query):
+        """
+        Return the queryset filtered by the filter query. Substring filters
+        (``__icontains``) are looked up in the search index, if available.
+        """
+        qs = self.model.objects.all()
+        if filter_query:
+            if self.filter_target.endswith('__icontains'):
+                field_path = self.filter_target[:-len('__icontains')]
+                qs = qs.filter(search.contains(self.model, field_path, filter_query))
+            else:
+                kwargs = {self.filter_target: filter_query}
+                qs = qs.filter(**kwargs)
+        return qs
+
 
 # ************* #
 # PAGING HELPER #
 # ************* #
+def shape_queryset(element_list, conf):
+    """
+    Apply the query hints declared in a paging config to the element list
+    returned by its list producer.
+
+    A paging config may declare the relations and fields its template needs
+    via the ``select_related``, ``prefetch_related``, ``only`` and ``defer``
+    keys, so that rendering a page does not issue one query per row. Element
+    lists which are not querysets (e.g. lists or dicts built by a producer)
+    are returned unchanged.
+
+    Args:
+        element_list:
+            The object returned by the list producer.
+        conf (dict):
+            The paging config.
+
+    Returns:
+        The (possibly) shaped element list.
+
+    """
+    if not isinstance(element_list, QuerySet):
+        return element_list
+    if conf.get('select_related'):
+        element_list = element_list.select_related(*conf['select_related'])
+    if conf.get('prefetch_related'):
+        element_list = element_list.prefetch_related(*conf['prefetch_related'])
+    if conf.get('only'):
+        element_list = element_list.only(*conf['only'])
+    if conf.get('defer'):
+        element_list = element_list.defer(*conf['defer'])
+    return element_list
+
+
 def get_url_hash(pager_id, current_page, filter_query):
     page_param = 'page'
     filter_param = 'filter'
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Hourly and daily rollups of the sessions and results.
+
+Trend charts (e.g. sessions per hour or recommendations per day and product)
+would have to scan the whole sessions and results tables. Instead, the
+number of sessions and results per hour, product, group and recommendation
+is stored in the `SessionRollup` table, the daily rollups are summed up from
+the hourly ones. Sessions are counted for each group of their device
+including the ancestors of these groups.
+
+The sessions are written by the strongSwan daemon, so the rollups can't be
+fed by signals. `update` recomputes the hours since the last rolled up hour
+(re-processing the last `REPROCESS` period, as the recommendation of a
+session is only set once it is finished). It is called whenever the
+statistics snapshot is refreshed, e.g. by ``./manage.py refreshstatistics``
+from a cron job, or explicitly with ``./manage.py rollups update``. Existing
+sessions are rolled up with ``./manage.py rollups backfill``, which keeps the
+rollups of pruned sessions.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import calendar
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max, Min, Sum
+from django.utils import timezone
+
+import pytz
+
+from apps.core.models import Result, Session
+from apps.devices.models import Group, Product
+from apps.front.models import SessionRollup
+from apps.policies.models import Policy
+
+
+HOUR = SessionRollup.HOUR
+DAY = SessionRollup.DAY
+
+"""
+Period before the last rolled up hour that is recomputed by `update`
+"""
+REPROCESS = timedelta(days=1)
+
+"""
+Period recomputed per transaction by `backfill`
+"""
+CHUNK = timedelta(days=30)
+
+"""
+Maximum number of buckets returned by `get_series`
+"""
+MAX_BUCKETS = 2000
+
+"""
+Dimensions of the series returned by `get_series`
+"""
+DIMENSIONS = ('recommendation', 'product', 'group')
+
+"""
+Counts of the series returned by `get_series`, by kind
+"""
+KINDS = {
+    'sessions': 'session_count',
+    'results': 'result_count',
+}
+
+
+def to_epoch(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+
+def to_datetime(epoch):
+    return datetime.fromtimestamp(epoch, pytz.utc)
+
+
+def floor(epoch, resolution):
+    return epoch - epoch % resolution
+
+
+def _bucket(field, resolution):
+    return ExpressionWrapper(F(field) - F(field) % resolution, output_field=IntegerField())
+
+
+def compute_hours(start, end):
+    """
+    Compute the hourly rollups of the sessions within a period.
+
+    Args:
+        start (int):
+            Start of the period (epoch, a full hour).
+        end (int):
+            End of the period (epoch, excluded).
+
+    Returns:
+        A list of unsaved `SessionRollup` instances.
+
+    """
+    sessions = Session.objects.filter(time__gte=to_datetime(start), time__lt=to_datetime(end)) \
+                              .annotate(bucket=_bucket('time', HOUR))
+    results = Result.objects.filter(session__time__gte=to_datetime(start),
+                                    session__time__lt=to_datetime(end)) \
+                            .annotate(bucket=_bucket('session__time', HOUR))
+
+    counts = defaultdict(lambda: [0, 0])
+    for index, queryset, device in ((0, sessions, 'device__'), (1, results, 'session__device__')):
+        for dimension in ('product', 'groups__ancestor_links__ancestor'):
+            field = device + dimension
+            rows = queryset.filter(**{'%s__isnull' % field: False}) \
+                           .values_list('bucket', field, 'recommendation') \
+                           .annotate(num=Count('pk', distinct=True)).order_by()
+            for bucket, pk, recommendation, num in rows:
+                if dimension == 'product':
+                    key = (bucket, pk, None, recommendation)
+                else:
+                    key = (bucket, None, pk, recommendation)
+                counts[key][index] += num
+
+    return [SessionRollup(resolution=HOUR, start=to_datetime(bucket), product_id=product_id,
+                          group_id=group_id, recommendation=recommendation,
+                          session_count=session_count, result_count=result_count)
+            for (bucket, product_id, group_id, recommendation), (session_count, result_count)
+            in counts.items()]
+
+
+def compute_days(start, end):
+    """
+    Sum up the hourly rollups of the days within a period.
+
+    Args:
+        start (int):
+            Start of the period (epoch, midnight UTC).
+        end (int):
+            End of the period (epoch, excluded).
+
+    Returns:
+        A list of unsaved `SessionRollup` instances.
+
+    """
+    hours = SessionRollup.objects.filter(resolution=HOUR, start__gte=to_datetime(start),
+                                         start__lt=to_datetime(end))
+    rows = hours.annotate(day=_bucket('start', DAY)) \
+                .values_list('day', 'product', 'group', 'recommendation') \
+                .annotate(sessions=Sum('session_count'), results=Sum('result_count')).order_by()
+    return [SessionRollup(resolution=DAY, start=to_datetime(day), product_id=product_id,
+                          group_id=group_id, recommendation=recommendation,
+                          session_count=session_count, result_count=result_count)
+            for day, product_id, group_id, recommendation, session_count, result_count in rows]
+
+
+def rebuild_period(start, end):
+    """
+    Recompute the hourly and daily rollups of a period, in a single
+    transaction.
+
+    Args:
+        start (int):
+            Start of the period (epoch).
+        end (int):
+            End of the period (epoch).
+
+    Returns:
+        The number of hourly rollups of the period.
+
+    """
+    start = floor(start, HOUR)
+    end = floor(end - 1, HOUR) + HOUR
+    day_start = floor(start, DAY)
+    day_end = floor(end - 1, DAY) + DAY
+    hours = compute_hours(start, end)
+    with transaction.atomic():
+        SessionRollup.objects.filter(resolution=HOUR, start__gte=to_datetime(start),
+                                     start__lt=to_datetime(end)).delete()
+        SessionRollup.objects.bulk_create(hours, batch_size=500)
+        days = compute_days(day_start, day_end)
+        SessionRollup.objects.filter(resolution=DAY, start__gte=to_datetime(day_start),
+                                     start__lt=to_datetime(day_end)).delete()
+        SessionRollup.objects.bulk_create(days, batch_size=500)
+    return len(hours)
+
+
+def update(now=None):
+    """
+    Roll up the sessions since the last rolled up hour (minus `REPROCESS`),
+    or all sessions if there are no rollups yet.
+
+    Returns:
+        The number of recomputed hourly rollups.
+
+    """
+    now = now or timezone.now()
+    last = SessionRollup.objects.filter(resolution=HOUR).aggregate(last=Max('start'))['last']
+    if last is None:
+        return backfill(now=now)
+    return rebuild_period(to_epoch(last - REPROCESS), to_epoch(now) + 1)
+
+
+def backfill(days=None, now=None):
+    """
+    Recompute the rollups of the last days, in chunks of `CHUNK` that are
+    each replaced in a single transaction.
+
+    The rollups before the first existing session are kept, as the sessions
+    they were computed from may have been pruned (see
+    `apps.core.retention`).
+
+    Args:
+        days (int):
+            Number of days to recompute, None to recompute the rollups from
+            the first session.
+
+    Returns:
+        The number of recomputed hourly rollups.
+
+    """
+    now = now or timezone.now()
+    first = Session.objects.aggregate(first=Min('time'))['first']
+    if first is None:
+        return 0
+    if days is not None:
+        first = max(first, now - timedelta(days=days))
+
+    count = 0
+    start = to_epoch(first)
+    end = to_epoch(now) + 1
+    chunk = int(CHUNK.total_seconds())
+    while start < end:
+        count += rebuild_period(start, min(start + chunk, end))
+        start = floor(start, HOUR) + chunk
+    return count
+
+
+def _labels(dimension, keys):
+    if dimension == 'recommendation':
+        return dict((key, Policy.action[key] if key is not None else 'Pending') for key in keys)
+    model = Product if dimension == 'product' else Group
+    return dict(model.objects.filter(pk__in=keys).values_list('pk', 'name'))
+
+
+def get_series(resolution, start, end, by='recommendation', kind='sessions', product=None, group=None):
+    """
+    Return the rolled up counts of a period as series per recommendation,
+    product or group.
+
+    Args:
+        resolution (int):
+            `HOUR` or `DAY`.
+        start (int):
+            Start of the period (epoch).
+        end (int):
+            End of the period (epoch, excluded).
+        by (str):
+            The dimension of the series, one of `DIMENSIONS`.
+        kind (str):
+            Count ``sessions`` or ``results``.
+        product (int):
+            Only count the sessions of the devices of this product.
+        group (int):
+            Only count the sessions of the devices of this group (or its
+            subgroups).
+
+    Returns:
+        A dict with the start times of the buckets (``buckets``, epochs) and
+        a list of ``series``, each with a ``key``, a ``name`` and the count
+        per bucket (``data``).
+
+    Raises:
+        ValueError: If a parameter is invalid.
+
+    """
+    if resolution not in (HOUR, DAY):
+        raise ValueError('Invalid resolution')
+    if by not in DIMENSIONS:
+        raise ValueError('Invalid dimension')
+    if kind not in KINDS:
+        raise ValueError('Invalid kind')
+    if product is not None and (group is not None or by == 'group'):
+        raise ValueError('Products and groups can\'t be combined')
+    if group is not None and by == 'product':
+        # The rollups per group don't record the products
+        raise ValueError('Products and groups can\'t be combined')
+    start = floor(start, resolution)
+    buckets = list(range(start, end, resolution))
+    if len(buckets) > MAX_BUCKETS:
+        raise ValueError('Too many buckets, at most %d are allowed' % MAX_BUCKETS)
+
+    rollups = SessionRollup.objects.filter(resolution=resolution, start__gte=to_datetime(start),
+                                           start__lt=to_datetime(end))
+    if group is not None:
+        rollups = rollups.filter(group=group)
+    elif by == 'group':
+        rollups = rollups.filter(group__isnull=False)
+    else:
+        rollups = rollups.filter(group=None)
+    if product is not None:
+        rollups = rollups.filter(product=product)
+
+    data = defaultdict(lambda: [0] * len(buckets))
+    rows = rollups.values_list('start', by).annotate(num=Sum(KINDS[kind])).order_by()
+    for bucket_start, key, num in rows:
+        data[key][(to_epoch(bucket_start) - start) // resolution] += num
+
+    labels = _labels(by, data.keys())
+    series = [{'key': key, 'name': labels.get(key, str(key)), 'data': counts}
+              for key, counts in data.items()]
+    series.sort(key=lambda s: (-sum(s['data']), s['name']))
+    return {'resolution': resolution, 'buckets': buckets, 'series': series}
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Global search over the main object types.
+
+Every category returns at most one page of hits, ranked by whether the
+primary field starts with the search term (prefix match) or only contains
+it (substring match). The category queries are bounded by the page size and
+run one after the other in the request thread.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.db.models import Case, IntegerField, Value, When
+from django.utils.translation import gettext_lazy as _
+
+from apps.core import search as search_index
+from apps.devices.models import Device, Group, Product
+from apps.filesystem.models import File
+from apps.packages.models import Package
+from apps.policies.models import Enforcement, Policy
+
+
+"""
+Number of hits shown per category and page
+"""
+PAGE_SIZE = 10
+
+
+class SearchCategory(object):
+    """
+    A searchable object type.
+
+    Args:
+        name (str):
+            Identifier of the category, used in URLs.
+        title (str):
+            Title shown above the hits.
+        model:
+            The searched model class.
+        fields (tuple):
+            The searched fields, the first one is used for the ranking.
+        url_name (str):
+            Name of the detail view of a hit.
+        select_related (tuple):
+            Relations used by the string representation of a hit.
+
+    """
+    def __init__(self, name, title, model, fields, url_name, select_related=()):
+        self.name = name
+        self.title = title
+        self.model = model
+        self.fields = fields
+        self.url_name = url_name
+        self.select_related = select_related
+
+    def queryset(self, query):
+        """
+        Return the hits for the given search term, prefix matches first.
+        """
+        q = search_index.contains(self.model, self.fields[0], query)
+        for field in self.fields[1:]:
+            q |= search_index.contains(self.model, field, query)
+        prefix_match = When(**{'%s__istartswith' % self.fields[0]: query, 'then': Value(0)})
+        rank = Case(prefix_match, default=Value(1), output_field=IntegerField())
+        return self.model.objects.filter(q).select_related(*self.select_related) \
+                                 .annotate(search_rank=rank).order_by('search_rank', self.fields[0], 'pk')
+
+    def search(self, query, page=0):
+        """
+        Return a page of hits.
+
+        Returns:
+            A `SearchResult` instance.
+
+        """
+        offset = page * PAGE_SIZE
+        # Fetch one more hit to find out whether there is a next page
+        hits = list(self.queryset(query)[offset:offset + PAGE_SIZE + 1])
+        return SearchResult(self, hits[:PAGE_SIZE], page, len(hits) > PAGE_SIZE)
+
+
+class SearchResult(object):
+    """
+    A page of hits of a category.
+    """
+    def __init__(self, category, hits, page, has_more):
+        self.category = category
+        self.hits = hits
+        self.page = page
+        self.has_more = has_more
+
+    @property
+    def next_page(self):
+        return self.page + 1
+
+    @property
+    def previous_page(self):
+        return self.page - 1
+
+
+CATEGORIES = (
+    SearchCategory('groups', _('Groups'), Group, ('name',), 'devices:group_detail'),
+    SearchCategory('policies', _('Policies'), Policy, ('name',), 'policies:policy_detail'),
+    SearchCategory('enforcements', _('Enforcements'), Enforcement, ('policy__name', 'group__name'),
+                   'policies:enforcement_detail', select_related=('policy', 'group')),
+    SearchCategory('devices', _('Devices'), Device, ('description', 'value'), 'devices:device_detail'),
+    SearchCategory('packages', _('Packages'), Package, ('name',), 'packages:package_detail'),
+    SearchCategory('products', _('Products'), Product, ('name',), 'devices:product_detail'),
+    SearchCategory('files', _('Files'), File, ('name', 'directory__path'), 'filesystem:file_detail',
+                   select_related=('directory',)),
+)
+
+
+def search(query, category_name=None, page=0):
+    """
+    Search all categories (or a single one) for the given term.
+
+    Args:
+        query (str):
+            The search term.
+        category_name (str):
+            Only search the category with this name. None for all categories.
+        page (int):
+            The page of hits to return.
+
+    Returns:
+        A list of `SearchResult` instances with at least one hit, in the
+        order of `CATEGORIES`.
+
+    """
+    categories = [c for c in CATEGORIES if category_name in (None, c.name)]
+    results = [category.search(query, page) for category in categories]
+    return [result for result in results if result.hits]
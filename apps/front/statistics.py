@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot of the statistics shown on the statistics page.
+
+Counting the rows of the sessions, results, files and tags tables takes
+long on large databases, so the statistics page doesn't count them on every
+request but renders a snapshot stored in the `Statistic` table. The snapshot
+is computed by `refresh` with ``./manage.py refreshstatistics``, run from a
+cron job, never by the web server. The refresh button of the statistics page
+only records a request (`request_refresh`), which is handled by the next
+``./manage.py refreshstatistics --requested`` (e.g. run every minute).
+
+The counts of the tables written by strongTNC itself (policies, groups,
+tags, versions etc.) are additionally kept current between refreshes by the
+signal handlers below (connected in `FrontConfig.ready`), which increment or
+decrement the stored counts with a single ``UPDATE``. The tables written by
+the strongSwan daemon (sessions, results, devices etc.) are only counted by
+`refresh`. Bulk operations don't send signals, the affected counts are
+corrected by the next refresh.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import json
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from apps.core.models import Session, Result, Identity
+from apps.front import rollups
+from apps.front.models import Statistic
+from apps.policies.models import Policy, Enforcement
+from apps.devices.models import Device, Group, Product
+from apps.packages.models import Package, Version
+from apps.filesystem.models import Directory, File, FileHash
+from apps.swid.models import Tag, Entity, Event
+
+
+"""
+Name of the `Statistic` recording a requested refresh (with the time of the
+request), it's not part of the snapshot
+"""
+REQUEST = 'refresh_requested'
+
+"""
+Counted querysets by statistic name
+"""
+COUNTS = OrderedDict([
+    ('sessions', lambda: Session.objects.all()),
+    ('results', lambda: Result.objects.all()),
+    ('policies', lambda: Policy.objects.all()),
+    ('enforcements', lambda: Enforcement.objects.all()),
+    ('identities', lambda: Identity.objects.all()),
+    ('devices', lambda: Device.objects.all()),
+    ('products', lambda: Product.objects.all()),
+    ('groups', lambda: Group.objects.all()),
+    ('entities', lambda: Entity.objects.all()),
+    ('tags', lambda: Tag.objects.all()),
+    ('events', lambda: Event.objects.all()),
+    ('directories', lambda: Directory.objects.all()),
+    ('files', lambda: File.objects.all()),
+    ('hashes', lambda: FileHash.objects.all()),
+    ('packages', lambda: Package.objects.all()),
+    ('versions', lambda: Version.objects.all()),
+    ('secure', lambda: Version.objects.filter(security=False)),
+    ('vulnerable', lambda: Version.objects.filter(security=True)),
+])
+
+"""
+Counts kept current by the signal handlers, by model
+"""
+TRACKED_COUNTS = OrderedDict([
+    (Policy, 'policies'),
+    (Enforcement, 'enforcements'),
+    (Group, 'groups'),
+    (Entity, 'entities'),
+    (Tag, 'tags'),
+    (Package, 'packages'),
+    (Version, 'versions'),
+])
+
+
+def _recommendations(queryset):
+    counts = queryset.values('recommendation').annotate(num=Count('pk')).order_by('-num', 'recommendation')
+    return [{'recommendation': Policy.action[item['recommendation']], 'num': item['num']}
+            for item in counts]
+
+
+def _os_ranking():
+    products = Product.objects.annotate(num=Count('devices__id')).filter(num__gt=0).order_by('-num', 'name')
+    return [{'name': name, 'num': num} for name, num in products.values_list('name', 'num')]
+
+
+"""
+Grouped counts by statistic name
+"""
+GROUPED = OrderedDict([
+    ('OSranking', _os_ranking),
+    ('rec_count_session', lambda: _recommendations(Session.objects.all())),
+    ('rec_count_result', lambda: _recommendations(Result.objects.all())),
+])
+
+
+def refresh():
+    """
+    Recompute the whole snapshot and roll up the new sessions (see
+    `apps.front.rollups`).
+
+    Returns:
+        The time of the snapshot.
+
+    """
+    now = timezone.now()
+    rollups.update(now)
+    values = [(name, queryset().count(), '') for name, queryset in COUNTS.items()]
+    values.extend((name, 0, json.dumps(producer())) for name, producer in GROUPED.items())
+    with transaction.atomic():
+        existing = Statistic.objects.in_bulk(field_name='name')
+        new = []
+        for name, count, data in values:
+            statistic = existing.pop(name, None) or Statistic(name=name)
+            statistic.count = count
+            statistic.data = data
+            statistic.refreshed = now
+            if statistic.pk is None:
+                new.append(statistic)
+            else:
+                statistic.save()
+        Statistic.objects.bulk_create(new)
+        existing.pop(REQUEST, None)
+        Statistic.objects.filter(name__in=existing).delete()
+        # Requests made during the refresh are handled by the next one
+        Statistic.objects.filter(name=REQUEST, refreshed__lte=now).delete()
+    return now
+
+
+def request_refresh():
+    """
+    Record that a refresh of the snapshot was requested.
+
+    Returns:
+        False if a refresh was already requested.
+
+    """
+    _, created = Statistic.objects.get_or_create(name=REQUEST, defaults={'refreshed': timezone.now()})
+    return created
+
+
+def refresh_requested():
+    return Statistic.objects.filter(name=REQUEST).exists()
+
+
+def get_snapshot():
+    """
+    Return the values of the snapshot.
+
+    Returns:
+        A dict mapping the statistic names to their values, with the time of
+        the oldest value as ``refreshed``. None if there is no snapshot.
+
+    """
+    statistics = list(Statistic.objects.exclude(name=REQUEST))
+    if not statistics:
+        return None
+    snapshot = dict((statistic.name, statistic.value) for statistic in statistics)
+    snapshot['refreshed'] = min(statistic.refreshed for statistic in statistics)
+    return snapshot
+
+
+def increment(name, delta=1):
+    """
+    Add to a count of the snapshot (if it exists).
+    """
+    Statistic.objects.filter(name=name).update(count=F('count') + delta)
+
+
+# Signal handlers
+
+def object_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Count a created object.
+    """
+    if created and not raw:
+        increment(TRACKED_COUNTS[sender])
+        if sender is Version:
+            increment('vulnerable' if instance.security else 'secure')
+
+
+def object_deleted(sender, instance, **kwargs):
+    """
+    Uncount a deleted object.
+    """
+    increment(TRACKED_COUNTS[sender], -1)
+    if sender is Version:
+        increment('vulnerable' if instance.security else 'secure', -1)
+
+
+def version_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Move a version whose security flag changed between the secure and
+    vulnerable counts (see `Version.security_changed`).
+    """
+    if not raw and getattr(instance, 'security_changed', False):
+        increment('vulnerable' if instance.security else 'secure')
+        increment('secure' if instance.security else 'vulnerable', -1)
@@ -4,6 +4,8 @@ from . import views, ajax
 urlpatterns = [
     re_path(r'^$', views.overview, name='home'),
     re_path(r'^statistics/?$', views.statistics, name='statistics'),
+    re_path(r'^statistics/trends/?$', views.trends, name='statistics_trends'),
+    re_path(r'^statistics/refresh/?$', views.refresh_statistics, name='statistics_refresh'),
     re_path(r'^vulnerabilities/?$', views.vulnerabilities, name='vulnerabilities'),
     re_path(r'^search/?$', views.search, name='search'),
     re_path(r'^paging/?$', ajax.paging, name='paging'),
@@ -1,20 +1,84 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
-from . import models, serializers
+from apps.api.mixins import QueryShapingMixin
+from apps.api.utils import make_message
+from apps.devices.models import Product
 
+from . import flags, models, serializers, versions
 
-class PackageViewSet(viewsets.ReadOnlyModelViewSet):
+
+"""
+Maximum number of version selectors per request
+"""
+MAX_SELECTORS = 10000
+
+
+class PackageViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Package
     queryset = model.objects.all()
     serializer_class = serializers.PackageSerializer
     filter_fields = ('name',)
 
 
-class VersionViewSet(viewsets.ReadOnlyModelViewSet):
+class VersionViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Version
     queryset = model.objects.all()
     serializer_class = serializers.VersionSerializer
     filter_fields = ('package', 'product', 'release', 'security', 'blacklist', 'time',)
+
+    def get_queryset(self):
+        """
+        Additionally filter the versions older than the release given with
+        `older_than`, compared like dpkg or rpm do (depending on the
+        `product`, dpkg by default).
+
+        The missing sort keys of the filtered package and product (e.g. of
+        versions inserted by strongSwan) are computed first. Versions with
+        releases too long for a sort key are excluded.
+        """
+        queryset = super(VersionViewSet, self).get_queryset()
+        older_than = self.request.query_params.get('older_than')
+        if older_than:
+            product_id = self.request.query_params.get('product', '')
+            package_id = self.request.query_params.get('package', '')
+            product = Product.objects.filter(pk=product_id).first() if product_id.isdigit() else None
+            missing = queryset.filter(sort_key=None)
+            if product:
+                missing = missing.filter(product=product)
+            if package_id.isdigit():
+                missing = missing.filter(package_id=package_id)
+            self.model.update_sort_keys(missing)
+            scheme = versions.scheme_for(product.name) if product else versions.DPKG
+            key = versions.sort_key(older_than, scheme)
+            queryset = queryset.filter(sort_key__lt=key) if key is not None else queryset.none()
+        return queryset
+
+    @action(detail=False, methods=['post'])
+    def flags(self, request, format=None):
+        """
+        Set the security and/or blacklist flags of all versions matching
+        any of the given selectors. Package, product and release are names
+        or patterns with `*` wildcards, missing product or release match
+        any. With `dryRun` the matching versions are only counted.
+
+            {"data": [{"package": "openssl", "product": "Debian 10", "release": "1.1.1d-0*"}],
+             "security": true}
+
+        """
+        serializer = serializers.VersionFlagsSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'detail': 'Invalid request', 'errors': serializer.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        if len(data['data']) > MAX_SELECTORS:
+            msg = 'Too many selectors, at most %d are allowed per request' % MAX_SELECTORS
+            return make_message(msg, status.HTTP_400_BAD_REQUEST)
+
+        result = flags.set_flags(data['data'], security=data['security'], blacklist=data['blacklist'],
+                                 dry_run=data['dry_run'])
+        return Response(result, status=status.HTTP_200_OK)
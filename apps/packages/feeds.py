@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+Import of distribution package indices and security advisory feeds.
+
+Packages and versions are otherwise only created from SWID tags or in the
+web interface. `Importer` reads downloaded (optionally compressed) files
+and stores their contents in batches, each in its own transaction:
+
+* Debian ``Packages`` and ``Sources`` indices: the packages and versions of
+  a product are created (existing ones are kept).
+* The JSON of the Debian security tracker, or advisories with one JSON
+  object ``{"package": ..., "fixed_version": ...}`` per line: the versions
+  of the product older than the latest fixed version of their package are
+  flagged as security updates (i.e. vulnerable), the others unflagged.
+  Unfixed issues are ignored.
+
+The files are read incrementally, so their size doesn't matter. Used by
+``./manage.py importpackages``, which works offline on downloaded files.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import bz2
+import gzip
+import io
+import json
+import lzma
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.front import statistics
+from apps.packages import flags
+from apps.packages.models import Package, Version
+from apps.packages.versions import compare_dpkg, scheme_for, sort_key
+from apps.swid.utils import chunked_filter_in
+
+
+"""
+Number of index entries or packages stored per transaction
+"""
+BATCH_SIZE = 5000
+
+"""
+Maximum number of values per ``IN`` query (sqlite allows 999 parameters)
+"""
+BLOCK_SIZE = 980
+
+"""
+Size of the chunks read from JSON files
+"""
+READ_SIZE = 64 * 1024
+
+OPENERS = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+def open_feed(filename):
+    """
+    Open a (possibly gzip, bzip2 or xz compressed) text file.
+    """
+    for extension, opener in OPENERS.items():
+        if filename.endswith(extension):
+            return opener(filename, 'rt', encoding='utf-8', errors='replace')
+    return io.open(filename, 'rt', encoding='utf-8', errors='replace')
+
+
+def index_entries(lines):
+    """
+    Read the packages of a Debian ``Packages`` or ``Sources`` index.
+
+    Yields:
+        (package, version) tuples.
+
+    """
+    package = version = None
+    for line in lines:
+        if not line.strip():
+            if package and version:
+                yield package, version
+            package = version = None
+        elif line.startswith('Package:'):
+            package = line[len('Package:'):].strip()
+        elif line.startswith('Version:'):
+            version = line[len('Version:'):].strip()
+    if package and version:
+        yield package, version
+
+
+class JSONObjectReader(object):
+    """
+    Read the members of a (large) JSON object from a file, one at a time.
+    Only the current member is kept in memory.
+    """
+    WHITESPACE = ' \t\r\n'
+
+    def __init__(self, f):
+        self.f = f
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(READ_SIZE)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def _skip(self, chars):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in chars:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return
+            self._fill()
+
+    def _peek(self):
+        return self.buf[self.pos:self.pos + 1]
+
+    def _decode(self):
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A value ending at the end of the buffer might be truncated
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def __iter__(self):
+        """
+        Yields:
+            (key, value) tuples.
+
+        Raises:
+            ValueError: If the file doesn't contain a JSON object.
+
+        """
+        self._skip(self.WHITESPACE)
+        if self._peek() != '{':
+            raise ValueError('Not a JSON object')
+        self.pos += 1
+        while True:
+            self._skip(self.WHITESPACE + ',')
+            if self._peek() in ('}', ''):
+                return
+            key = self._decode()
+            self._skip(self.WHITESPACE + ':')
+            yield key, self._decode()
+
+
+def tracker_fixes(f, release):
+    """
+    Read the fixed versions of a release from the JSON of the Debian security
+    tracker (``{package: {issue: {"releases": {release: {...}}}}}``).
+
+    Yields:
+        (package, fixed version) tuples.
+
+    """
+    for package, issues in JSONObjectReader(f):
+        for issue in issues.values():
+            fix = issue.get('releases', {}).get(release)
+            if fix and fix.get('status') == 'resolved' and fix.get('fixed_version') not in (None, '0'):
+                yield package, fix['fixed_version']
+
+
+def advisory_fixes(lines):
+    """
+    Read advisories with one JSON object per line.
+
+    Yields:
+        (package, fixed version) tuples.
+
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            advisory = json.loads(line)
+            package, fixed = advisory['package'], advisory['fixed_version']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError('Invalid advisory on line %d' % number)
+        yield package, fixed
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Importer(object):
+    """
+    Import packages, versions and security fixes for a product.
+
+    Args:
+        product (apps.devices.models.Product):
+            The product of the versions.
+        batch_size (int):
+            Number of entries stored per transaction.
+        progress (callable):
+            Called with a message after every batch.
+
+    """
+    def __init__(self, product, batch_size=BATCH_SIZE, progress=None):
+        self.product = product
+        self.scheme = scheme_for(product.name)
+        self.batch_size = batch_size
+        self.progress = progress or (lambda message: None)
+        self.counts = {'entries': 0, 'packages': 0, 'versions': 0, 'fixes': 0, 'flagged': 0, 'unflagged': 0}
+
+    def _packages(self, names):
+        """
+        Return a dict mapping package names to ids, creating missing packages.
+        """
+        def lookup(names):
+            rows = chunked_filter_in(Package.objects.order_by('-pk').values_list('name', 'pk'), 'name',
+                                     names, BLOCK_SIZE)
+            return dict(rows)
+
+        names = sorted(set(names))
+        packages = lookup(names)
+        missing = [name for name in names if name not in packages]
+        if missing:
+            Package.objects.bulk_create([Package(name=name) for name in missing], batch_size=500)
+            packages.update(lookup(missing))
+            self.counts['packages'] += len(missing)
+            statistics.increment('packages', len(missing))
+        return packages
+
+    def import_versions(self, entries):
+        """
+        Create the packages and versions of index entries.
+
+        Args:
+            entries:
+                Iterable of (package, version) tuples.
+
+        """
+        for batch in batches(entries, self.batch_size):
+            with transaction.atomic():
+                packages = self._packages(name for name, _ in batch)
+                wanted = set((packages[name], release) for name, release in batch)
+                existing = set(chunked_filter_in(
+                    Version.objects.filter(product=self.product).values_list('package', 'release'),
+                    'package', sorted(set(pk for pk, _ in wanted)), BLOCK_SIZE))
+                now = timezone.now()
+                new = [Version(package_id=package_id, product=self.product, release=release, time=now,
+                               sort_key=sort_key(release, self.scheme))
+                       for package_id, release in sorted(wanted - existing)]
+                Version.objects.bulk_create(new, batch_size=500)
+                statistics.increment('versions', len(new))
+                statistics.increment('secure', len(new))
+            self.counts['entries'] += len(batch)
+            self.counts['versions'] += len(new)
+            self.progress('%(entries)d entries read, %(packages)d packages and %(versions)d versions created'
+                          % self.counts)
+
+    def import_fixes(self, fixes):
+        """
+        Flag the versions older than the latest fixed version of their package
+        as security updates and unflag the others.
+
+        Args:
+            fixes:
+                Iterable of (package, fixed version) tuples.
+
+        """
+        latest = {}
+        for package, fixed in fixes:
+            if package not in latest or compare_dpkg(fixed, latest[package]) > 0:
+                latest[package] = fixed
+            self.counts['fixes'] += 1
+
+        for batch in batches(sorted(latest), self.batch_size):
+            versions = chunked_filter_in(
+                Version.objects.filter(product=self.product)
+                               .values_list('pk', 'package__name', 'release', 'security'),
+                'package__name', batch, BLOCK_SIZE)
+            changed = {True: [], False: []}
+            for pk, package, release, security in versions:
+                vulnerable = compare_dpkg(release, latest[package]) < 0
+                if vulnerable != security:
+                    changed[vulnerable].append(pk)
+            with transaction.atomic():
+                for security, ids in changed.items():
+                    flags.update_security(ids, security)
+            self.counts['flagged'] += len(changed[True])
+            self.counts['unflagged'] += len(changed[False])
+            self.progress('%(fixes)d fixes read, %(flagged)d versions flagged and %(unflagged)d unflagged'
+                          % self.counts)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk update of the security and blacklist flags of versions.
+
+After an advisory, the versions of a package are flagged for many products
+at once. `set_flags` selects the versions by package, product and release
+(exact names or ``*`` patterns), updates the flags with a few ``UPDATE``
+queries and then brings the data derived from the security flags up to date:
+the `DeviceVulnerability` index (only for the tags of the changed versions,
+see `apps.swid.vulnerabilities.refresh`) and the secure/vulnerable counts of
+the statistics snapshot. ``QuerySet.update`` doesn't send the signals that
+maintain them after saving a single version.
+
+Used by the ``/api/versions/flags/`` endpoint and ``./manage.py
+setversionflags``.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from apps.front import statistics
+from apps.packages.models import Version
+from apps.swid import vulnerabilities
+
+
+"""
+Maximum number of values per ``IN`` query (sqlite allows 999 parameters)
+"""
+BLOCK_SIZE = 300
+
+"""
+Selector fields and the version fields they match
+"""
+SELECTOR_FIELDS = (
+    ('package', 'package__name'),
+    ('product', 'product__name'),
+    ('release', 'release'),
+)
+
+
+def is_pattern(value):
+    return '*' in value
+
+
+def pattern_lookup(field, pattern):
+    """
+    Return a filter matching a field against a pattern, in which ``*``
+    matches any characters.
+    """
+    if not is_pattern(pattern):
+        return Q(**{field: pattern})
+    regex = '^%s$' % '.*'.join(re.escape(part) for part in pattern.split('*'))
+    return Q(**{'%s__regex' % field: regex})
+
+
+def _selector_key(selector):
+    return tuple(selector.get(name) for name, _ in SELECTOR_FIELDS)
+
+
+def match_versions(selectors):
+    """
+    Find the versions matching any of the selectors.
+
+    Args:
+        selectors (list):
+            Dicts with a ``package``, a ``product`` and a ``release``, each
+            either an exact name or a pattern. Missing fields match any.
+
+    Returns:
+        A dict mapping the ids of the matching versions to (security,
+        blacklist) tuples.
+
+    """
+    fields = ('pk', 'package__name', 'product__name', 'release', 'security', 'blacklist')
+    # Selectors without patterns, grouped by the fields they specify
+    exact = defaultdict(set)
+    patterns = []
+    for selector in selectors:
+        key = _selector_key(selector)
+        if any(v is not None and is_pattern(v) for v in key):
+            patterns.append(selector)
+        else:
+            present = tuple(i for i, v in enumerate(key) if v is not None)
+            exact[present].add(tuple(key[i] for i in present))
+
+    matched = {}
+    # Exact selectors are looked up in chunks, matching each field against
+    # the names of the chunk and then checking the combinations
+    for present, keys in exact.items():
+        ordered = sorted(keys)
+        for i in range(0, len(ordered), BLOCK_SIZE):
+            chunk = ordered[i:i + BLOCK_SIZE]
+            lookups = dict(('%s__in' % SELECTOR_FIELDS[index][1], set(k[n] for k in chunk))
+                           for n, index in enumerate(present))
+            for row in Version.objects.filter(**lookups).values_list(*fields):
+                if tuple(row[1 + index] for index in present) in keys:
+                    matched[row[0]] = row[4:]
+
+    for selector in patterns:
+        query = Q()
+        for name, field in SELECTOR_FIELDS:
+            if selector.get(name) is not None:
+                query &= pattern_lookup(field, selector[name])
+        for pk, _, _, _, security, blacklist in Version.objects.filter(query).values_list(*fields):
+            matched[pk] = (security, blacklist)
+    return matched
+
+
+def set_flags(selectors, security=None, blacklist=None, dry_run=False):
+    """
+    Set the flags of the versions matching any of the selectors.
+
+    Args:
+        selectors (list):
+            See `match_versions`.
+        security (bool):
+            The new security flag, None to keep it.
+        blacklist (bool):
+            The new blacklist flag, None to keep it.
+        dry_run (bool):
+            Only count the versions that would be changed.
+
+    Returns:
+        A dict with the number of ``matched`` versions and the number of
+        versions whose ``security`` and ``blacklist`` flags changed.
+
+    """
+    matched = match_versions(selectors)
+    security_ids = [pk for pk, (old, _) in matched.items() if security is not None and old != security]
+    blacklist_ids = [pk for pk, (_, old) in matched.items() if blacklist is not None and old != blacklist]
+    result = {'matched': len(matched), 'security': len(security_ids), 'blacklist': len(blacklist_ids)}
+    if dry_run:
+        return result
+
+    with transaction.atomic():
+        for i in range(0, len(blacklist_ids), BLOCK_SIZE):
+            Version.objects.filter(pk__in=blacklist_ids[i:i + BLOCK_SIZE]).update(blacklist=blacklist)
+        update_security(security_ids, security)
+    return result
+
+
+def update_security(version_ids, security):
+    """
+    Set the security flag of versions and update the vulnerability index and
+    the statistics. Must be called in a transaction.
+
+    Args:
+        version_ids (list):
+            Ids of versions whose flag differs from `security`.
+        security (bool):
+            The new security flag.
+
+    """
+    for i in range(0, len(version_ids), BLOCK_SIZE):
+        chunk = version_ids[i:i + BLOCK_SIZE]
+        Version.objects.filter(pk__in=chunk).update(security=security)
+        vulnerabilities.refresh(version_ids=chunk)
+    if version_ids:
+        statistics.increment('vulnerable' if security else 'secure', len(version_ids))
+        statistics.increment('secure' if security else 'vulnerable', -len(version_ids))
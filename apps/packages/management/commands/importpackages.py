@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to import packages, versions and security fixes of
+a product from downloaded distribution files.
+
+Usage: ./manage.py importpackages --product PRODUCT [--index FILE]...
+           [--tracker FILE --release RELEASE] [--advisories FILE] [--batch-size N]
+
+Index files are Debian ``Packages`` or ``Sources`` files, tracker files the
+JSON of the Debian security tracker and advisory files contain one JSON
+object ``{"package": ..., "fixed_version": ...}`` per line. All files may be
+gzip, bzip2 or xz compressed. The indices are imported before the fixes.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.devices.models import Product
+from apps.packages import feeds
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Import the packages and versions of a product from Debian package indices and flag ' \
+           'vulnerable versions from security tracker or advisory files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', required=True, help='Name of the product (created if missing)')
+        parser.add_argument('--index', action='append', default=[],
+                            help='Debian Packages or Sources file (repeatable)')
+        parser.add_argument('--tracker', action='append', default=[],
+                            help='Debian security tracker JSON file (repeatable)')
+        parser.add_argument('--release', help='Release of the product in the tracker files, e.g. buster')
+        parser.add_argument('--advisories', action='append', default=[],
+                            help='File with one advisory per line (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=feeds.BATCH_SIZE,
+                            help='Number of entries stored per transaction')
+
+    def handle(self, *args, **kwargs):
+        self.verbosity = kwargs['verbosity']
+        if not (kwargs['index'] or kwargs['tracker'] or kwargs['advisories']):
+            raise CommandError('No files given, use --index, --tracker or --advisories')
+        if kwargs['tracker'] and not kwargs['release']:
+            raise CommandError('The tracker files require --release')
+        if kwargs['batch_size'] < 1:
+            raise CommandError('The batch size must be positive')
+
+        product = Product.objects.filter(name=kwargs['product']).order_by('pk').first()
+        if product is None:
+            product = Product.objects.create(name=kwargs['product'])
+        importer = feeds.Importer(product, kwargs['batch_size'], progress=self.report)
+
+        try:
+            for filename in kwargs['index']:
+                self.report('Importing %s' % filename)
+                with feeds.open_feed(filename) as f:
+                    importer.import_versions(feeds.index_entries(f))
+            if kwargs['tracker'] or kwargs['advisories']:
+                importer.import_fixes(self.fixes(kwargs['tracker'], kwargs['release'], kwargs['advisories']))
+        except (IOError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('Created %(packages)d packages and %(versions)d versions, flagged %(flagged)d '
+                          'and unflagged %(unflagged)d versions' % importer.counts)
+
+    def fixes(self, trackers, release, advisories):
+        for filename in trackers:
+            self.report('Reading %s' % filename)
+            with feeds.open_feed(filename) as f:
+                for fix in feeds.tracker_fixes(f, release):
+                    yield fix
+        for filename in advisories:
+            self.report('Reading %s' % filename)
+            with feeds.open_feed(filename) as f:
+                for fix in feeds.advisory_fixes(f):
+                    yield fix
+
+    def report(self, message):
+        if self.verbosity > 0:
+            self.stdout.write(message)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to set the security or blacklist flags of many
+versions at once.
+
+Usage: ./manage.py setversionflags --security|--no-security|--blacklist|--no-blacklist
+           [--package PACKAGE] [--product PRODUCT] [--release RELEASE] [--file FILE] [--dry-run]
+
+The versions are selected by package, product and release names or patterns
+with ``*`` wildcards, either from the options or from a CSV file with one
+``package,product,release`` selector per line (empty fields match any).
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import csv
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.packages import flags
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Set the security or blacklist flags of the versions matching package, product and ' \
+           'release names or patterns, and update the vulnerability index.'
+
+    def add_arguments(self, parser):
+        security = parser.add_mutually_exclusive_group()
+        security.add_argument('--security', dest='security', action='store_true', default=None,
+                              help='Flag the versions as security updates')
+        security.add_argument('--no-security', dest='security', action='store_false',
+                              help='Unflag the versions as security updates')
+        blacklist = parser.add_mutually_exclusive_group()
+        blacklist.add_argument('--blacklist', dest='blacklist', action='store_true', default=None,
+                               help='Blacklist the versions')
+        blacklist.add_argument('--no-blacklist', dest='blacklist', action='store_false',
+                               help='Remove the versions from the blacklist')
+        parser.add_argument('--package', help='Package name or pattern')
+        parser.add_argument('--product', help='Product name or pattern')
+        parser.add_argument('--release', help='Release or pattern')
+        parser.add_argument('--file', help='CSV file with package,product,release selectors')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the matching versions')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['security'] is None and kwargs['blacklist'] is None:
+            raise CommandError('Set the security or the blacklist flag')
+
+        selectors = []
+        if kwargs['package']:
+            selectors.append(dict((name, kwargs[name]) for name in ('package', 'product', 'release')
+                                  if kwargs[name]))
+        if kwargs['file']:
+            selectors.extend(self.read_selectors(kwargs['file']))
+        if not selectors:
+            raise CommandError('Select the versions with --package or --file')
+
+        result = flags.set_flags(selectors, security=kwargs['security'], blacklist=kwargs['blacklist'],
+                                 dry_run=kwargs['dry_run'])
+        verb = 'Would change' if kwargs['dry_run'] else 'Changed'
+        self.stdout.write('Matched %d versions. %s the security flag of %d and the blacklist flag of %d '
+                          'versions' % (result['matched'], verb, result['security'], result['blacklist']))
+
+    def read_selectors(self, filename):
+        selectors = []
+        try:
+            with io.open(filename, newline='', encoding='utf-8') as f:
+                for line, row in enumerate(csv.reader(f), 1):
+                    if not row or row[0].startswith('#'):
+                        continue
+                    if len(row) > 3 or not row[0].strip():
+                        raise CommandError('Invalid selector on line %d of %s' % (line, filename))
+                    values = [value.strip() for value in row] + [''] * (3 - len(row))
+                    selectors.append(dict((name, value) for name, value
+                                          in zip(('package', 'product', 'release'), values) if value))
+        except IOError as e:
+            raise CommandError('Can\'t read %s: %s' % (filename, e))
+        return selectors
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to compute the sort keys of the versions.
+
+Usage: ./manage.py updateversionkeys [--all] [--batch-size N]
+
+Versions saved by strongTNC get their sort key on save, versions inserted by
+strongSwan or before the sort keys were introduced have none. Run this
+command after upgrading and periodically (e.g. from a cron job). Missing keys
+are also computed when the versions are filtered with ``older_than`` by the
+API.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.packages.models import Version
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Compute the missing sort keys of the versions (or all with --all).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute all sort keys')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Number of versions updated per transaction')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        if batch_size < 1:
+            raise CommandError('The batch size must be positive')
+
+        queryset = Version.objects.all()
+        if not kwargs['all']:
+            queryset = queryset.filter(sort_key=None)
+        count = Version.update_sort_keys(queryset, batch_size)
+        self.stdout.write('Updated the sort keys of %d versions' % count)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('packages', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='version',
+            name='sort_key',
+            field=models.CharField(blank=True, editable=False, help_text='Release encoded to sort like dpkg or rpm versions (computed on save)', max_length=255, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='version',
+            index_together={('package', 'product', 'sort_key')},
+        ),
+    ]
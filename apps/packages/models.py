@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from apps.core.fields import EpochField
+from apps.packages import versions
 
 
 class Package(models.Model):
@@ -30,6 +31,10 @@ class Package(models.Model):
 class Version(models.Model):
     """
     Version number string of a package.
+
+    While saving, `security_changed` tells whether the security flag of an
+    existing version changes (e.g. for the ``pre_save`` and ``post_save``
+    handlers of the data derived from it).
     """
     package = models.ForeignKey(Package, db_column='package',
                         on_delete=models.CASCADE, related_name='versions')
@@ -39,15 +44,87 @@ class Version(models.Model):
     security = models.BooleanField(default=False)
     blacklist = models.BooleanField(default=False)
     time = EpochField(default=timezone.now())
+    sort_key = models.CharField(max_length=versions.MAX_KEY_LENGTH, null=True, blank=True, editable=False,
+                                help_text='Release encoded to sort like dpkg or rpm versions '
+                                          '(computed on save)')
 
     class Meta(object):
         db_table = 'versions'
-        index_together = [('package', 'product')]
+        index_together = [('package', 'product', 'sort_key')]
         ordering = ('package', 'release',)
 
     def __str__(self):
         return self.release
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Version, cls).from_db(db, field_names, values)
+        instance._loaded_values = dict((name, value) for name, value in zip(field_names, values)
+                                       if value is not models.DEFERRED)
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The sort key is only recomputed (which may query the product) and
+        # the old security flag only queried if not known since loading
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_values', {})
+        if update_fields is None or set(update_fields) & {'release', 'product', 'product_id'}:
+            changed = (loaded.get('release'), loaded.get('product_id')) != (self.release, self.product_id)
+            if changed or self.sort_key is None:
+                self.sort_key = versions.sort_key(self.release, versions.scheme_for(self.product.name))
+            if update_fields is not None and 'sort_key' not in update_fields:
+                kwargs['update_fields'] = list(update_fields) + ['sort_key']
+        self.security_changed = self._security_changed(update_fields, loaded)
+        super(Version, self).save(*args, **kwargs)
+
+        saved = kwargs.get('update_fields')
+        self._loaded_values = dict(loaded, **dict(
+            (name, getattr(self, name)) for name in ('release', 'product_id', 'security', 'sort_key')
+            if saved is None or name in saved or name.replace('_id', '') in saved))
+
+    def _security_changed(self, update_fields, loaded):
+        if self.pk is None or (update_fields is not None and 'security' not in update_fields):
+            return False
+        if 'security' in loaded:
+            old = loaded['security']
+        else:
+            old = Version.objects.filter(pk=self.pk).values_list('security', flat=True).first()
+        return old is not None and old != self.security
+
+    @classmethod
+    def update_sort_keys(cls, queryset, batch_size=2000):
+        """
+        Compute the sort keys of versions, e.g. of those inserted by
+        strongSwan, which have none.
+
+        Args:
+            queryset (QuerySet):
+                The versions to update.
+            batch_size (int):
+                Number of versions updated per transaction.
+
+        Returns:
+            The number of versions whose sort key changed.
+
+        """
+        rows = queryset.order_by('pk').values_list('pk', 'release', 'product__name', 'sort_key')
+        count = 0
+        last = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            last = batch[-1][0]
+            changed = []
+            for pk, release, product, old in batch:
+                key = versions.sort_key(release, versions.scheme_for(product))
+                if key != old:
+                    changed.append(cls(pk=pk, sort_key=key))
+            with transaction.atomic():
+                cls.objects.bulk_update(changed, ['sort_key'])
+            count += len(changed)
+        return count
+
     def list_repr(self):
         """
         String representation in lists
@@ -22,3 +22,28 @@ class VersionSerializer(DynamicFieldsMixin, serializers.HyperlinkedModelSerializ
     class Meta(object):
         model = models.Version
         fields = ('id', 'uri', 'package', 'product', 'release', 'security', 'blacklist', 'time')
+
+
+class VersionSelectorSerializer(serializers.Serializer):
+    """
+    Versions selected by package, product and release names or patterns,
+    see `apps.packages.flags.match_versions`.
+    """
+    package = serializers.CharField(max_length=255)
+    product = serializers.CharField(max_length=255, required=False)
+    release = serializers.CharField(max_length=255, required=False)
+
+
+class VersionFlagsSerializer(serializers.Serializer):
+    """
+    A bulk update of version flags, see `apps.packages.flags.set_flags`.
+    """
+    data = serializers.ListField(child=VersionSelectorSerializer(), allow_empty=False)
+    security = serializers.BooleanField(required=False, allow_null=True, default=None)
+    blacklist = serializers.BooleanField(required=False, allow_null=True, default=None)
+    dry_run = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        if attrs['security'] is None and attrs['blacklist'] is None:
+            raise serializers.ValidationError('Set the security or the blacklist flag')
+        return attrs
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Comparison of package version strings.
+
+Releases are free-form strings, which compare correctly neither lexically
+nor numerically. `compare_dpkg` compares two Debian versions like dpkg.
+`sort_key` encodes a release as string whose lexical order is the order of
+dpkg or rpm, depending on the product, so that versions can be ordered and
+range filtered by the database (see ``Version.sort_key``).
+
+The sort keys only consist of digits and lowercase ASCII letters, which are
+ordered alike by binary and by case or accent insensitive collations (e.g.
+``utf8_unicode_ci`` of MySQL), so that the database compares them correctly
+whatever the collation of the column. The tokens are encoded as follows:
+
+=============  =======================================================
+Token          Encoding
+=============  =======================================================
+``~``          ``0`` (before everything, even the end)
+end            ``1`` (of the non-digit part of a dpkg segment, of an
+               rpm segment or of the whole string)
+``^``          ``2`` (rpm only: after the end, before everything else)
+number         its number of digits in base 36 (``0`` for zero)
+               followed by the digits without leading zeros
+letter         ``2`` (upper case) or ``3`` (lower case) followed by the
+               lower case letter
+other (dpkg)   ``4`` followed by the code point as two base 36 digits,
+               or ``5`` followed by four digits (code points >= 1296)
+=============  =======================================================
+
+dpkg keys alternate non-digit parts (terminated by ``1``) and numbers. rpm
+keys ignore separators and prefix numbers with ``4`` and letter sequences
+with ``3`` (their letters encoded with ``1`` and ``2`` instead of ``2`` and
+``3`` and terminated by ``0``). The epoch, version and revision keys are
+concatenated.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import re
+import string
+
+
+DPKG = 'dpkg'
+RPM = 'rpm'
+
+"""
+Products whose versions are compared like rpm does, by start of their name
+"""
+RPM_PRODUCTS = ('CentOS', 'Fedora', 'openSUSE', 'Red Hat', 'RHEL', 'Rocky', 'AlmaLinux', 'SUSE', 'SLES')
+
+"""
+Maximum length of a sort key, longer keys are not stored
+"""
+MAX_KEY_LENGTH = 255
+
+"""
+Characters of the sort keys, in the order of all collations
+"""
+ALPHABET = string.digits + string.ascii_lowercase
+
+"""
+Maximum number of digits of a number in a sort key
+"""
+MAX_DIGITS = len(ALPHABET) - 1
+
+
+def _is_digit(c):
+    return '0' <= c <= '9'
+
+
+def _order(c):
+    """
+    Weight of a non-digit character in dpkg version comparisons: ``~`` sorts
+    before everything (even the end of the string), letters before other
+    characters.
+    """
+    if c in string.ascii_letters:
+        return ord(c)
+    elif c == '~':
+        return -1
+    return ord(c) + 256
+
+
+def _verrevcmp(a, b):
+    """
+    Compare the upstream versions or revisions of two Debian versions like
+    ``verrevcmp`` of dpkg: alternating non-digit and digit parts are
+    compared, the former by character weight, the latter numerically.
+    """
+    i, j = 0, 0
+    while i < len(a) or j < len(b):
+        while (i < len(a) and not _is_digit(a[i])) or (j < len(b) and not _is_digit(b[j])):
+            ac = _order(a[i]) if i < len(a) and not _is_digit(a[i]) else 0
+            bc = _order(b[j]) if j < len(b) and not _is_digit(b[j]) else 0
+            if ac != bc:
+                return ac - bc
+            i += 1
+            j += 1
+        while i < len(a) and a[i] == '0':
+            i += 1
+        while j < len(b) and b[j] == '0':
+            j += 1
+        first_diff = 0
+        while i < len(a) and _is_digit(a[i]) and j < len(b) and _is_digit(b[j]):
+            if not first_diff:
+                first_diff = ord(a[i]) - ord(b[j])
+            i += 1
+            j += 1
+        if i < len(a) and _is_digit(a[i]):
+            return 1
+        if j < len(b) and _is_digit(b[j]):
+            return -1
+        if first_diff:
+            return first_diff
+    return 0
+
+
+def parse_dpkg(version):
+    """
+    Split a Debian version into epoch, upstream version and revision.
+
+    Returns:
+        A tuple (epoch, upstream, revision), the epoch as int.
+
+    """
+    epoch = 0
+    if ':' in version:
+        prefix, rest = version.split(':', 1)
+        if prefix.isdigit():
+            epoch, version = int(prefix), rest
+    upstream, _, revision = version.rpartition('-')
+    if not upstream:
+        upstream, revision = revision, ''
+    return epoch, upstream, revision
+
+
+def compare_dpkg(a, b):
+    """
+    Compare two Debian package versions.
+
+    Returns:
+        A negative number if `a` is older than `b`, zero if they are equal
+        and a positive number if `a` is newer.
+
+    """
+    a_epoch, a_upstream, a_revision = parse_dpkg(a)
+    b_epoch, b_upstream, b_revision = parse_dpkg(b)
+    if a_epoch != b_epoch:
+        return a_epoch - b_epoch
+    return _verrevcmp(a_upstream, b_upstream) or _verrevcmp(a_revision, b_revision)
+
+
+def scheme_for(product_name):
+    """
+    Return the version scheme (`DPKG` or `RPM`) of a product.
+    """
+    return RPM if product_name.startswith(RPM_PRODUCTS) else DPKG
+
+
+class _KeyTooLong(ValueError):
+    pass
+
+
+def _base36(value, width):
+    chars = []
+    for _ in range(width):
+        value, rest = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[rest])
+    return ''.join(reversed(chars))
+
+
+def _number_key(digits):
+    digits = digits.lstrip('0')
+    if len(digits) > MAX_DIGITS:
+        raise _KeyTooLong()
+    return ALPHABET[len(digits)] + digits
+
+
+def _letter_key(c, upper, lower):
+    return (upper if c in string.ascii_uppercase else lower) + c.lower()
+
+
+def _dpkg_part_key(part):
+    key = []
+    for segment, digits in re.findall(r'([^0-9]*)([0-9]*)', part)[:-1] or [('', '')]:
+        for c in segment:
+            if c == '~':
+                key.append('0')
+            elif c in string.ascii_letters:
+                key.append(_letter_key(c, '2', '3'))
+            elif ord(c) < len(ALPHABET) ** 2:
+                key.append('4' + _base36(ord(c), 2))
+            else:
+                key.append('5' + _base36(ord(c), 4))
+        key.append('1')
+        key.append(_number_key(digits))
+    key.append('1')
+    return ''.join(key)
+
+
+def _rpm_part_key(part):
+    key = []
+    for token in re.findall(r'~|\^|[0-9]+|[a-zA-Z]+', part):
+        if token == '~':
+            key.append('0')
+        elif token == '^':
+            key.append('2')
+        elif token[0] in string.digits:
+            key.append('4' + _number_key(token))
+        else:
+            key.append('3' + ''.join(_letter_key(c, '1', '2') for c in token) + '0')
+    key.append('1')
+    return ''.join(key)
+
+
+def parse_rpm(version):
+    """
+    Split an rpm version into epoch, version and release.
+
+    Returns:
+        A tuple (epoch, version, release), the epoch as int.
+
+    """
+    epoch = 0
+    if ':' in version:
+        prefix, rest = version.split(':', 1)
+        if prefix.isdigit():
+            epoch, version = int(prefix), rest
+    version, _, release = version.partition('-')
+    return epoch, version, release
+
+
+def sort_key(release, scheme=DPKG):
+    """
+    Return the sort key of a release.
+
+    Args:
+        release (str):
+            The release, e.g. ``1:1.2.11.dfsg-1``.
+        scheme (str):
+            `DPKG` or `RPM`.
+
+    Returns:
+        A string, or None if the key would be longer than `MAX_KEY_LENGTH`.
+
+    """
+    if scheme == RPM:
+        epoch, version, revision = parse_rpm(release)
+        part_key = _rpm_part_key
+    else:
+        epoch, version, revision = parse_dpkg(release)
+        part_key = _dpkg_part_key
+    try:
+        key = _number_key(str(epoch)) + part_key(version) + part_key(revision)
+    except _KeyTooLong:
+        return None
+    return key if len(key) <= MAX_KEY_LENGTH else None
@@ -3,10 +3,14 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 
 from rest_framework import viewsets
 
+from apps.api.mixins import QueryShapingMixin
+from apps.api.pagination import LimitOffsetPagination
+
 from . import models, serializers
 
 
-class PolicyViewSet(viewsets.ReadOnlyModelViewSet):
+class PolicyViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = models.Policy
     queryset = model.objects.all()
     serializer_class = serializers.PolicySerializer
+    pagination_class = LimitOffsetPagination
@@ -39,6 +39,13 @@ class Policy(models.Model):
         """
         Generate a workitem for a session.
 
+        """
+        self.build_work_item(enforcement, session).save()
+
+    def build_work_item(self, enforcement, session):
+        """
+        Return an unsaved workitem for a session.
+
         """
         item = WorkItem(result=None, type=self.type, recommendation=None,
                 arg_str=self.argument, enforcement=enforcement, session=session)
@@ -51,7 +58,7 @@ class Policy(models.Model):
         if enforcement.noresult is not None:
             item.noresult = enforcement.noresult
 
-        item.save()
+        return item
 
     action = [
         'ALLOW',
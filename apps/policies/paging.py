@@ -48,6 +48,7 @@ enforcement_list_paging = {
     'list_producer': enforcement_list_producer,
     'stat_producer': enforcement_stat_producer,
     'static_producer_args': None,
+    'select_related': ('policy', 'group'),
     'var_name': 'object_list',
     'url_name': 'policies:enforcement_detail',
     'page_size': 50,
@@ -15,9 +15,21 @@ class TagEventAdmin(admin.ModelAdmin):
     list_display = ('tag', 'event', 'record_id', 'action')
 
 
+class TagChangeAdmin(admin.ModelAdmin):
+    list_display = ('tag', 'session', 'device', 'action')
+    list_filter = ('device', )
+
+
+class DeviceVulnerabilityAdmin(admin.ModelAdmin):
+    list_display = ('tag', 'device', 'active')
+    list_filter = ('active', )
+
+
 admin.site.register(models.Tag)
 admin.site.register(models.TagStats)
 admin.site.register(models.TagEvent, TagEventAdmin)
+admin.site.register(models.TagChange, TagChangeAdmin)
+admin.site.register(models.DeviceVulnerability, DeviceVulnerabilityAdmin)
 admin.site.register(models.Entity)
 admin.site.register(models.EntityRole)
 admin.site.register(models.Event, EventAdmin)
@@ -3,6 +3,7 @@ from __future__ import print_function, division, absolute_import, unicode_litera
 
 import json
 
+from django.db.models import Count, Max, Min, Q
 from django.http import HttpResponse
 from django.views.decorators.http import require_POST
 
@@ -10,7 +11,8 @@ from apps.core.decorators import ajax_login_required
 from apps.core.models import Session
 from apps.devices.models import Device
 from apps.front.utils import local_dtstring, timestamp_local_to_utc
-from .paging import get_tag_diffs
+from .models import TagChange
+from .paging import get_tag_changes
 
 
 @require_POST
@@ -97,28 +99,21 @@ def get_tag_log_stats(request):
 
     from_timestamp = timestamp_local_to_utc(from_timestamp)
     to_timestamp = timestamp_local_to_utc(to_timestamp)
-    diffs = get_tag_diffs(device_id, from_timestamp, to_timestamp)
-    if diffs:
-        added_count = 0
-        removed_count = 0
-        sessions = set()
-        for diff in diffs:
-            sessions.add(diff.session)
-            if diff.action == '+':
-                added_count += 1
-            else:
-                removed_count += 1
-
-        s = sorted(sessions, key=lambda sess: sess.time)
-        first_session = s[0]
-        last_session = s[-1]
-
+    changes = get_tag_changes(device_id, from_timestamp, to_timestamp).order_by()
+    stats = changes.aggregate(
+        session_count=Count('session', distinct=True),
+        first_session_time=Min('session__time'),
+        last_session_time=Max('session__time'),
+        added_count=Count('pk', filter=Q(action=TagChange.ADDED)),
+        removed_count=Count('pk', filter=Q(action=TagChange.REMOVED)),
+    )
+    if stats['session_count']:
         result = {
-            'session_count': len(sessions),
-            'first_session': local_dtstring(first_session.time),
-            'last_session': local_dtstring(last_session.time),
-            'added_count': added_count,
-            'removed_count': removed_count,
+            'session_count': stats['session_count'],
+            'first_session': local_dtstring(stats['first_session_time']),
+            'last_session': local_dtstring(stats['last_session_time']),
+            'added_count': stats['added_count'],
+            'removed_count': stats['removed_count'],
         }
 
         return HttpResponse(json.dumps(result), content_type="application/x-json")
@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 
+from collections import OrderedDict
+
 from django.db import transaction
+from django.http import HttpResponse
 from rest_framework import viewsets, views, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.parsers import JSONParser
 from lxml.etree import XMLSyntaxError
@@ -12,31 +16,50 @@ from . import utils, serializers
 
 from .models import Event, Entity, Tag, TagEvent, TagStats
 from apps.core.models import Session
+from apps.devices import counters
+from apps.api.export import ExportMixin
+from apps.api.mixins import ConditionalGetMixin, QueryShapingMixin
 from apps.api.utils import make_message
 from apps.swid.xmpp_grid import XmppGridClient
 
 
-class EventViewSet(viewsets.ReadOnlyModelViewSet):
+"""
+Maximum number of software-ids per request to `SwidResolveView`
+"""
+MAX_RESOLVE_IDS = 50000
+
+
+class EventViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = Event
     queryset = model.objects.all()
     serializer_class = serializers.EventSerializer
     filter_fields = ('device', 'epoch', 'eid')
 
 
-class EntityViewSet(viewsets.ReadOnlyModelViewSet):
+class EntityViewSet(QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = Entity
     queryset = model.objects.all()
     serializer_class = serializers.EntitySerializer
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ExportMixin, ConditionalGetMixin, QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = Tag
     queryset = model.objects.all()
     serializer_class = serializers.TagSerializer
     filter_fields = ('package_name', 'version_str', 'unique_id', 'software_id')
 
+    @action(detail=True)
+    def xml(self, request, *args, **kwargs):
+        """
+        The SWID tag XML of a tag.
+        """
+        def view():
+            tag = self.get_object()
+            return HttpResponse(tag.swid_xml, content_type='application/xml; charset=utf-8')
+        return self.conditional_response(request, view)
+
 
-class TagStatsViewSet(viewsets.ReadOnlyModelViewSet):
+class TagStatsViewSet(ExportMixin, QueryShapingMixin, viewsets.ReadOnlyModelViewSet):
     model = TagStats
     queryset = model.objects.all()
     serializer_class = serializers.TagStatsSerializer
@@ -137,6 +160,52 @@ class TagAddView(views.APIView):
         return make_message(msg, status.HTTP_200_OK)
 
 
+class SwidResolveView(views.APIView):
+    """
+    Look up which of the given software-ids are known.
+
+    Returns the known software-ids with the id, version string, version and
+    security flag of their tags, and the unknown software-ids, both in the
+    order they were submitted. At most `MAX_RESOLVE_IDS` software-ids may be
+    submitted per request.
+
+    You can either send data to this endpoint in `application/x-www-form-urlencoded` encoding
+
+        data='software-id-1'&data='software-id-2'&data='software-id-n'
+
+    ...or you can use `application/json` encoding:
+
+        {"data": ["software-id-1", "software-id-2", "software-id-n"]}
+
+    """
+    def post(self, request, format=None):
+        try:
+            software_ids = validate_data_param(request, 'software IDs')
+        except ValueError as e:
+            return e.args[0]
+        if len(software_ids) > MAX_RESOLVE_IDS:
+            msg = 'Too many software IDs, at most %d are allowed per request' % MAX_RESOLVE_IDS
+            return make_message(msg, status.HTTP_400_BAD_REQUEST)
+
+        unique_ids = list(OrderedDict.fromkeys(software_ids))
+        tag_qs = Tag.objects.order_by('-pk').values_list('software_id', 'pk', 'version_str', 'version',
+                                                         'version__security')
+        # Software-ids are not unique, the oldest tag wins
+        rows = utils.chunked_filter_in(tag_qs, 'software_id', unique_ids, 980)
+        found = dict((row[0], row) for row in rows)
+
+        known = []
+        unknown = []
+        for software_id in unique_ids:
+            if software_id in found:
+                _, pk, version_str, version, security = found[software_id]
+                known.append({'software_id': software_id, 'id': pk, 'version_str': version_str,
+                              'version': version, 'security': security})
+            else:
+                unknown.append(software_id)
+        return Response(data={'known': known, 'unknown': unknown}, status=status.HTTP_200_OK)
+
+
 class SwidMeasurementView(views.APIView):
     """
     Link the given software-ids with the current session.
@@ -187,6 +256,12 @@ class SwidMeasurementView(views.APIView):
             # Also possible with signaling https://docs.djangoproject.com/en/dev/ref/signals/#m2m-changed
             utils.update_tag_stats(session, list(found_tags.values()))
 
+            # Record the changes to the previous SWID measurement
+            utils.update_tag_changes(session)
+
+            # Update the installed software and session counters of the device
+            counters.update([session.device_id])
+
             return Response(data=[], status=status.HTTP_200_OK)
 
 
@@ -298,4 +373,7 @@ class SwidEventsView(views.APIView):
         if xmpp_connected:
             xmpp.disconnect()
 
+        # Update the installed software counters of the device
+        counters.update([session.device_id])
+
         return Response(data=[], status=status.HTTP_200_OK)
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save, pre_save
+
+
+class SwidConfig(AppConfig):
+    name = 'apps.swid'
+
+    def ready(self):
+        from apps.devices.models import Device
+        from apps.packages.models import Version
+        from apps.swid import vulnerabilities
+        from apps.swid.models import EntityRole, Tag, TagEvent, TagStats
+
+        # Maintain the vulnerability index
+        post_save.connect(vulnerabilities.tag_stats_saved, sender=TagStats,
+                          dispatch_uid='vulnerabilities_tag_stats_saved')
+        post_save.connect(vulnerabilities.version_saved, sender=Version,
+                          dispatch_uid='vulnerabilities_version_saved')
+        pre_save.connect(vulnerabilities.tag_pre_save, sender=Tag,
+                         dispatch_uid='vulnerabilities_tag_pre_save')
+        post_save.connect(vulnerabilities.tag_saved, sender=Tag,
+                          dispatch_uid='vulnerabilities_tag_saved')
+        post_save.connect(vulnerabilities.device_saved, sender=Device,
+                          dispatch_uid='vulnerabilities_device_saved')
+
+        # Entities and events are part of the API representation of a tag
+        for model in (EntityRole, TagEvent):
+            post_save.connect(Tag.touch, sender=model,
+                              dispatch_uid='tag_touch_saved_%s' % model.__name__)
+            post_delete.connect(Tag.touch, sender=model,
+                                dispatch_uid='tag_touch_deleted_%s' % model.__name__)
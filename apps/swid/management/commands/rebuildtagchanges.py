@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to rebuild the recorded SWID tag changes from the
+session history.
+
+Usage: ./manage.py rebuildtagchanges [device_id ...]
+
+If no device ids are given, the tag changes of all devices are rebuilt.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.devices.models import Device
+from apps.swid import utils
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    args = '[device_id ...]'
+    help = 'Rebuild the SWID tag changes of the given devices (default: all devices) ' \
+           'from the recorded SWID measurements.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='*')
+
+    def handle(self, *args, **kwargs):
+        devices = Device.objects.order_by('pk')
+        if args:
+            try:
+                device_ids = [int(arg) for arg in args]
+            except ValueError:
+                raise CommandError('Usage: ./manage.py rebuildtagchanges [device_id ...]')
+            devices = devices.filter(pk__in=device_ids)
+
+        for device in devices:
+            with transaction.atomic():
+                count = utils.rebuild_tag_changes(device.pk)
+            self.stdout.write('Recorded {0} tag changes for {1}'.format(count, device))
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Custom manage.py command to rebuild the index of vulnerable software
+packages installed on the devices.
+
+Usage: ./manage.py rebuildvulnerabilities
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.swid import vulnerabilities
+
+
+class Command(BaseCommand):
+    """
+    Required class to be recognized by manage.py.
+    """
+    help = 'Rebuild the index of vulnerable software packages installed on the devices ' \
+           'from the SWID tag stats and the security flags of the versions.'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            count = vulnerabilities.rebuild()
+        self.stdout.write('Indexed {0} vulnerable software packages'.format(count))
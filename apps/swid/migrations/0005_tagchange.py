@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '__first__'),
+        ('devices', '0002_device_inactive'),
+        ('swid', '0004_link_tag_to_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('action', models.PositiveSmallIntegerField(choices=[(1, 'Added'), (2, 'Removed')])),
+                ('device', models.ForeignKey(related_name='tag_changes', to='devices.Device', on_delete=models.CASCADE)),
+                ('session', models.ForeignKey(related_name='tag_changes', to='core.Session', on_delete=models.CASCADE)),
+                ('tag', models.ForeignKey(to='swid.Tag', on_delete=models.CASCADE)),
+            ],
+            options={
+                'db_table': 'swid_tag_changes',
+                'verbose_name_plural': 'tag changes',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='tagchange',
+            unique_together=set([('session', 'tag')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='tagchange',
+            index_together=set([('device', 'session')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate(apps, schema_editor):
+    TagStats = apps.get_model('swid', 'TagStats')
+    DeviceVulnerability = apps.get_model('swid', 'DeviceVulnerability')
+    vulnerable = TagStats.objects.exclude(first_installed=None) \
+        .filter(last_deleted=None, tag__version__security=True) \
+        .values_list('pk', 'device_id', 'tag_id', 'device__inactive')
+    DeviceVulnerability.objects.bulk_create(
+        DeviceVulnerability(tag_stats_id=pk, device_id=device_id, tag_id=tag_id, active=not inactive)
+        for pk, device_id, tag_id, inactive in vulnerable.iterator())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_groupclosure'),
+        ('swid', '0005_tagchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceVulnerability',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('active', models.BooleanField(default=True, help_text='Whether the device is active')),
+                ('device', models.ForeignKey(related_name='vulnerabilities', to='devices.Device', on_delete=models.CASCADE)),
+                ('tag', models.ForeignKey(to='swid.Tag', on_delete=models.CASCADE)),
+                ('tag_stats', models.OneToOneField(related_name='vulnerability', to='swid.TagStats', on_delete=models.CASCADE)),
+            ],
+            options={
+                'db_table': 'swid_device_vulnerabilities',
+                'ordering': ('device', 'tag'),
+                'verbose_name_plural': 'device vulnerabilities',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='devicevulnerability',
+            index_together=set([('active', 'device', 'tag')]),
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('swid', '0006_devicevulnerability'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now,
+                                       help_text='Time of the last change of the tag, its entities or events'),
+            preserve_default=False,
+        ),
+    ]
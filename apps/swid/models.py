@@ -2,6 +2,8 @@
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 
 from apps.packages.models import Package
 from config.settings import XMPP_GRID
@@ -28,6 +30,8 @@ class Tag(models.Model):
     software_id = models.CharField(max_length=767, db_index=True,
                         help_text='The Software ID, format: {regid}__{tagId} '
                                              'e.g strongswan.org__fedora_19-x86_64-strongswan-5.1.2-4.fc19')
+    modified = models.DateTimeField(auto_now=True,
+                        help_text='Time of the last change of the tag, its entities or events')
 
     class Meta(object):
         db_table = TABLE_PREFIX + 'tags'
@@ -39,6 +43,14 @@ class Tag(models.Model):
     def list_repr(self):
         return self.unique_id
 
+    @classmethod
+    def touch(cls, sender, instance, **kwargs):
+        """
+        Signal handler updating the modification time of the tag of a saved
+        or deleted entity role or tag event.
+        """
+        cls.objects.filter(pk=instance.tag_id).update(modified=timezone.now())
+
     def json(self):
         j_tag_id = '"tagId": "%s"' % self.unique_id
         j_package_name = '"packageName": "%s"' % self.package_name
@@ -73,6 +85,30 @@ class Tag(models.Model):
     def get_matching_packages(self):
         return Package.objects.filter(name=self.package_name)
 
+    @classmethod
+    def annotate_matching_package(cls, queryset, tag_field=None):
+        """
+        Annotate the pk of the first package matching the tag's package name
+        as ``matching_package_id``.
+
+        This replaces per-row calls to `get_matching_packages` in list
+        templates with a single correlated subquery.
+
+        Args:
+            queryset (QuerySet):
+                A queryset of tags or of a model referencing a tag.
+            tag_field (str):
+                Name of the field referencing the tag, e.g. ``tag`` for a
+                queryset of TagStats objects. None for a queryset of tags.
+
+        Returns:
+            The annotated queryset.
+
+        """
+        name_field = '%s__package_name' % tag_field if tag_field else 'package_name'
+        packages = Package.objects.filter(name=OuterRef(name_field)).order_by('pk')
+        return queryset.annotate(matching_package_id=Subquery(packages.values('pk')[:1]))
+
 
 class TagStats(models.Model):
     tag = models.ForeignKey('Tag', on_delete=models.CASCADE)
@@ -92,6 +128,70 @@ class TagStats(models.Model):
         ordering = ('device', 'tag')
 
 
+class TagChange(models.Model):
+    """
+    A SWID tag added to or removed from the inventory of a device, compared
+    to the previous session of the device with SWID measurements.
+    """
+    ADDED = 1
+    REMOVED = 2
+
+    ACTION_CHOICES = (
+        (ADDED, 'Added'),
+        (REMOVED, 'Removed'),
+    )
+
+    device = models.ForeignKey('devices.Device', on_delete=models.CASCADE,
+                        related_name='tag_changes')
+    session = models.ForeignKey('core.Session', on_delete=models.CASCADE,
+                        related_name='tag_changes')
+    tag = models.ForeignKey('Tag', on_delete=models.CASCADE)
+    action = models.PositiveSmallIntegerField(choices=ACTION_CHOICES)
+
+    class Meta(object):
+        db_table = TABLE_PREFIX + 'tag_changes'
+        unique_together = ('session', 'tag')
+        index_together = [('device', 'session')]
+        verbose_name_plural = 'tag changes'
+
+    def __str__(self):
+        return '%s %s in %s' % (self.tag, dict(TagChange.ACTION_CHOICES)[self.action].lower(),
+                                self.session)
+
+    def list_repr(self):
+        return '%s in %s' % (self.tag, self.session)
+
+
+class DeviceVulnerability(models.Model):
+    """
+    A vulnerable software package installed on a device, i.e. a tag whose
+    version is flagged as security update that was installed according to
+    the SWID events and not deleted since.
+
+    The rows are maintained by `apps.swid.vulnerabilities` when the
+    `TagStats`, the security flag of a `Version`, the version of a `Tag` or
+    the inactive flag of a `Device` change.
+    """
+    tag_stats = models.OneToOneField('TagStats', on_delete=models.CASCADE,
+                        related_name='vulnerability')
+    device = models.ForeignKey('devices.Device', on_delete=models.CASCADE,
+                        related_name='vulnerabilities')
+    tag = models.ForeignKey('Tag', on_delete=models.CASCADE)
+    active = models.BooleanField(default=True, help_text='Whether the device is active')
+
+    class Meta(object):
+        db_table = TABLE_PREFIX + 'device_vulnerabilities'
+        index_together = [('active', 'device', 'tag')]
+        ordering = ('device', 'tag')
+        verbose_name_plural = 'device vulnerabilities'
+
+    def __str__(self):
+        return '%s on %s' % (self.tag, self.device)
+
+    def list_repr(self):
+        return self.__str__()
+
+
 class EntityRole(models.Model):
     AGGREGATOR = 0
     DISTRIBUTOR = 1
@@ -2,16 +2,20 @@
 from __future__ import print_function, division, absolute_import, unicode_literals
 
 import math
-from collections import OrderedDict, namedtuple
+from collections import OrderedDict
 
+from django.db.models import OuterRef, Subquery
 from django.urls import reverse
 
 from .models import Entity, Tag
+from apps.filesystem.models import File
+from apps.core import search
+from apps.core.expressions import count_subquery
 from apps.core.models import Session
 from apps.devices.models import Device
 from apps.front.utils import timestamp_local_to_utc
 from apps.front.paging import ProducerFactory
-from apps.swid.models import TagStats
+from apps.swid.models import DeviceVulnerability, TagChange, TagStats
 
 # PAGING PRODUCER
 
@@ -22,31 +26,33 @@ regid_producer_factory = ProducerFactory(Entity, 'regid__icontains')
 
 def entity_swid_list_producer(from_idx, to_idx, filter_query, dynamic_params=None, static_params=None):
     entity_id = dynamic_params['entity_id']
-    tag_list = Entity.objects.get(pk=entity_id).tags.all()
+    tag_list = Tag.objects.filter(entity__pk=entity_id)
     if filter_query:
-        tag_list = tag_list.filter(unique_id__icontains=filter_query)
+        tag_list = tag_list.filter(search.contains(Tag, 'unique_id', filter_query))
+    tag_list = Tag.annotate_matching_package(tag_list)
     return tag_list[from_idx:to_idx]
 
 
 def entity_swid_stat_producer(page_size, filter_query, dynamic_params=None, static_params=None):
     entity_id = dynamic_params['entity_id']
-    tag_list = Entity.objects.get(pk=entity_id).tags.all()
-    count = tag_list.count()
+    tag_list = Tag.objects.filter(entity__pk=entity_id)
     if filter_query:
-        count = tag_list.filter(unique_id__icontains=filter_query).count()
-    return math.ceil(count / page_size)
+        tag_list = tag_list.filter(search.contains(Tag, 'unique_id', filter_query))
+    return math.ceil(tag_list.count() / page_size)
 
 
 def swid_inventory_list_producer(from_idx, to_idx, filter_query, dynamic_params, static_params=None):
     if not dynamic_params:
         return []
     session_id = dynamic_params['session_id']
-    installed_tags = list(get_installed_tags(session_id, filter_query)[from_idx:to_idx])
+    installed_tags = get_installed_tags(session_id, filter_query)
+    installed_tags = list(Tag.annotate_matching_package(installed_tags, 'tag')[from_idx:to_idx])
 
     tags = [
         {
             'added_now': int(session_id) == tagstat.first_seen.pk,
             'tag': tagstat.tag,
+            'matching_package_id': tagstat.matching_package_id,
             'first_seen': tagstat.first_seen,
             'last_seen': tagstat.last_seen,
             'tag_url': reverse('swid:tag_detail', args=[tagstat.tag.pk]),
@@ -85,7 +91,7 @@ def get_installed_tags(session_id, filter_query):
     session = Session.objects.get(pk=session_id)
     installed_tags = Tag.get_installed_tags_with_time(session)
     if filter_query:
-        installed_tags = installed_tags.filter(tag__unique_id__icontains=filter_query)
+        installed_tags = installed_tags.filter(search.contains(TagStats, 'tag__unique_id', filter_query))
     return installed_tags
 
 
@@ -96,16 +102,18 @@ def swid_log_list_producer(from_idx, to_idx, filter_query, dynamic_params, stati
     from_timestamp = timestamp_local_to_utc(dynamic_params['from_timestamp'])
     to_timestamp = timestamp_local_to_utc(dynamic_params['to_timestamp'])
 
-    diffs = get_tag_diffs(device_id, from_timestamp, to_timestamp, filter_query)[from_idx:to_idx]
+    changes = get_tag_changes(device_id, from_timestamp, to_timestamp, filter_query)
+    changes = Tag.annotate_matching_package(changes, 'tag')[from_idx:to_idx]
 
     result = OrderedDict()
-    for diff in diffs:
-        tag = diff.tag
-        tag.added = diff.action == '+'
-        if diff.session not in result:
-            result[diff.session] = [tag]
+    for change in changes:
+        tag = change.tag
+        tag.added = change.action == TagChange.ADDED
+        tag.matching_package_id = change.matching_package_id
+        if change.session not in result:
+            result[change.session] = [tag]
         else:
-            result[diff.session].append(tag)
+            result[change.session].append(tag)
     return result
 
 
@@ -115,182 +123,50 @@ def swid_log_stat_producer(page_size, filter_query, dynamic_params=None, static_
     device_id = dynamic_params['device_id']
     from_timestamp = timestamp_local_to_utc(dynamic_params['from_timestamp'])
     to_timestamp = timestamp_local_to_utc(dynamic_params['to_timestamp'])
-    diffs = get_tag_diffs(device_id, from_timestamp, to_timestamp, filter_query)
-    return math.ceil(len(diffs) / page_size)
+    changes = get_tag_changes(device_id, from_timestamp, to_timestamp, filter_query)
+    return math.ceil(changes.count() / page_size)
 
 
-def get_tag_diffs(device_id, from_timestamp, to_timestamp, filter_query=None):
+def get_tag_changes(device_id, from_timestamp, to_timestamp, filter_query=None):
     """
-    Get differences of installed SWID tags between all sessions of the
-    given device in the given timerange (see `session_tag_difference`).
+    Get the recorded SWID tag changes of the given device in the given
+    timerange.
+
+    Sessions are ordered from the newest to the oldest, for each session the
+    added tags are listed before the removed ones. Only the added tags are
+    listed for the oldest session with SWID measurements in the range.
 
     Args:
+        device_id (int):
+            The device to be queried.
         from_timestamp (int):
             A unix timestamp (UTC).
         to_timestamp (int):
             A unix timestamp (UTC).
-
-    """
-    device = Device.objects.get(pk=device_id)
-    sessions = device.get_sessions_in_range(from_timestamp, to_timestamp)
-
-    sessions_with_tags = sessions.filter(tag__isnull=False).distinct().order_by('-time')
-    num_of_sessions = sessions_with_tags.count()
-    sessions_with_tags = list(sessions_with_tags)  # Force evaluate
-
-    diffs = []
-
-    # diff only possible if more than 1 session is selected
-    if num_of_sessions > 1:
-        for i, session in enumerate(sessions_with_tags, start=1):
-            if i < num_of_sessions:
-                prev_session = sessions_with_tags[i]
-                diff = session_tag_difference(session, prev_session, filter_query)
-                diffs.extend(diff)
-            elif i == num_of_sessions:
-                diffs = last_session_diff(session, diffs, filter_query)
-    elif num_of_sessions == 1:
-        diffs = last_session_diff(sessions_with_tags[0], diffs, filter_query)
-
-    return diffs
-
-
-def session_tag_difference(curr_session, prev_session, filter_query):
-    """
-    Calculate the difference of the installed SWID tags between
-    the two given sessions.
-
-    Args:
-        curr_session (apps.core.models.Session):
-            The current session
-
-        prev_session (apps.core.models.Session):
-            The session before
-
-    Returns:
-        A list of named tuples, consisting of a session object,
-        a tag object and an action (str) which is either '+' for
-        added or '-' for removed:
-            [
-                (session: session, action: '+', tag: tag),
-                (session: session, action: '-', tag: tag),
-                ...,
-            ]
-
-    """
-    curr_tag_ids = curr_session.tag_set.values_list('id', flat=True).order_by('id')
-    prev_tag_ids = prev_session.tag_set.values_list('id', flat=True).order_by('id')
-
-    added_ids = list(set(curr_tag_ids) - set(prev_tag_ids))
-    removed_ids = list(set(prev_tag_ids) - set(curr_tag_ids))
-
-    differences = []
-    DiffEntry = namedtuple('DiffEntry', ['session', 'action', 'tag'])
-
-    block_size = 980
-    for i in range(0, len(added_ids), block_size):
-        added_ids_slice = added_ids[i:i + block_size]
-        if filter_query:
-            added_tags = Tag.objects \
-                .filter(id__in=added_ids_slice, unique_id__icontains=filter_query) \
-                .defer('swid_xml')
-        else:
-            added_tags = Tag.objects.filter(id__in=added_ids_slice).defer('swid_xml')
-        for tag in added_tags:
-            entry = DiffEntry(curr_session, '+', tag)
-            differences.append(entry)
-
-    for i in range(0, len(removed_ids), block_size):
-        removed_ids_slice = removed_ids[i:i + block_size]
-        if filter_query:
-            removed_tags = Tag.objects \
-                .filter(id__in=removed_ids_slice, unique_id__icontains=filter_query) \
-                .defer('swid_xml')
-        else:
-            removed_tags = Tag.objects.filter(id__in=removed_ids_slice).defer('swid_xml')
-        for tag in removed_tags:
-            entry = DiffEntry(curr_session, '-', tag)
-            differences.append(entry)
-
-    return differences
-
-
-def last_session_diff(last_session, diff, filter_query):
-    """
-    Adds the tag difference for the last session in the list (or a single session).
-    There are two cases for a last/single session:
-    1. The session is the first session with SWID measurements.
-       -> All measured tags in this session will be listed as added.
-    2. The session has previous (not selected) sessions wiht SWID measurements
-       -> The tags which are added in this session will be listed as added.
-
-    Args:
-        last_session (apps.core.models.Session):
-            The last or sinlgle selected session of a tag diff.
-
-        diff (list of namedtuple (session, action, tag)):
-            The tagdiffs from newer sessions.
-
-        filter_quers (str):
-            Filter query.
+        filter_query (str):
+            Filter the tags (unique_id) by this string.
 
     Returns:
-        A list of named tuples, consisting of a session object,
-        a tag object and an action (str) which is either '+' for
-        added or '-' for removed:
-            [
-                (session: session, action: '+', tag: tag),
-                (session: session, action: '-', tag: tag),
-                ...,
-            ]
+        A queryset of `TagChange` objects.
 
     """
-    prev_sessions = Session.objects.filter(device=last_session.device,
-                                           tag__isnull=False, time__lt=last_session.time)
-    curr_diff = []
-    DiffEntry = namedtuple('DiffEntry', ['session', 'action', 'tag'])
-
-    if prev_sessions.count() > 0:
-        prev_session = prev_sessions.first()
-        curr_tag_ids = last_session.tag_set.values_list('id', flat=True).order_by('id')
-        prev_tag_ids = prev_session.tag_set.values_list('id', flat=True).order_by('id')
-
-        added_ids = list(set(curr_tag_ids) - set(prev_tag_ids))
-        block_size = 980
-        added_block_count = int(math.ceil(len(added_ids) / block_size))
-        for i in range(added_block_count):
-            added_ids_slice = added_ids[i * block_size: (i + 1) * block_size]
-            if filter_query:
-                added_tags = Tag.objects.filter(id__in=added_ids_slice, unique_id__icontains=filter_query)\
-                    .defer('swid_xml')
-            else:
-                added_tags = Tag.objects.filter(id__in=added_ids_slice).defer('swid_xml')
-            for tag in added_tags:
-                entry = DiffEntry(last_session, '+', tag)
-                curr_diff.append(entry)
-    else:
-        if filter_query:
-            tags = last_session.tag_set.filter(unique_id__icontains=filter_query).defer('swid_xml')
-        else:
-            tags = last_session.tag_set.all().defer('swid_xml')
-        for tag in tags:
-            entry = DiffEntry(last_session, '+', tag)
-            curr_diff.append(entry)
+    sessions = Device(pk=device_id).get_sessions_in_range(from_timestamp, to_timestamp)
+    oldest_session = sessions.filter(tag__isnull=False).order_by('time').values('pk')[:1]
 
-    diff.extend(curr_diff)
-    return diff
+    changes = TagChange.objects.filter(device=device_id, session__in=sessions) \
+                               .exclude(session=Subquery(oldest_session), action=TagChange.REMOVED)
+    if filter_query:
+        changes = changes.filter(search.contains(TagChange, 'tag__unique_id', filter_query))
+    return changes.select_related('session', 'tag').defer('tag__swid_xml') \
+                  .order_by('-session__time', '-session', 'action', 'tag__unique_id')
 
 
 def swid_inventory_session_list_producer(from_idx, to_idx, filter_query, dynamic_params, static_params=None):
     if not dynamic_params:
         return []
 
-    sessions = get_device_sessions(dynamic_params)[from_idx:to_idx]
-
+    sessions = annotate_tag_counts(get_device_sessions(dynamic_params))[from_idx:to_idx]
     for session in sessions:
-        installed_tags = Tag.get_installed_tags_with_time(session)
-        session.tag_count = installed_tags.count()
-        session.new_tag_count = installed_tags.filter(first_seen=session).count()
         session.has_tags = session.tag_count > 0
 
     return sessions
@@ -303,35 +179,56 @@ def swid_inventory_session_stat_producer(page_size, filter_query, dynamic_params
     return math.ceil(sessions.count() / page_size)
 
 
+def annotate_tag_counts(sessions):
+    """
+    Annotate the number of reported tags (``tag_count``) and of tags which
+    were reported for the first time (``new_tag_count``) to each session.
+
+    Both counts are computed with correlated subqueries, so that a whole
+    page of sessions is fetched in a single query.
+
+    Args:
+        sessions (QuerySet):
+            A queryset of sessions.
+
+    Returns:
+        The annotated queryset.
+
+    """
+    installed_tags = TagStats.objects.filter(tag__sessions=OuterRef('pk'))
+    tag_count = installed_tags.filter(device=OuterRef('device'))
+    new_tag_count = installed_tags.filter(first_seen=OuterRef('pk'))
+    return sessions.annotate(tag_count=count_subquery(tag_count),
+                             new_tag_count=count_subquery(new_tag_count))
+
+
 def get_device_sessions(dynamic_params):
     device_id = dynamic_params.get('device_id')
     from_timestamp = timestamp_local_to_utc(dynamic_params.get('from_timestamp'))
     to_timestamp = timestamp_local_to_utc(dynamic_params.get('to_timestamp'))
 
-    device = Device.objects.get(pk=device_id)
-    return device.get_sessions_in_range(from_timestamp, to_timestamp)
+    return Device(pk=device_id).get_sessions_in_range(from_timestamp, to_timestamp)
 
 
 def swid_files_list_producer(from_idx, to_idx, filter_query, dynamic_params, static_params=None):
     if not dynamic_params:
         return []
     tag_id = dynamic_params['tag_id']
-    return Tag.objects.get(pk=tag_id).files.all()[from_idx:to_idx]
+    return File.objects.filter(tag__pk=tag_id)[from_idx:to_idx]
 
 
 def swid_files_stat_producer(page_size, filter_query, dynamic_params=None, static_params=None):
     if not dynamic_params:
         return []
     tag_id = dynamic_params['tag_id']
-    return math.ceil(Tag.objects.get(pk=tag_id).files.count() / page_size)
+    return math.ceil(File.objects.filter(tag__pk=tag_id).count() / page_size)
 
 
 def swid_devices_list_producer(from_idx, to_idx, filter_query, dynamic_params, static_params=None):
     if not dynamic_params:
         return []
     tag_id = dynamic_params['tag_id']
-    tagstats = TagStats.objects.filter(tag__pk=tag_id).select_related('last_seen', 'first_seen', 'device') \
-                       .defer('tag__swid_xml').order_by('device__description')
+    tagstats = TagStats.objects.filter(tag__pk=tag_id).order_by('device__description')
     return tagstats[from_idx:to_idx]
 
 
@@ -343,12 +240,31 @@ def swid_devices_stat_producer(page_size, filter_query, dynamic_params=None, sta
     return math.ceil(count / page_size)
 
 
+def get_vulnerabilities(filter_query):
+    vulnerabilities = DeviceVulnerability.objects.filter(active=True)
+    if filter_query:
+        vulnerabilities = vulnerabilities.filter(search.contains(DeviceVulnerability, 'tag__unique_id',
+                                                                 filter_query))
+    return vulnerabilities
+
+
+def vulnerability_list_producer(from_idx, to_idx, filter_query, dynamic_params=None, static_params=None):
+    vulnerabilities = Tag.annotate_matching_package(get_vulnerabilities(filter_query), 'tag')
+    return vulnerabilities[from_idx:to_idx]
+
+
+def vulnerability_stat_producer(page_size, filter_query, dynamic_params=None, static_params=None):
+    count = get_vulnerabilities(filter_query).count()
+    return math.ceil(count / page_size)
+
+
 # PAGING CONFIGS
 
 regid_list_paging = {
     'template_name': 'front/paging/default_list',
     'list_producer': regid_producer_factory.list(),
     'stat_producer': regid_producer_factory.stat(),
+    'only': ('id', 'regid'),
     'url_name': 'swid:regid_detail',
     'page_size': 50,
 }
@@ -357,6 +273,8 @@ regid_detail_paging = {
     'template_name': 'front/paging/regid_list_tags',
     'list_producer': entity_swid_list_producer,
     'stat_producer': entity_swid_stat_producer,
+    'select_related': ('version',),
+    'defer': ('swid_xml',),
     'url_name': 'swid:tag_detail',
     'page_size': 50,
 }
@@ -365,6 +283,7 @@ swid_list_paging = {
     'template_name': 'front/paging/default_list',
     'list_producer': swid_producer_factory.list(),
     'stat_producer': swid_producer_factory.stat(),
+    'only': ('id', 'unique_id'),
     'url_name': 'swid:tag_detail',
     'page_size': 50,
 }
@@ -381,6 +300,7 @@ swid_files_list_paging = {
     'template_name': 'filesystem/paging/file_list',
     'list_producer': swid_files_list_producer,
     'stat_producer': swid_files_stat_producer,
+    'select_related': ('directory',),
     'url_name': 'filesystem:file_detail',
     'page_size': 20,
 }
@@ -389,6 +309,7 @@ swid_devices_list_paging = {
     'template_name': 'swid/paging/swid_devices_list',
     'list_producer': swid_devices_list_producer,
     'stat_producer': swid_devices_stat_producer,
+    'select_related': ('device', 'first_seen', 'last_seen', 'first_installed', 'last_deleted'),
     'url_name': 'devices:device_detail',
     'page_size': 10,
 }
@@ -408,3 +329,14 @@ swid_log_list_paging = {
     'url_name': 'swid:tag_detail',
     'page_size': 50,
 }
+
+vulnerability_list_paging = {
+    'template_name': 'swid/paging/vulnerability_list',
+    'list_producer': vulnerability_list_producer,
+    'stat_producer': vulnerability_stat_producer,
+    'select_related': ('device', 'tag'),
+    'defer': ('tag__swid_xml',),
+    'var_name': 'vulnerabilities',
+    'url_name': 'swid:tag_detail',
+    'page_size': 50,
+}
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
 from django.db import transaction
+from django.db.models import Q
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
@@ -10,7 +15,8 @@ from lxml import etree
 from apps.filesystem.models import Directory, File, FileHash, Algorithm
 from apps.devices.models import Product
 from apps.packages.models import Package, Version
-from apps.swid.models import Entity, EntityRole, TagStats
+from apps.core.models import Session
+from apps.swid.models import Entity, EntityRole, TagStats, TagChange
 from .models import Tag
 
 """
@@ -345,3 +351,113 @@ def update_tag_stats(session, tag_ids):
         TagStats(tag_id=t, device=session.device, first_seen=session, last_seen=session)
         for t in new_tags]
     )
+
+
+def tag_changes_between(device_id, session_id, curr_tag_ids, prev_tag_ids):
+    """
+    Return the unsaved `TagChange` objects of a session.
+
+    Args:
+        device_id (int):
+            The device of the session.
+        session_id (int):
+            The session the changes are recorded for.
+        curr_tag_ids (set):
+            The ids of the tags measured in the session.
+        prev_tag_ids (set):
+            The ids of the tags measured in the previous session of the
+            device with SWID measurements, empty if there is none.
+
+    Returns:
+        A list of `TagChange` objects.
+
+    """
+    changes = [TagChange(device_id=device_id, session_id=session_id, tag_id=t,
+                         action=TagChange.ADDED) for t in curr_tag_ids - prev_tag_ids]
+    changes.extend(TagChange(device_id=device_id, session_id=session_id, tag_id=t,
+                             action=TagChange.REMOVED) for t in prev_tag_ids - curr_tag_ids)
+    return changes
+
+
+def update_tag_changes(session):
+    """
+    Record the tag changes of a session with SWID measurements.
+
+    The session is compared with the previous session of the device with
+    SWID measurements, sessions without tags (e.g. empty measurements) have
+    no changes, as in `rebuild_tag_changes`. If the measurements are reported for an older session
+    after a newer one, the changes of the following session are recorded
+    again as well.
+
+    Args:
+        session (apps.core.models.Session):
+            The measured session.
+
+    """
+    tag_sessions = Session.objects.filter(device=session.device_id, tag__isnull=False) \
+                                  .exclude(pk=session.pk).distinct()
+    # Sessions are ordered by time and pk, like by `rebuild_tag_changes`
+    earlier = Q(time__lt=session.time) | Q(time=session.time, pk__lt=session.pk)
+    prev_session_id = tag_sessions.filter(earlier).order_by('-time', '-pk') \
+                                  .values_list('pk', flat=True).first()
+    next_session_id = tag_sessions.exclude(earlier).order_by('time', 'pk') \
+                                  .values_list('pk', flat=True).first()
+
+    chain = [session_id for session_id in (prev_session_id, session.pk, next_session_id)
+             if session_id is not None]
+    memberships = Tag.sessions.through.objects.filter(session_id__in=chain) \
+                                              .values_list('session_id', 'tag_id')
+    tag_ids = defaultdict(set)
+    for session_id, tag_id in memberships:
+        tag_ids[session_id].add(tag_id)
+
+    # A session without tags has no changes, the following session is
+    # compared with the previous one
+    changes = []
+    prev_tag_ids = tag_ids[prev_session_id]
+    if tag_ids[session.pk]:
+        changes.extend(tag_changes_between(session.device_id, session.pk, tag_ids[session.pk],
+                                           prev_tag_ids))
+        prev_tag_ids = tag_ids[session.pk]
+    if next_session_id is not None:
+        changes.extend(tag_changes_between(session.device_id, next_session_id,
+                                           tag_ids[next_session_id], prev_tag_ids))
+    TagChange.objects.filter(session__in=[session.pk, next_session_id]).delete()
+    TagChange.objects.bulk_create(changes)
+
+
+def rebuild_tag_changes(device_id, block_size=980):
+    """
+    Rebuild the recorded tag changes of a device from its session history.
+
+    All (session, tag) memberships of the device are read in a single scan
+    ordered by session time, every session with SWID measurements is compared
+    with the preceding one.
+
+    Args:
+        device_id (int):
+            The device to be rebuilt.
+        block_size (int):
+            Number of changes inserted per query.
+
+    Returns:
+        The number of recorded tag changes.
+
+    """
+    TagChange.objects.filter(device=device_id).delete()
+    scan = Tag.sessions.through.objects.filter(session__device=device_id) \
+                                       .order_by('session__time', 'session_id') \
+                                       .values_list('session_id', 'tag_id').iterator()
+    count = 0
+    changes = []
+    prev_tag_ids = set()
+    for session_id, rows in groupby(scan, key=itemgetter(0)):
+        curr_tag_ids = set(tag_id for _, tag_id in rows)
+        changes.extend(tag_changes_between(device_id, session_id, curr_tag_ids, prev_tag_ids))
+        if len(changes) >= block_size:
+            TagChange.objects.bulk_create(changes)
+            count += len(changes)
+            changes = []
+        prev_tag_ids = curr_tag_ids
+    TagChange.objects.bulk_create(changes)
+    return count + len(changes)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Maintenance of the `DeviceVulnerability` index.
+
+A tag installed on a device is vulnerable if its `TagStats` have a
+``first_installed`` event but no ``last_deleted`` event and the version of
+the tag is flagged as security update. Instead of joining `TagStats`, `Tag`
+and `Version` on every request, the vulnerable tags are stored in the
+`DeviceVulnerability` table, which is kept up to date by the signal handlers
+below (connected in `SwidConfig.ready`):
+
+* Saving `TagStats` syncs the row of these stats.
+* Changing the security flag of a `Version` or the version of a `Tag`
+  refreshes the rows of the tags of that version.
+* Saving a `Device` updates the ``active`` flag of its rows.
+
+`refresh` also updates the vulnerable counts of the `DeviceCounters`, after
+single `TagStats` changes the counters are updated by the ingestion views.
+
+Rows of deleted stats, tags or devices are deleted by the database cascade.
+Bulk operations (e.g. `QuerySet.update`) don't send signals, call `refresh`
+after such changes or rebuild the index with ``./manage.py
+rebuildvulnerabilities``.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from apps.devices import counters
+from apps.swid.models import DeviceVulnerability, TagStats
+
+
+def vulnerable_tag_stats():
+    """
+    Return the queryset of all `TagStats` of vulnerable installed tags.
+    """
+    return TagStats.objects.exclude(first_installed=None).filter(last_deleted=None,
+                                                                 tag__version__security=True)
+
+
+def refresh(device_ids=None, tag_ids=None, version_ids=None):
+    """
+    Bring the index up to date for the given devices, tags or versions
+    (or all of them if no filter is given).
+
+    Args:
+        device_ids (list):
+            Only refresh the rows of these devices.
+        tag_ids (list):
+            Only refresh the rows of these tags.
+        version_ids (list):
+            Only refresh the rows of the tags of these versions.
+
+    Returns:
+        A tuple with the number of created, updated and deleted rows.
+
+    """
+    vulnerable = vulnerable_tag_stats()
+    indexed = DeviceVulnerability.objects.all()
+    if device_ids is not None:
+        vulnerable = vulnerable.filter(device__in=device_ids)
+        indexed = indexed.filter(device__in=device_ids)
+    if tag_ids is not None:
+        vulnerable = vulnerable.filter(tag__in=tag_ids)
+        indexed = indexed.filter(tag__in=tag_ids)
+    if version_ids is not None:
+        vulnerable = vulnerable.filter(tag__version__in=version_ids)
+        indexed = indexed.filter(tag__version__in=version_ids)
+
+    expected = dict((pk, (device_id, tag_id, not inactive)) for pk, device_id, tag_id, inactive
+                    in vulnerable.values_list('pk', 'device_id', 'tag_id', 'device__inactive'))
+    indexed_rows = list(indexed.values_list('tag_stats_id', 'active', 'device'))
+    current = dict((pk, active) for pk, active, _ in indexed_rows)
+
+    stale = [pk for pk in current if pk not in expected]
+    DeviceVulnerability.objects.filter(tag_stats__in=stale).delete()
+
+    updated = 0
+    for active in (True, False):
+        changed = [pk for pk, (_, _, expected_active) in expected.items()
+                   if expected_active == active and current.get(pk, active) != active]
+        updated += DeviceVulnerability.objects.filter(tag_stats__in=changed).update(active=active)
+
+    missing = [DeviceVulnerability(tag_stats_id=pk, device_id=device_id, tag_id=tag_id, active=active)
+               for pk, (device_id, tag_id, active) in expected.items() if pk not in current]
+    DeviceVulnerability.objects.bulk_create(missing)
+
+    # Update the vulnerable counts of the devices with added or removed rows
+    changed_devices = set(device_id for pk, _, device_id in indexed_rows if pk not in expected)
+    changed_devices.update(vulnerability.device_id for vulnerability in missing)
+    counters.update(changed_devices)
+    return len(missing), updated, len(stale)
+
+
+def rebuild():
+    """
+    Rebuild the whole index.
+
+    Returns:
+        The number of rows.
+
+    """
+    DeviceVulnerability.objects.all().delete()
+    refresh()
+    return DeviceVulnerability.objects.count()
+
+
+# Signal handlers
+
+def tag_stats_saved(sender, instance, **kwargs):
+    """
+    Sync the index row of saved tag stats.
+    """
+    inactive = None
+    if instance.first_installed_id is not None and instance.last_deleted_id is None:
+        inactive = vulnerable_tag_stats().filter(pk=instance.pk) \
+                                         .values_list('device__inactive', flat=True).first()
+    if inactive is None:
+        DeviceVulnerability.objects.filter(tag_stats=instance.pk).delete()
+    elif not DeviceVulnerability.objects.filter(tag_stats=instance.pk).exists():
+        DeviceVulnerability.objects.create(tag_stats=instance, device_id=instance.device_id,
+                                           tag_id=instance.tag_id, active=not inactive)
+
+
+def version_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Refresh the rows of the tags of a version whose security flag changed.
+    """
+    if not raw and getattr(instance, 'security_changed', False):
+        refresh(version_ids=[instance.pk])
+
+
+def tag_pre_save(sender, instance, raw=False, **kwargs):
+    """
+    Remember whether the version of an existing tag changes.
+    """
+    instance._version_changed = False
+    if instance.pk is not None and not raw:
+        old = sender.objects.filter(pk=instance.pk).values_list('version', flat=True).first()
+        instance._version_changed = old != instance.version_id
+
+
+def tag_saved(sender, instance, created, **kwargs):
+    """
+    Refresh the rows of a tag whose version changed.
+    """
+    if getattr(instance, '_version_changed', False):
+        refresh(tag_ids=[instance.pk])
+
+
+def device_saved(sender, instance, created, **kwargs):
+    """
+    Update the active flag of the rows of a device.
+    """
+    if not created:
+        active = not instance.inactive
+        DeviceVulnerability.objects.filter(device=instance.pk).exclude(active=active).update(active=active)
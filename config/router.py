@@ -31,7 +31,8 @@ class DBRouter(object):
         Routes migrations to appropriate database
         """
         meta_apps = app_label == 'auth' or app_label == 'admin' or \
-                    app_label == 'contenttypes' or app_label == 'sessions'
+                    app_label == 'contenttypes' or app_label == 'sessions' or \
+                    app_label == 'django_cache'
         if db == 'meta':
             return meta_apps
         else:
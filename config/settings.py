@@ -67,6 +67,37 @@ except (NoSectionError, NoOptionError):
     DATABASES['meta'] = dj_database_url.config(**kwargs)
 DATABASE_ROUTERS = ['config.router.DBRouter']
 
+# Substring search indexes (see apps/core/search.py)
+try:
+    USE_SEARCH_INDEX = config.getboolean('db', 'USE_SEARCH_INDEX')
+except (NoSectionError, NoOptionError):
+    USE_SEARCH_INDEX = True
+
+# Cache (used for the effective enforcements of the devices, see
+# apps/devices/cache.py). The default database cache is shared by all
+# processes, its table is created with `./manage.py createcachetable`.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    },
+}
+try:
+    CACHES['default']['BACKEND'] = config.get('cache', 'BACKEND')
+    CACHES['default']['LOCATION'] = config.get('cache', 'LOCATION')
+except (NoSectionError, NoOptionError):
+    pass
+
+# API page sizes (see apps/api/pagination.py)
+try:
+    API_PAGE_SIZE = config.getint('api', 'PAGE_SIZE')
+except (NoSectionError, NoOptionError):
+    API_PAGE_SIZE = 100
+try:
+    API_MAX_PAGE_SIZE = config.getint('api', 'MAX_PAGE_SIZE')
+except (NoSectionError, NoOptionError):
+    API_MAX_PAGE_SIZE = 1000
+
 # Auth URLs
 LOGIN_URL = '/login'
 
@@ -305,7 +336,7 @@ DEBUG_TOOLBAR_CONFIG = {
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'djangorestframework_camel_case.render.CamelCaseJSONRenderer',
+        'apps.api.renderers.CamelCaseJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
@@ -325,6 +356,8 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
     'DEFAULT_MODEL_SERIALIZER_CLASS': 'rest_framework.serializers.HyperlinkedModelSerializer',
+    'DEFAULT_PAGINATION_CLASS': 'apps.api.pagination.CursorPagination',
+    'PAGE_SIZE': API_PAGE_SIZE,
     'URL_FIELD_NAME': 'uri',
 }
 
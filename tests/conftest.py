@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.core.cache import cache
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_cache(request):
+    """
+    The test databases are flushed without sending signals, don't let cached
+    values leak into the next test. The cache is stored in the database, so
+    it's only cleared for tests with database access.
+    """
+    db_fixture = next((name for name in ('transactional_db', 'db') if name in request.fixturenames), None)
+    marker = request.node.get_closest_marker('django_db')
+    if db_fixture is None and marker is None:
+        yield
+        return
+    if db_fixture is None:
+        db_fixture = 'transactional_db' if marker.kwargs.get('transaction') else 'db'
+    request.getfixturevalue(db_fixture)
+    cache.clear()
+    yield
+    cache.clear()
@@ -12,8 +12,15 @@ from django.utils import timezone
 import pytest
 from model_bakery import baker
 
-from apps.core.models import Session
+from apps.core import search
+from apps.core.models import Session, Identity
+from apps.devices.models import Device, Group, Product
 from apps.filesystem.models import File, Directory
+from apps.front.ajax import paging_conf_dict
+from apps.packages.models import Package, Version
+from apps.policies.models import Policy, Enforcement
+from apps.swid import utils as swid_utils
+from apps.swid.models import Tag, TagStats, Entity, EntityRole, Event
 
 
 ### Helper functions ###
@@ -80,8 +87,21 @@ def sessions_test_data(transactional_db):
     baker.make(Session, id=4, time=now - timedelta(days=3), device__id=1)
 
 
+@pytest.fixture(params=[False, True], ids=['like', 'index'])
+def search_index(request, transactional_db):
+    """
+    Run the test once with LIKE queries and once with installed search indexes.
+    """
+    if request.param:
+        search.install_indexes()
+        yield True
+        search.drop_indexes()
+    else:
+        yield False
+
+
 @pytest.fixture
-def get_completions(client, files_and_directories_test_data):
+def get_completions(client, files_and_directories_test_data, search_index):
     """
     Fixture that provides a parametrized function that queries the
     autocompletion AJAX endpoint. That function, when called with a search
@@ -146,3 +166,147 @@ def test_files_autocomplete(get_completions, search_term, expected):
 def test_directory_autocomplete(get_completions, search_term, expected):
     results = get_completions(search_term, '/directories/autocomplete', 'directory')
     assert sorted(results) == sorted(expected)
+
+
+### Search Index Tests ###
+
+def test_search_index_lookup(files_and_directories_test_data, search_index):
+    q = search.contains(File, 'directory__path', 'usr/b')
+    sql = str(File.objects.filter(q).query)
+    assert ('search_directories_path' in sql) is search_index
+    assert sorted(File.objects.filter(q).values_list('name', flat=True)) == ['2to3', 'alsamixer']
+
+    # Search terms shorter than a trigram are not looked up in the index
+    assert 'search_' not in str(File.objects.filter(search.contains(File, 'name', 'sh')).query)
+
+
+def test_search_index_sync(files_and_directories_test_data, search_index):
+    directory = Directory.objects.get(path='/usr/lib')
+    directory.path = '/usr/lib64'
+    directory.save()
+    Directory.objects.create(path='/opt/lib64')
+    Directory.objects.filter(path='/usr/lib64').delete()
+    dirs = Directory.objects.filter(search.contains(Directory, 'path', 'LIB64'))
+    assert list(dirs.values_list('path', flat=True)) == ['/opt/lib64']
+
+
+def test_search_index_changes(get_completions, search_index):
+    assert get_completions('/bin/ba', '/files/autocomplete', 'file') == ['/bin/bash']
+
+    # Indexes dropped or installed by another process (without clearing the
+    # cache of this one) are noticed by the next request
+    for model, field_name in search.get_indexes():
+        backend = search.get_backend(model)
+        if search_index:
+            backend.drop(model, field_name)
+        else:
+            backend.install(model, field_name)
+    assert get_completions('/bin/ba', '/files/autocomplete', 'file') == ['/bin/bash']
+    assert search.get_backend(File).is_installed(File, 'name') is not search_index
+
+    if not search_index:
+        search.drop_indexes()
+
+
+### Paging Query Budget Tests ###
+
+# Maximum number of queries on the default database per rendered page,
+# every registered paging config needs an entry here.
+PAGING_QUERY_BUDGETS = {
+    'regid_list_config': 2,
+    'regid_detail_config': 2,
+    'swid_list_config': 2,
+    'dir_list_config': 2,
+    'file_list_config': 2,
+    'policy_list_config': 2,
+    'enforcement_list_config': 2,
+    'package_list_config': 2,
+    'device_list_config': 2,
+    'product_list_config': 2,
+    'device_session_list_config': 3,
+    'device_event_list_config': 3,
+    'device_vulnerability_list_config': 4,
+    'swid_inventory_list_config': 4,
+    'swid_log_list_config': 2,
+    'swid_inventory_session_list_config': 2,
+    'dir_file_list_config': 2,
+    'swid_files_list_config': 2,
+    'product_devices_list_config': 2,
+    'swid_devices_list_config': 2,
+    'tpm_devices_list_config': 2,
+    'vulnerability_list_config': 2,
+}
+
+
+@pytest.fixture
+def paging_test_data(transactional_db):
+    """
+    Create a few rows for every paged list, so that a query per row would
+    exceed the query budget of the config.
+    """
+    now = timezone.now()
+    product = baker.make(Product, name='Debian 7.4')
+    device = baker.make(Device, value='abc', description='Test Device', product=product)
+    baker.make(Device, value='def', description='Other Device', product=product)
+    identity = baker.make(Identity, data='tester')
+    groups = [baker.make(Group, name='group%i' % i) for i in range(3)]
+    policies = [baker.make(Policy, name='policy%i' % i) for i in range(3)]
+    for group, policy in zip(groups, policies):
+        baker.make(Enforcement, group=group, policy=policy, max_age=60)
+    sessions = [baker.make(Session, device=device, identity=identity,
+                           time=now - timedelta(hours=3 - i)) for i in range(3)]
+    directory = baker.make(Directory, path='/usr/bin')
+    files = [baker.make(File, directory=directory, name='file%i' % i) for i in range(3)]
+    entity = baker.make(Entity, regid='strongswan.org')
+    tags = []
+    for i in range(3):
+        package = baker.make(Package, name='package%i' % i)
+        version = baker.make(Version, package=package, product=product, release='1.%i' % i,
+                             security=True)
+        tag = baker.make(Tag, unique_id='tag%i' % i, package_name=package.name, version=version,
+                         software_id='strongswan.org__tag%i' % i)
+        baker.make(EntityRole, tag=tag, entity=entity, role=EntityRole.TAG_CREATOR)
+        tag.files.add(*files)
+        event = baker.make(Event, device=device, eid=i, epoch=1, timestamp=now)
+        baker.make(TagStats, tag=tag, device=device, first_seen=sessions[0],
+                   last_seen=sessions[-1], first_installed=event, last_deleted=None)
+        tags.append(tag)
+    for i, session in enumerate(sessions):
+        session.tag_set.add(*tags[:i + 1])
+        swid_utils.update_tag_changes(session)
+
+    timestamp = int(calendar.timegm(now.utctimetuple()))
+    range_args = {'device_id': device.pk, 'from_timestamp': timestamp, 'to_timestamp': timestamp}
+    return {
+        'regid_detail_config': {'entity_id': entity.pk},
+        'device_session_list_config': {'device_id': device.pk},
+        'device_event_list_config': {'device_id': device.pk},
+        'device_vulnerability_list_config': {'device_id': device.pk},
+        'swid_inventory_list_config': {'session_id': sessions[-1].pk},
+        'swid_log_list_config': range_args,
+        'swid_inventory_session_list_config': range_args,
+        'dir_file_list_config': {'directory_id': directory.pk},
+        'swid_files_list_config': {'tag_id': tags[0].pk},
+        'product_devices_list_config': {'product_id': product.pk},
+        'swid_devices_list_config': {'tag_id': tags[0].pk},
+    }
+
+
+def test_paging_query_budgets_declared():
+    assert sorted(PAGING_QUERY_BUDGETS.keys()) == sorted(paging_conf_dict.keys())
+
+
+@pytest.mark.parametrize('config_name', sorted(PAGING_QUERY_BUDGETS.keys()))
+def test_paging_query_budget(client, paging_test_data, django_assert_max_num_queries,
+                             config_name):
+    payload = {
+        'config_name': config_name,
+        'current_page': 0,
+        'filter_query': '',
+        'pager_id': 0,
+        'producer_args': json.dumps(paging_test_data.get(config_name)),
+    }
+    # Only queries to the default database are counted, the login is not
+    with django_assert_max_num_queries(PAGING_QUERY_BUDGETS[config_name]):
+        response_data = ajax_request(client, '/paging', payload)
+    assert response_data['page_count'] == 1
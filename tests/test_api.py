@@ -1,26 +1,39 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division, absolute_import, unicode_literals
 
+import gzip
 import json
 import random
 import string
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
 
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.db import connection
 from django.db.utils import OperationalError
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
+from django.utils.translation import gettext_lazy
 
 import pytest
+import pytz
+from djangorestframework_camel_case.render import CamelCaseJSONRenderer as LibraryCamelCaseJSONRenderer
 from model_bakery import baker
 from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from rest_framework import status
 
 from .test_swid import swidtag  # NOQA
+from apps.api import export, pagination, renderers
 from apps.authentication.permissions import GlobalPermission
-from apps.swid import utils
+from apps.devices.models import Device, Group
+from apps.packages.models import Version
+from apps.policies.models import Policy
+from apps.swid import api_views, utils
 from apps.swid.api_views import SwidMeasurementView
-from apps.swid.models import Tag
-from apps.core.models import Session
+from apps.swid.models import EntityRole, Event, Tag, TagChange, TagEvent, TagStats
+from apps.core.models import Result, Session
 
 
 @pytest.fixture
@@ -101,6 +114,7 @@ class TestApiAuth(object):
 @pytest.mark.parametrize(['url', 'list_name'], [
     (reverse('session-swid-measurement', args=[1]), 'software IDs'),
     (reverse('swid-add-tags'), 'SWID tags'),
+    (reverse('swid-resolve'), 'software IDs'),
 ])
 def test_data_param_validation(api_client, session, url, list_name):
 
@@ -164,6 +178,8 @@ def test_swid_measurement_diff(api_client, session, swidtag, filename):
     assert response.status_code == status.HTTP_200_OK
     assert len(response.data) == 0
     assert session.tag_set.count() == 2
+    assert session.tag_changes.filter(action=TagChange.ADDED).count() == 2
+    assert session.device.counters.session_count == 1
 
 
 @pytest.mark.django_db
@@ -235,20 +251,20 @@ def test_limit_fields(api_client):
 
     # Unfiltered list
     r = api_client.get(reverse('tag-list'))
-    data = json.loads(r.content)
+    data = json.loads(r.content)['results']
     assert len(data) == 5
     assert len(data[0].keys()) == 10
 
     # Filter some fields
     r = api_client.get(reverse('tag-list'), data={'fields': 'package_name,id,uri'})
-    data = json.loads(r.content)
+    data = json.loads(r.content)['results']
     assert len(data) == 5
     assert len(data[0].keys()) == 3
     assert sorted(data[0].keys()) == ['id', 'packageName', 'uri']
 
     # Some invalid fields
     r = api_client.get(reverse('tag-list'), data={'fields': 'id,spam'})
-    data = json.loads(r.content)
+    data = json.loads(r.content)['results']
     assert len(data) == 5
     assert len(data[0].keys()) == 1
     assert list(data[0].keys()) == ['id']
@@ -265,6 +281,298 @@ def test_limit_fields(api_client):
     assert len(data.keys()) == 0
 
 
+@pytest.mark.parametrize('list_url, param', [
+    (reverse('tag-list'), 'page_size'),
+    (reverse('policy-list'), 'limit'),
+])
+def test_pagination(api_client, monkeypatch, list_url, param):
+    baker.make(Tag, _quantity=5)
+    baker.make(Policy, _quantity=5)
+
+    # Walk all pages
+    ids = []
+    data = json.loads(api_client.get(list_url, data={param: 2}).content)
+    while True:
+        assert len(data['results']) <= 2
+        ids.extend(item['id'] for item in data['results'])
+        if not data['next']:
+            break
+        data = json.loads(api_client.get(data['next']).content)
+    assert ids == sorted(ids)
+    assert len(ids) == 5
+
+    # The page size is limited
+    monkeypatch.setattr(pagination.CursorPagination, 'max_page_size', 3)
+    monkeypatch.setattr(pagination.LimitOffsetPagination, 'max_limit', 3)
+    data = json.loads(api_client.get(list_url, data={param: 4}).content)
+    assert len(data['results']) == 3
+
+
+def test_cursor_pagination_offset(api_client):
+    """
+    Offsets are only supported by the lists of small tables.
+    """
+    baker.make(Tag, _quantity=5)
+    data = json.loads(api_client.get(reverse('tag-list'), data={'offset': 3}).content)
+    assert len(data['results']) == 5
+    assert 'count' not in data
+
+    baker.make(Policy, _quantity=5)
+    data = json.loads(api_client.get(reverse('policy-list'), data={'offset': 3}).content)
+    assert len(data['results']) == 2
+    assert data['count'] == 5
+
+
+def test_query_shaping(api_client, django_assert_max_num_queries):
+    for i in range(3):
+        tag = baker.make(Tag, unique_id='tag%d' % i, swid_xml='<SoftwareIdentity/>')
+        baker.make(EntityRole, tag=tag, entity__regid='regid%d' % i, role=EntityRole.LICENSOR)
+        baker.make(Session, time=timezone.now(), identity__data='tester%d' % i)
+
+    # Requested fields only: Neither the XML nor the entities are read
+    with CaptureQueriesContext(connection) as queries:
+        r = api_client.get(reverse('tag-list'), data={'fields': 'id,softwareId'})
+    data = json.loads(r.content)['results']
+    assert sorted(data[0].keys()) == ['id', 'softwareId']
+    sql = ' '.join(q['sql'] for q in queries.captured_queries)
+    assert 'swid_xml' not in sql
+    assert 'entity' not in sql
+
+    # Nested lists are prefetched
+    with django_assert_max_num_queries(3):
+        r = api_client.get(reverse('tag-list'))
+    data = json.loads(r.content)['results']
+    assert len(data) == 3
+    assert all(len(tag['entities']) == 1 for tag in data)
+
+    # Nested objects are selected
+    with django_assert_max_num_queries(1):
+        r = api_client.get(reverse('session-list'))
+    data = json.loads(r.content)['results']
+    assert sorted(s['identity']['data'] for s in data) == ['tester0', 'tester1', 'tester2']
+    with django_assert_max_num_queries(1):
+        r = api_client.get(reverse('session-list'), data={'fields': 'id,device'})
+    data = json.loads(r.content)['results']
+    assert sorted(data[0].keys()) == ['device', 'id']
+
+    # Nested objects of nested objects
+    for session in Session.objects.all():
+        baker.make(Result, session=session, policy__name='policy%d' % session.pk)
+    with django_assert_max_num_queries(1):
+        r = api_client.get(reverse('result-list'), data={'fields': 'session,result'})
+    data = json.loads(r.content)['results']
+    assert len(data) == 3
+    assert sorted(data[0]['session'].keys()) == sorted(['id', 'uri', 'time', 'identity', 'connectionId',
+                                                        'device', 'recommendation'])
+
+
+def test_export(api_client, django_assert_max_num_queries, monkeypatch):
+    monkeypatch.setattr(export, 'CHUNK_SIZE', 2)
+    tags = [baker.make(Tag, unique_id='tag%d' % i, package_name='strongswan' if i % 2 else 'openssl',
+                       swid_xml='<SoftwareIdentity/>') for i in range(5)]
+    session = baker.make(Session, time=datetime(2020, 5, 1, 12, tzinfo=pytz.utc), recommendation=0,
+                         identity__data='tester')
+
+    # NDJSON, filtered like the list
+    with django_assert_max_num_queries(2):
+        r = api_client.get(reverse('tag-export'), data={'package_name': 'strongswan'})
+        content = b''.join(r.streaming_content).decode('utf-8')
+    assert r['Content-Type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in content.splitlines()]
+    assert [row['unique_id'] for row in rows] == ['tag1', 'tag3']
+    assert rows[0] == {'id': tags[1].pk, 'package_name': 'strongswan', 'version_str': tags[1].version_str,
+                       'version': None, 'unique_id': 'tag1', 'swid_xml': '<SoftwareIdentity/>',
+                       'software_id': tags[1].software_id, 'modified': rows[0]['modified']}
+
+    # CSV
+    r = api_client.get(reverse('session-export'), data={'output': 'csv'})
+    content = b''.join(r.streaming_content).decode('utf-8')
+    assert r['Content-Type'] == 'text/csv'
+    assert content.splitlines() == [
+        'id,time,connection_id,identity,device,recommendation',
+        '%d,2020-05-01T12:00:00+00:00,%d,%d,%d,0' % (session.pk, session.connection_id, session.identity_id,
+                                                      session.device_id),
+    ]
+
+    # Compressed
+    r = api_client.get(reverse('tag-export'), data={'gzip': '1'})
+    assert r['Content-Type'] == 'application/gzip'
+    assert r['Content-Disposition'] == 'attachment; filename="tag.ndjson.gz"'
+    content = gzip.decompress(b''.join(r.streaming_content)).decode('utf-8')
+    assert len(content.splitlines()) == 5
+
+    r = api_client.get(reverse('tag-export'), data={'output': 'xml'})
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_conditional_get(api_client, django_assert_num_queries):
+    tag = baker.make(Tag, unique_id='tag', swid_xml='<SoftwareIdentity/>')
+    url = reverse('tag-detail', args=[tag.pk])
+    r = api_client.get(url)
+    assert r.status_code == status.HTTP_200_OK
+    etag = r['ETag']
+    last_modified = r['Last-Modified']
+
+    # Unchanged: A single lookup
+    with django_assert_num_queries(1):
+        r = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == status.HTTP_304_NOT_MODIFIED
+    assert r['ETag'] == etag
+    r = api_client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+    assert r.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Other fields or formats are different representations
+    r = api_client.get(url, data={'fields': 'id'}, HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == status.HTTP_200_OK
+    r = api_client.get(reverse('tag-xml', args=[tag.pk]), HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == status.HTTP_200_OK
+    assert r.content == b'<SoftwareIdentity/>'
+    with django_assert_num_queries(1):
+        r = api_client.get(reverse('tag-xml', args=[tag.pk]), HTTP_IF_NONE_MATCH=r['ETag'])
+    assert r.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # A new event changes the tag
+    baker.make(TagEvent, tag=tag, event__device__value='device', event__epoch=1, event__eid=1,
+               event__timestamp=timezone.now(), action=TagEvent.CREATION)
+    r = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == status.HTTP_200_OK
+    assert len(json.loads(r.content)['events']) == 1
+
+    # Missing objects
+    r = api_client.get(reverse('tag-detail', args=[tag.pk + 1]), HTTP_IF_NONE_MATCH=etag)
+    assert r.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_resolve_software_ids(api_client, django_assert_max_num_queries, monkeypatch):
+    version = baker.make(Version, package__name='strongswan', release='5.9', security=True,
+                         time=timezone.now())
+    known = baker.make(Tag, software_id='strongswan.org__strongSwan-5-9', version_str='5.9',
+                       version=version, unique_id='tag1', swid_xml='<SoftwareIdentity/>')
+    other = baker.make(Tag, software_id='regid.2004-03.org.strongswan__cowsay', version_str='3.03',
+                       unique_id='tag2', swid_xml='<SoftwareIdentity/>')
+    data = {'data': [other.software_id, 'unknown__id', known.software_id, other.software_id]}
+    with django_assert_max_num_queries(1):
+        r = api_client.post(reverse('swid-resolve'), data, format='json')
+    assert r.status_code == status.HTTP_200_OK
+    assert json.loads(r.content) == {
+        'known': [
+            {'softwareId': other.software_id, 'id': other.pk, 'versionStr': '3.03',
+             'version': None, 'security': None},
+            {'softwareId': known.software_id, 'id': known.pk, 'versionStr': '5.9',
+             'version': version.pk, 'security': True},
+        ],
+        'unknown': ['unknown__id'],
+    }
+
+    monkeypatch.setattr(api_views, 'MAX_RESOLVE_IDS', 2)
+    r = api_client.post(reverse('swid-resolve'), data, format='json')
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize('accepted_media_type', [None, 'application/json; indent=4'])
+def test_camel_case_renderer(accepted_media_type):
+    data = OrderedDict([
+        ('next', None),
+        ('results', [OrderedDict([
+            ('software_id', 'regid.2004-03.org.strongswan__strongSwan'),
+            ('unique_id', '\u00fc\u2028"\\'),
+            ('package_name_2', gettext_lazy('lazy_text')),
+            ('is_security', True),
+            ('time', datetime(2020, 1, 2, 3, 4, 5, 678901, tzinfo=pytz.utc)),
+            ('size', Decimal('1.50')),
+            ('ratio', 0.1),
+            ('files', ({'file_name': 'a_b', 1: 'one', None: 'none', 2.5: 'float'},)),
+            ('changes', set()),
+        ])]),
+    ])
+    expected = LibraryCamelCaseJSONRenderer().render(data, accepted_media_type)
+    assert renderers.CamelCaseJSONRenderer().render(data, accepted_media_type) == expected
+    assert renderers.CamelCaseJSONRenderer().render(None) == b''
+
+    with pytest.raises(ValueError):
+        renderers.CamelCaseJSONRenderer().render({'value': float('nan')})
+
+
+def test_bulk_devices(api_client, django_assert_max_num_queries):
+    default = baker.make(Group, name='Default')
+    laptops = baker.make(Group, name='Laptops')
+    existing = baker.make(Device, value='abc123', description='old', product__name='Debian 10')
+    existing.groups.add(default)
+    android = baker.make(Device, value='abc123', description='phone', product__name='Android 11')
+    url = reverse('device-bulk')
+
+    data = {'data': [
+        {'value': 'ABC123', 'product': 'Debian 10', 'description': 'Laptop', 'groups': ['Laptops']},
+        {'value': 'def456', 'product': 'Debian 10', 'trusted': True, 'groups': ['Default', 'Laptops']},
+        {'value': 'fed789', 'product': 'Android 12'},
+        {'value': 'abc123', 'product': 'Android 12'},
+    ]}
+    with django_assert_max_num_queries(20):
+        r = api_client.post(url, data, format='json')
+    assert r.status_code == status.HTTP_200_OK
+    results = json.loads(r.content)['results']
+    assert [(item['value'], item['product'], item['status']) for item in results] == [
+        ('abc123', 'Debian 10', 'updated'), ('def456', 'Debian 10', 'created'),
+        ('fed789', 'Android 12', 'created'), ('abc123', 'Android 12', 'created')]
+
+    existing.refresh_from_db()
+    assert existing.description == 'Laptop'
+    assert set(existing.groups.all()) == {laptops}
+    created = Device.objects.get(value='def456')
+    assert created.pk == results[1]['id']
+    assert created.trusted and created.created is not None
+    assert created.product == existing.product
+    assert set(created.groups.all()) == {default, laptops}
+    assert Device.objects.get(value='fed789').product.name == 'Android 12'
+    # A device with another product is a new device
+    assert results[3]['id'] not in (existing.pk, android.pk)
+    android.refresh_from_db()
+    assert (android.product.name, android.description) == ('Android 11', 'phone')
+
+    # Resubmitting the batch changes nothing
+    r = api_client.post(url, data, format='json')
+    assert [item['status'] for item in json.loads(r.content)['results']] == ['unchanged'] * 4
+
+    # An invalid item rejects the whole batch
+    data = {'data': [
+        {'value': 'abc123', 'product': 'Debian 10', 'description': 'Changed'},
+        {'value': 'cafe', 'product': 'Debian 10', 'groups': ['Servers']},
+        {'value': 'xyz'},
+    ]}
+    r = api_client.post(url, data, format='json')
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+    assert json.loads(r.content)['errors'][2].keys() == {'value', 'product'}
+    data['data'][2] = {'value': 'ABC123', 'product': 'Debian 10'}
+    r = api_client.post(url, data, format='json')
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+    errors = json.loads(r.content)['errors']
+    assert errors[0] == {}
+    assert errors[1].keys() == {'groups'}
+    assert errors[2] == {'value': ['Duplicate of item 0.']}
+    assert Device.objects.get(value='abc123', product=existing.product).description == 'Laptop'
+    assert not Device.objects.filter(value='cafe').exists()
+
+
+def test_bulk_devices_vulnerabilities(api_client):
+    device = baker.make(Device, value='abc', inactive=False, product__name='Debian 10')
+    session = baker.make(Session, device=device, time=timezone.now(), identity__data='tester')
+    event = baker.make(Event, device=device, eid=1, epoch=1, timestamp=timezone.now())
+    baker.make(TagStats, tag=baker.make(Tag, version=baker.make(Version, security=True)), device=device,
+               first_seen=session, last_seen=session, first_installed=event, last_deleted=None)
+    url = reverse('device-bulk')
+
+    def active():
+        return list(device.get_vulnerabilities().values_list('active', flat=True))
+
+    assert active() == [True]
+    r = api_client.post(url, {'data': [{'value': 'abc', 'product': 'Debian 10', 'inactive': True}]}, format='json')
+    assert r.status_code == status.HTTP_200_OK
+    assert active() == [False]
+    r = api_client.post(url, {'data': [{'value': 'abc', 'product': 'Debian 10', 'inactive': False}]}, format='json')
+    assert r.status_code == status.HTTP_200_OK
+    assert active() == [True]
+
+
 @pytest.mark.django_db
 def test_large_measurement(api_factory):
     """
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for `core` app.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import gzip
+import json
+import os
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+import pytest
+from model_bakery import baker
+
+from apps.core import retention
+from apps.core.models import Result, Session, WorkItem
+from apps.devices.models import Device
+from apps.swid.models import Tag, TagChange, TagStats
+
+
+@pytest.fixture
+def old_sessions(transactional_db):
+    """
+    Create a device with a session per day of the last ten days, the tags
+    of the oldest and the sixth oldest session are referenced by tag stats.
+    """
+    now = timezone.now().replace(microsecond=0)
+    device = baker.make(Device, value='device')
+    sessions = [baker.make(Session, device=device, time=now - timedelta(days=9 - i, hours=1),
+                           identity__data='tester') for i in range(10)]
+    tag = baker.make(Tag, unique_id='tag')
+    for session in sessions:
+        session.tag_set.add(tag)
+        baker.make(Result, session=session, policy__name='policy%i' % session.pk)
+        baker.make(WorkItem, session=session, enforcement__policy__name='workitem%i' % session.pk,
+                   enforcement__group__name='group%i' % session.pk)
+    baker.make(TagChange, device=device, session=sessions[0], tag=tag, action=TagChange.ADDED)
+    baker.make(TagStats, device=device, tag=tag, first_seen=sessions[0], last_seen=sessions[5])
+    return sessions
+
+
+def test_retention_policy(old_sessions):
+    device_id = old_sessions[0].device_id
+
+    def prunable(policy):
+        return sorted(old_sessions.index(s) for s in policy.prunable_sessions(device_id))
+
+    # Sessions referenced by tag stats (0 and 5) are kept
+    assert prunable(retention.RetentionPolicy(keep_days=3)) == [1, 2, 3, 4, 6]
+    assert prunable(retention.RetentionPolicy(keep_sessions=6)) == [1, 2, 3]
+    assert prunable(retention.RetentionPolicy(keep_sessions=2, keep_days=5)) == [1, 2, 3, 4]
+    assert prunable(retention.RetentionPolicy(keep_sessions=7, keep_days=5)) == [1, 2]
+    assert prunable(retention.RetentionPolicy(keep_sessions=10)) == []
+    with pytest.raises(ValueError):
+        retention.RetentionPolicy()
+
+
+def test_prune(old_sessions, tmpdir):
+    device = old_sessions[0].device
+    call_command('prune', '--keep-days=3', '--dry-run')
+    assert Session.objects.count() == 10
+
+    call_command('prune', '--keep-days=3', '--chunk-size=2', '--archive=%s' % tmpdir)
+    assert sorted(old_sessions.index(s) for s in Session.objects.all()) == [0, 5, 7, 8, 9]
+    assert Result.objects.count() == WorkItem.objects.count() == 5
+    assert Tag.sessions.through.objects.count() == 5
+    assert TagChange.objects.count() == 1
+    assert TagStats.objects.count() == 1
+    assert device.counters.session_count == 5
+
+    archive, = tmpdir.listdir()
+    with gzip.open(str(archive), 'rt') as f:
+        rows = [json.loads(line) for line in f]
+    models = sorted(set(row['model'] for row in rows))
+    assert models == ['core.result', 'core.session', 'core.workitem', 'swid.tag_sessions']
+    assert len([row for row in rows if row['model'] == 'core.session']) == 5
+    assert len(rows) == 20
+
+    # Rolled back chunks are not archived
+    archive = retention.NdjsonArchive(str(tmpdir.join('rollback.ndjson.gz')))
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            retention.prune_chunk([old_sessions[0].pk], archive)
+            raise RuntimeError()
+    assert Session.objects.count() == 5
+    assert archive.count == 0 and not os.path.exists(archive.path)
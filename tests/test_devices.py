@@ -4,15 +4,27 @@ Tests for `swid` app.
 """
 from __future__ import print_function, division, absolute_import, unicode_literals
 
-from datetime import datetime
+from datetime import datetime, timedelta
 from calendar import timegm
 
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
 from django.utils.timezone import get_current_timezone, utc
 
+import pytest
 from model_bakery import baker
 
-from apps.core.models import Session
-from apps.devices.models import Device
+from apps.core.models import Session, Result, WorkItem
+from apps.core.types import Action
+from apps.devices import cache, counters
+from apps.devices.models import Device, DeviceCounters, Group, GroupClosure
+from apps.policies.models import Policy, Enforcement
+from apps.packages.models import Version
+from apps.swid import vulnerabilities
+from apps.swid.models import Event, Tag, TagStats
+
+from .fixtures import *  # NOQA: Star import is OK here because it's just a test
 
 
 def test_get_sessions_in_range(transactional_db):
@@ -42,3 +54,231 @@ def test_get_sessions_in_range(transactional_db):
     assert len(s4) == 4
     s5 = d.get_sessions_in_range(unix_timestamp(dt3), unix_timestamp(dt4))
     assert len(s5) == 4
+
+
+@pytest.fixture
+def group_tree(transactional_db):
+    root = Group.objects.create(name='root')
+    a = Group.objects.create(name='a', parent=root)
+    a1 = Group.objects.create(name='a1', parent=a)
+    a11 = Group.objects.create(name='a11', parent=a1)
+    b = Group.objects.create(name='b', parent=root)
+    return {'root': root, 'a': a, 'a1': a1, 'a11': a11, 'b': b}
+
+
+def closure():
+    return sorted(GroupClosure.objects.values_list('ancestor__name', 'descendant__name', 'depth'))
+
+
+def test_group_closure(group_tree):
+    a11 = group_tree['a11']
+    assert [g.name for g in a11.get_parents()] == ['a1', 'a', 'root']
+    assert [g.name for g in group_tree['root'].get_children()] == ['a', 'b', 'a1', 'a11']
+    assert group_tree['b'].get_children() == []
+
+    # Move subtree a1 below b
+    a1 = group_tree['a1']
+    a1.parent = group_tree['b']
+    a1.save()
+    assert [g.name for g in a11.get_parents()] == ['a1', 'b', 'root']
+    assert group_tree['a'].get_children() == []
+
+    # The closure table matches a rebuilt one
+    maintained = closure()
+    GroupClosure.rebuild()
+    assert closure() == maintained
+
+    # Moving a group below itself is rejected
+    root = group_tree['root']
+    root.parent = a11
+    with pytest.raises(ValueError):
+        root.save()
+
+    # Deleting a group removes its subtree
+    group_tree['b'].delete()
+    assert closure() == [('a', 'a', 0), ('root', 'a', 1), ('root', 'root', 0)]
+
+
+def test_device_group_set(group_tree, django_assert_num_queries):
+    device = baker.make(Device)
+    device.groups.add(group_tree['a11'], group_tree['b'])
+    with django_assert_num_queries(1):
+        groups = device.get_group_set()
+    assert sorted(g.name for g in groups) == ['a', 'a1', 'a11', 'b', 'root']
+    with django_assert_num_queries(1):
+        groups = device.get_inherit_set()
+    assert sorted(g.name for g in groups) == ['a', 'a1', 'root']
+
+
+def test_create_work_items(group_tree, django_assert_num_queries):
+    device = baker.make(Device)
+    device.groups.add(group_tree['a11'], group_tree['b'])
+    old_session = baker.make(Session, device=device, time=timezone.now() - timedelta(hours=2),
+                             identity__data='tester')
+    session = baker.make(Session, device=device, time=timezone.now(), identity__data='tester')
+
+    strict, recent, blocked, unrelated = [
+        baker.make(Policy, name=name, argument='/bin', fail=Action.BLOCK, noresult=Action.NONE)
+        for name in ('strict', 'recent', 'blocked', 'unrelated')]
+    # The enforcement with the smallest max_age of a policy applies
+    baker.make(Enforcement, policy=strict, group=group_tree['root'], max_age=3 * 3600, fail=Action.ISOLATE)
+    baker.make(Enforcement, policy=strict, group=group_tree['a1'], max_age=3600)
+    baker.make(Enforcement, policy=recent, group=group_tree['b'], max_age=3 * 3600)
+    baker.make(Enforcement, policy=blocked, group=group_tree['a'], max_age=3 * 3600)
+    baker.make(Enforcement, policy=unrelated, group=baker.make(Group, name='other'), max_age=1)
+
+    # Latest results are two hours old
+    baker.make(Result, session=old_session, policy=strict, recommendation=Action.ALLOW)
+    baker.make(Result, session=old_session, policy=recent, recommendation=Action.ALLOW)
+    baker.make(Result, session=old_session, policy=blocked, recommendation=Action.BLOCK)
+
+    # Enforcements, latest results, BEGIN and the bulk insert
+    with django_assert_num_queries(4):
+        device.create_work_items(session)
+
+    items = WorkItem.objects.filter(session=session).select_related('enforcement')
+    assert sorted((i.enforcement.policy_id, i.enforcement.max_age, i.fail) for i in items) == [
+        (strict.pk, 3600, Action.BLOCK),
+        (blocked.pk, 3 * 3600, Action.BLOCK),
+    ]
+
+    # The effective enforcements are cached
+    next_session = baker.make(Session, device=device, time=timezone.now(), identity__data='tester')
+    with django_assert_num_queries(3):
+        device.create_work_items(next_session)
+    assert WorkItem.objects.filter(session=next_session).count() == 2
+
+
+def test_enforcement_cache(group_tree, django_assert_num_queries):
+    device = baker.make(Device)
+    device.groups.add(group_tree['a1'])
+    policy = baker.make(Policy, name='policy')
+    baker.make(Enforcement, policy=policy, group=group_tree['root'], max_age=60)
+    cache.reset_stats()
+
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['root']
+    with django_assert_num_queries(0):
+        assert [e.group.name for e in cache.get_enforcements(device)] == ['root']
+    assert cache.get_stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+    # Enforcement changes invalidate all devices
+    baker.make(Enforcement, policy=policy, group=group_tree['a'], max_age=30)
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['a']
+
+    # Group membership changes (from both sides) invalidate the device
+    group_tree['a1'].devices.remove(device)
+    assert cache.get_enforcements(device) == []
+    device.groups.add(group_tree['a11'])
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['a']
+
+    # Moving a group invalidates all devices
+    group_tree['a11'].parent = group_tree['b']
+    group_tree['a11'].save()
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['root']
+    assert cache.get_stats()['misses'] == 5
+
+
+def test_enforcement_cache_process_local(group_tree, settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    assert not cache.is_shared()
+    device = baker.make(Device)
+    device.groups.add(group_tree['a1'])
+    policy = baker.make(Policy, name='policy')
+    enforcement = baker.make(Enforcement, policy=policy, group=group_tree['root'], max_age=60)
+
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['root']
+    # Changes of other processes don't invalidate a process-local cache,
+    # so nothing is cached
+    Enforcement.objects.filter(pk=enforcement.pk).update(group=group_tree['a'])
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['a']
+    assert cache.get_stats()['hits'] == 0
+
+
+def test_enforcement_cache_invalidated_on_commit(group_tree):
+    device = baker.make(Device)
+    device.groups.add(group_tree['a1'])
+    policy = baker.make(Policy, name='policy')
+    assert cache.get_enforcements(device) == []
+
+    generation = cache._generation()
+    with transaction.atomic():
+        baker.make(Enforcement, policy=policy, group=group_tree['root'], max_age=60)
+        # Other processes don't see the enforcement before the commit and
+        # must not cache the old set under a new generation
+        assert cache._generation() == generation
+    assert cache._generation() != generation
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['root']
+
+
+def test_enforcement_cache_without_table(group_tree, settings):
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                   'LOCATION': 'django_cache_missing'}}
+    device = baker.make(Device)
+    device.groups.add(group_tree['a1'])
+    baker.make(Enforcement, policy=baker.make(Policy, name='policy'), group=group_tree['root'], max_age=60)
+    assert [e.group.name for e in cache.get_enforcements(device)] == ['root']
+    cache.invalidate()
+
+
+@pytest.mark.parametrize('enforcement_count', [1, 3])
+def test_device_report(strongtnc_users, client, group_tree, django_assert_num_queries, enforcement_count):
+    device = baker.make(Device, value='abc')
+    device.groups.add(group_tree['a1'], group_tree['b'])
+    sessions = [baker.make(Session, device=device, time=timezone.now() - timedelta(hours=i),
+                           identity__data='user%i' % i) for i in range(3)]
+    for i in range(enforcement_count):
+        policy = baker.make(Policy, name='policy%i' % i)
+        baker.make(Enforcement, policy=policy, group=group_tree['root'], max_age=60)
+        baker.make(Result, session=sessions[1], policy=policy, recommendation=Action.ALLOW)
+    for i, security in enumerate((True, False, True)):
+        tag = baker.make(Tag, version__security=security)
+        event = baker.make(Event, device=device, eid=i, epoch=1, timestamp=timezone.now())
+        baker.make(TagStats, tag=tag, device=device, first_seen=sessions[0], last_seen=sessions[0],
+                   first_installed=event, last_deleted=None)
+    counters.update([device.pk])
+
+    client.login(username='readonly-user', password='readonly')
+    # Device with counts, groups, latest session, enforcements and latest results
+    with django_assert_num_queries(5):
+        response = client.get(reverse('devices:device_report', args=[device.pk]))
+    assert response.status_code == 200
+    assert response.context['session_count'] == 3
+    assert response.context['installed_count'] == 3
+    assert response.context['vulnerability_count'] == 2
+    assert response.context['last_user'] == 'user0'
+    assert [g.name for g in response.context['definition_set']] == ['a1', 'b']
+    assert [g.name for g in response.context['inherit_set']] == ['a', 'root']
+    assert [(e.max_age, rec, due) for e, rec, due in response.context['enforcements']] == \
+        [(60, 'Allow', True)] * enforcement_count
+
+
+def test_device_counters(transactional_db):
+    devices = [baker.make(Device, value='device%i' % i) for i in range(3)]
+    now = timezone.now().replace(microsecond=0)
+    sessions = [baker.make(Session, device=devices[0], time=now - timedelta(hours=i), identity__data='tester')
+                for i in range(2)]
+    event = baker.make(Event, device=devices[0], eid=1, epoch=1, timestamp=now)
+    for security in (True, False):
+        baker.make(TagStats, tag=baker.make(Tag, version__security=security), device=devices[0],
+                   first_seen=sessions[0], last_seen=sessions[0], first_installed=event, last_deleted=None)
+
+    assert devices[1].get_counters().installed_count == 0
+    assert len(counters.verify()) == 3
+    assert not DeviceCounters.objects.exists()
+
+    counters.update([devices[0].pk])
+    device_counters = DeviceCounters.objects.get(device=devices[0])
+    assert (device_counters.installed_count, device_counters.vulnerable_count,
+            device_counters.session_count, device_counters.last_session_time) == (2, 1, 2, now)
+
+    # Drift, e.g. sessions created by the strongSwan daemon
+    baker.make(Session, device=devices[1], time=now, identity__data='tester')
+    drifted = counters.verify(fix=True, chunk_size=2)
+    assert sorted(c.device_id for c in drifted) == [devices[1].pk, devices[2].pk]
+    assert DeviceCounters.objects.get(device=devices[1]).session_count == 1
+    assert counters.verify() == []
+
+    # Flipping the security flag of a version updates the vulnerable count
+    Version.objects.filter(security=False).update(security=True)
+    vulnerabilities.refresh()
+    assert DeviceCounters.objects.get(device=devices[0]).vulnerable_count == 2
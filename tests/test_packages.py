@@ -4,14 +4,29 @@ Tests for `packages` app.
 """
 from __future__ import print_function, division, absolute_import, unicode_literals
 
+import gzip
+import json
+from functools import cmp_to_key
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.urls import reverse
 from django.utils import timezone
 
 import pytest
 from model_bakery import baker
+from rest_framework.test import APIClient
 
+from apps.core.models import Session
+from apps.core.types import Action
+from apps.front import statistics
+from apps.packages import feeds, flags, versions
 from apps.packages.models import Version, Package
-from apps.devices.models import Product
+from apps.packages.versions import compare_dpkg
+from apps.devices.models import Device, Product
+from apps.swid.models import Event, Tag, TagStats
 
 from .fixtures import *  # NOQA: Star import is OK here because it's just a test
 
@@ -57,3 +72,252 @@ def test_save_version_validation(strongtnc_users, client, package_testdata):
     # Valid request
     response = client.post(url, data)
     assert response.status_code == 302
+
+
+@pytest.fixture
+def flags_testdata(transactional_db):
+    """
+    Create openssl and zlib versions on two products and a device with an
+    installed tag of one of the openssl versions.
+    """
+    debian, ubuntu = baker.make(Product, name='Debian 10'), baker.make(Product, name='Ubuntu 20.04')
+    openssl, zlib = baker.make(Package, name='openssl'), baker.make(Package, name='zlib')
+    versions = {}
+    for package, product, release in [(openssl, debian, '1.1.1d-0+deb10u6'), (openssl, debian, '1.1.1n-0+deb10u1'),
+                                      (openssl, ubuntu, '1.1.1f-1ubuntu2'), (zlib, debian, '1:1.2.11.dfsg-1')]:
+        versions[(package.name, product.name, release)] = baker.make(
+            Version, package=package, product=product, release=release, security=False, time=timezone.now())
+
+    device = baker.make(Device, product=debian, inactive=False)
+    session = baker.make(Session, device=device, time=timezone.now(), recommendation=Action.ALLOW,
+                         identity__data='tester')
+    event = baker.make(Event, device=device, eid=1, epoch=1, timestamp=timezone.now())
+    tag = baker.make(Tag, unique_id='openssl', version=versions[('openssl', 'Debian 10', '1.1.1d-0+deb10u6')])
+    baker.make(TagStats, tag=tag, device=device, first_seen=session, last_seen=session,
+               first_installed=event, last_deleted=None)
+    return versions, device
+
+
+def test_set_flags(flags_testdata):
+    versions, device = flags_testdata
+    statistics.refresh()
+
+    def flagged():
+        return sorted(Version.objects.filter(security=True).values_list('release', flat=True))
+
+    selectors = [{'package': 'openssl', 'product': 'Debian 10', 'release': '1.1.1d-0+deb10u6'},
+                 {'package': 'zlib', 'release': '1:1.2.11.dfsg-1'},
+                 {'package': 'openssl', 'product': 'Ubuntu 20.04', 'release': '1.1.1d-0+deb10u6'}]
+    assert flags.set_flags(selectors, security=True, dry_run=True) == {'matched': 2, 'security': 2,
+                                                                      'blacklist': 0}
+    assert flagged() == []
+    assert flags.set_flags(selectors, security=True) == {'matched': 2, 'security': 2, 'blacklist': 0}
+    assert flagged() == ['1.1.1d-0+deb10u6', '1:1.2.11.dfsg-1']
+    assert device.get_vulnerabilities().count() == 1
+    assert device.get_counters().vulnerable_count == 1
+    snapshot = statistics.get_snapshot()
+    assert (snapshot['secure'], snapshot['vulnerable']) == (2, 2)
+
+    # Patterns
+    result = flags.set_flags([{'package': 'openssl', 'release': '1.1.1*'}], security=False, blacklist=True)
+    assert result == {'matched': 3, 'security': 1, 'blacklist': 3}
+    assert flagged() == ['1:1.2.11.dfsg-1']
+    assert Version.objects.filter(blacklist=True).count() == 3
+    assert device.get_vulnerabilities().count() == 0
+    snapshot = statistics.get_snapshot()
+    assert (snapshot['secure'], snapshot['vulnerable']) == (3, 1)
+    assert flags.set_flags([{'package': 'open*', 'product': '*10', 'release': '1.1.1?'}], security=True) == \
+        {'matched': 0, 'security': 0, 'blacklist': 0}
+
+
+def test_set_flags_api_and_command(flags_testdata, tmpdir):
+    user = User.objects.create_user(username='api-test', password='api-test', is_staff=True)
+    client = APIClient()
+    client.force_authenticate(user=user)
+    url = reverse('version-flags')
+
+    data = {'data': [{'package': 'openssl', 'product': 'Debian 10'}], 'security': True}
+    r = client.post(url, data, format='json')
+    assert r.status_code == 200
+    assert json.loads(r.content) == {'matched': 2, 'security': 2, 'blacklist': 0}
+    assert client.post(url, {'data': data['data']}, format='json').status_code == 400
+    assert client.post(url, {'data': [{'release': '1.0'}], 'security': True}, format='json').status_code == 400
+
+    selectors = tmpdir.join('selectors.csv')
+    selectors.write('# package,product,release\nopenssl,,1.1.1f-1ubuntu2\nzlib\n')
+    out = StringIO()
+    call_command('setversionflags', '--blacklist', '--file', str(selectors), stdout=out)
+    assert 'Matched 2 versions' in out.getvalue()
+    assert sorted(Version.objects.filter(blacklist=True).values_list('package__name', flat=True)) == \
+        ['openssl', 'zlib']
+
+
+@pytest.mark.parametrize('a, b, result', [
+    ('1.0', '1.0', 0),
+    ('1.0-0', '1.0', 0),
+    ('1.10', '1.9', 1),
+    ('1.0~rc1', '1.0', -1),
+    ('1.0a', '1.0', 1),
+    ('1.0+b1', '1.0a', 1),
+    ('1:1.0', '2.0', 1),
+    ('1.1.1d-0+deb10u6', '1.1.1n-0+deb10u1', -1),
+    ('2.30-1~bpo10+1', '2.30-1', -1),
+])
+def test_compare_dpkg(a, b, result):
+    cmp = compare_dpkg(a, b)
+    assert (cmp > 0) - (cmp < 0) == result
+    cmp = compare_dpkg(b, a)
+    assert (cmp > 0) - (cmp < 0) == -result
+
+
+def test_json_object_reader(monkeypatch):
+    monkeypatch.setattr(feeds, 'READ_SIZE', 3)
+    data = {'openssl': {'CVE-1': {'releases': {}}}, 'zlib': [12345, 'x'], 'n': 123456}
+    f = StringIO(' ' + json.dumps(data, indent=2) + '\n')
+    assert dict(feeds.JSONObjectReader(f)) == data
+    with pytest.raises(ValueError):
+        list(feeds.JSONObjectReader(StringIO('[1, 2]')))
+
+
+def test_import_packages(transactional_db, tmpdir):
+    baker.make(Version, package__name='zlib', product__name='Debian 10', release='1:1.2.11.dfsg-1',
+               security=False, time=timezone.now())
+    index = tmpdir.join('Packages.gz')
+    with gzip.open(str(index), 'wt') as f:
+        f.write('Package: openssl\nVersion: 1.1.1d-0+deb10u6\nDescription: TLS\n toolkit\n\n'
+                'Package: openssl\nVersion: 1.1.1n-0+deb10u1\n\n'
+                'Package: zlib\nVersion: 1:1.2.11.dfsg-1\n\n'
+                'Package: libssl1.1\nSource: openssl\nVersion: 1.1.1n-0+deb10u1\n')
+    tracker = tmpdir.join('tracker.json')
+    tracker.write(json.dumps({
+        'openssl': {
+            'CVE-2021-3711': {'releases': {'buster': {'status': 'resolved', 'fixed_version': '1.1.1d-0+deb10u7'}}},
+            'CVE-2022-0778': {'releases': {'buster': {'status': 'resolved', 'fixed_version': '1.1.1n-0+deb10u1'},
+                                           'bullseye': {'status': 'resolved', 'fixed_version': '1.1.1n-0+deb11u1'}}},
+            'CVE-2099-0001': {'releases': {'buster': {'status': 'open', 'fixed_version': None}}},
+        },
+    }))
+    advisories = tmpdir.join('advisories.ndjson')
+    advisories.write('{"package": "zlib", "fixed_version": "1:1.2.11.dfsg-2"}\n\n')
+
+    out = StringIO()
+    call_command('importpackages', '--product', 'Debian 10', '--index', str(index), '--tracker', str(tracker),
+                 '--release', 'buster', '--advisories', str(advisories), '--batch-size', '2', stdout=out)
+    assert 'Created 2 packages and 3 versions, flagged 2 and unflagged 0 versions' in out.getvalue()
+    versions = Version.objects.filter(product__name='Debian 10')
+    assert sorted(versions.values_list('package__name', 'release', 'security')) == [
+        ('libssl1.1', '1.1.1n-0+deb10u1', False),
+        ('openssl', '1.1.1d-0+deb10u6', True),
+        ('openssl', '1.1.1n-0+deb10u1', False),
+        ('zlib', '1:1.2.11.dfsg-1', True),
+    ]
+    assert not versions.filter(sort_key=None).exists()
+
+    # Importing again changes nothing
+    out = StringIO()
+    call_command('importpackages', '--product', 'Debian 10', '--index', str(index), stdout=out)
+    assert 'Created 0 packages and 0 versions' in out.getvalue()
+
+
+@pytest.mark.parametrize('scheme, releases', [
+    (versions.DPKG, ['1.0~rc1', '1.0', '1.0-1', '1.0a', '1.0+b1', '1.9', '1.10', '1:0.9']),
+    (versions.RPM, ['1.0~rc1', '1.0', '1.0^git1', '1.0a', '1.0.1', '1.10', '1:0.9']),
+])
+def test_sort_key(scheme, releases):
+    keys = [versions.sort_key(release, scheme) for release in releases]
+    assert sorted(keys) == keys
+    assert len(set(keys)) == len(keys)
+    assert all(set(key) <= set(versions.ALPHABET) for key in keys)
+    assert versions.sort_key('1.' + '9' * 100) is None
+
+
+def unicode_ci(a, b):
+    """
+    Collation like ``utf8_unicode_ci`` of MySQL: case insensitive, other
+    characters ordered differently than by their code.
+    """
+    def weights(text):
+        return [(1, c.lower()) if c.isalnum() else (0, -ord(c)) for c in text]
+    a, b = weights(a), weights(b)
+    return (a > b) - (a < b)
+
+
+@pytest.mark.parametrize('collation', ['NOCASE', 'unicode_ci'])
+def test_sort_key_collation(transactional_db, collation):
+    connection.ensure_connection()
+    connection.connection.create_collation('unicode_ci', unicode_ci)
+    product, package = baker.make(Product, name='Debian 10'), baker.make(Package, name='openssl')
+    releases = ['1.0a', '1:0.9', '1.0', '1.10', '1.0A', '1.1234567890', '1.0~rc1', '1.0-1', '1.0+b1', '1.2']
+    for release in releases:
+        baker.make(Version, package=package, product=product, release=release, time=timezone.now())
+    expected = sorted(releases, key=cmp_to_key(compare_dpkg))
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT release FROM versions ORDER BY sort_key COLLATE %s' % collation)
+        assert [row[0] for row in cursor.fetchall()] == expected
+        cursor.execute('SELECT COUNT(*) FROM versions WHERE sort_key < %%s COLLATE %s' % collation,
+                       [versions.sort_key('1.2')])
+        assert cursor.fetchone()[0] == expected.index('1.2')
+
+
+def test_version_sort_keys(transactional_db):
+    debian, fedora = baker.make(Product, name='Debian 10'), baker.make(Product, name='Fedora 33')
+    package = baker.make(Package, name='openssl')
+    releases = ['1.1.1n-0+deb10u1', '1.1.1d-0+deb10u6', '1.1.1~rc1-1', '1.1.1-1']
+    for release in releases:
+        baker.make(Version, package=package, product=debian, release=release, time=timezone.now())
+    baker.make(Version, package=package, product=fedora, release='1.1.1k-1.fc33', time=timezone.now())
+
+    def older_than(release, product=debian):
+        key = versions.sort_key(release, versions.scheme_for(product.name))
+        return list(Version.objects.filter(product=product, package=package, sort_key__lt=key)
+                                   .order_by('sort_key').values_list('release', flat=True))
+
+    assert older_than('1.1.1n-0+deb10u1') == ['1.1.1~rc1-1', '1.1.1-1', '1.1.1d-0+deb10u6']
+    assert older_than('1.1.1l-1.fc33', fedora) == ['1.1.1k-1.fc33']
+
+    # Versions inserted without sort key (e.g. by strongSwan) are backfilled
+    Version.objects.update(sort_key=None)
+    out = StringIO()
+    call_command('updateversionkeys', '--batch-size', '2', stdout=out)
+    assert 'Updated the sort keys of 5 versions' in out.getvalue()
+    assert older_than('1.1.1d-0+deb10u6') == ['1.1.1~rc1-1', '1.1.1-1']
+    call_command('updateversionkeys', '--all', stdout=out)
+    assert 'Updated the sort keys of 0 versions' in out.getvalue()
+
+    user = User.objects.create_user(username='api-test', password='api-test', is_staff=True)
+    client = APIClient()
+    client.force_authenticate(user=user)
+    r = client.get(reverse('version-list'), {'older_than': '1.1.1-1', 'product': debian.pk})
+    assert [v['release'] for v in json.loads(r.content)['results']] == ['1.1.1~rc1-1']
+
+    # The API computes the missing keys of the filtered versions
+    Version.objects.filter(product=debian).update(sort_key=None)
+    r = client.get(reverse('version-list'), {'older_than': '1.1.1-1', 'product': debian.pk,
+                                             'package': package.pk})
+    assert [v['release'] for v in json.loads(r.content)['results']] == ['1.1.1~rc1-1']
+    assert not Version.objects.filter(sort_key=None).exists()
+
+
+def test_version_save_queries(transactional_db, django_assert_num_queries):
+    product = baker.make(Product, name='Fedora 33')
+    version = baker.make(Version, package__name='openssl', product=product, release='1.1.1k-1.fc33',
+                         time=timezone.now())
+
+    # The flag and sort key of a loaded version are known without querying
+    version = Version.objects.get(pk=version.pk)
+    with django_assert_num_queries(1):
+        version.save()
+    assert not version.security_changed
+    version.security = True
+    version.save()
+    assert version.security_changed
+    with django_assert_num_queries(1):
+        version.save()
+    assert not version.security_changed
+
+    version.release = '1.1.1l-1.fc33'
+    with django_assert_num_queries(2):
+        version.save(update_fields=['release'])
+    version.refresh_from_db()
+    assert version.sort_key == versions.sort_key('1.1.1l-1.fc33', versions.RPM)
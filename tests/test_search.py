@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the global search.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+from django.urls import reverse
+
+import pytest
+from model_bakery import baker
+
+from apps.devices.models import Device, Group
+from apps.filesystem.models import File, Directory
+from apps.front import search
+
+from .fixtures import *  # NOQA: Star import is OK here because it's just a test
+
+
+@pytest.fixture
+def search_testdata(transactional_db):
+    usr_bin = baker.make(Directory, path='/usr/bin')
+    baker.make(Directory, path='/etc/ssl')
+    for i in range(search.PAGE_SIZE + 2):
+        baker.make(File, name='libssl%02i' % i, directory=usr_bin)
+    baker.make(File, name='ssl-config', directory=usr_bin)
+    baker.make(Group, name='clients-ssl')
+    baker.make(Group, name='ssl-servers')
+    baker.make(Device, description='Laptop', value='abcdef', product__name='Debian')
+
+
+def test_search_ranking(search_testdata):
+    results = dict((r.category.name, r) for r in search.search('ssl'))
+    assert sorted(results.keys()) == ['files', 'groups']
+
+    # Prefix matches first
+    assert [g.name for g in results['groups'].hits] == ['ssl-servers', 'clients-ssl']
+    assert results['files'].hits[0].name == 'ssl-config'
+    assert results['groups'].has_more is False
+
+
+def test_search_pages(search_testdata):
+    first, = search.search('libssl', 'files')
+    assert len(first.hits) == search.PAGE_SIZE
+    assert first.has_more is True
+
+    second, = search.search('libssl', 'files', page=1)
+    assert [f.name for f in second.hits] == ['libssl10', 'libssl11']
+    assert second.has_more is False
+
+    assert search.search('libssl', 'groups') == []
+
+
+def test_search_view(strongtnc_users, client, search_testdata):
+    client.login(username='readonly-user', password='readonly')
+    url = reverse('front:search')
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.context['results'] == []
+
+    response = client.get(url, {'q': 'ssl'})
+    assert [r.category.name for r in response.context['results']] == ['groups', 'files']
+    assert b'Show more' in response.content
+
+    response = client.get(url, {'q': 'ssl', 'category': 'files', 'page': 'x'})
+    assert [r.category.name for r in response.context['results']] == ['files']
+    assert response.context['results'][0].page == 0
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the statistics snapshot.
+"""
+from __future__ import print_function, division, absolute_import, unicode_literals
+
+import json
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models.signals import post_save
+from django.urls import reverse
+from django.utils import timezone
+
+import pytest
+import pytz
+from model_bakery import baker
+
+from apps.core.models import Result, Session
+from apps.core.types import Action
+from apps.devices.models import Device, Group
+from apps.front import rollups, statistics
+from apps.front.models import SessionRollup
+from apps.packages.models import Package, Version
+from apps.policies.models import Policy
+from apps.swid import vulnerabilities
+
+from .fixtures import *  # NOQA: Star import is OK here because it's just a test
+
+
+@pytest.fixture
+def statistics_testdata(transactional_db):
+    device = baker.make(Device, value='abcdef', product__name='Debian')
+    baker.make(Device, value='123456', product=device.product)
+    for recommendation in (Action.ALLOW, Action.ALLOW, Action.BLOCK):
+        baker.make(Session, device=device, recommendation=recommendation, identity__data='tester',
+                   time=timezone.now())
+    package = baker.make(Package, name='libssl')
+    baker.make(Version, package=package, release='1.0', security=False, time=timezone.now())
+    baker.make(Version, package=package, release='1.1', security=True, time=timezone.now())
+
+
+def test_refresh(statistics_testdata):
+    assert statistics.get_snapshot() is None
+    refreshed = statistics.refresh()
+
+    snapshot = statistics.get_snapshot()
+    assert snapshot['refreshed'] == refreshed
+    assert snapshot['devices'] == 2
+    assert snapshot['sessions'] == 3
+    assert snapshot['versions'] == 2
+    assert snapshot['secure'] == 1
+    assert snapshot['vulnerable'] == 1
+    assert snapshot['OSranking'] == [{'name': 'Debian', 'num': 2}]
+    assert snapshot['rec_count_session'] == [
+        {'recommendation': Policy.action[Action.ALLOW], 'num': 2},
+        {'recommendation': Policy.action[Action.BLOCK], 'num': 1},
+    ]
+
+    # Refreshing again updates the existing rows
+    baker.make(Session, device=Device.objects.get(value='abcdef'), recommendation=Action.NONE,
+               identity__data='tester', time=timezone.now())
+    call_command('refreshstatistics', stdout=StringIO())
+    assert statistics.get_snapshot()['sessions'] == 4
+
+
+def test_incremental_counts(statistics_testdata):
+    statistics.refresh()
+    package = baker.make(Package, name='openssl')
+    version = baker.make(Version, package=package, release='2.0', security=False, time=timezone.now())
+    snapshot = statistics.get_snapshot()
+    assert snapshot['packages'] == 2
+    assert (snapshot['versions'], snapshot['secure'], snapshot['vulnerable']) == (3, 2, 1)
+
+    version.security = True
+    version.save()
+    snapshot = statistics.get_snapshot()
+    assert (snapshot['versions'], snapshot['secure'], snapshot['vulnerable']) == (3, 1, 2)
+
+    version.delete()
+    snapshot = statistics.get_snapshot()
+    assert (snapshot['versions'], snapshot['secure'], snapshot['vulnerable']) == (2, 1, 1)
+
+    # Tables written by the strongSwan daemon are only counted by a refresh
+    baker.make(Device, value='fedcba')
+    assert statistics.get_snapshot()['devices'] == 2
+
+
+def test_security_counts_without_other_handlers(statistics_testdata):
+    statistics.refresh()
+    version = Version.objects.get(release='1.1')
+    post_save.disconnect(sender=Version, dispatch_uid='vulnerabilities_version_saved')
+    try:
+        version.security = False
+        version.save()
+        assert version.security_changed
+        snapshot = statistics.get_snapshot()
+        assert (snapshot['secure'], snapshot['vulnerable']) == (2, 0)
+
+        # Unchanged or not saved flags are not counted
+        version.save()
+        version.security = True
+        version.save(update_fields=['release'])
+        assert not version.security_changed
+        snapshot = statistics.get_snapshot()
+        assert (snapshot['secure'], snapshot['vulnerable']) == (2, 0)
+    finally:
+        post_save.connect(vulnerabilities.version_saved, sender=Version,
+                          dispatch_uid='vulnerabilities_version_saved')
+
+
+def test_statistics_view(strongtnc_users, client, statistics_testdata):
+    client.login(username='readonly-user', password='readonly')
+    url = reverse('front:statistics')
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.context['snapshot'] is None
+
+    statistics.refresh()
+    response = client.get(url)
+    assert response.context['snapshot']['devices'] == 2
+    assert b'Snapshot taken' in response.content
+
+    # Refreshes are only requested, by users with write access
+    assert client.post(reverse('front:statistics_refresh')).status_code == 403
+    assert not statistics.refresh_requested()
+    client.login(username='admin-user', password='admin')
+    response = client.post(reverse('front:statistics_refresh'))
+    assert response.status_code == 302
+    assert statistics.refresh_requested()
+    assert client.get(url).context['refresh_requested']
+    assert client.get(reverse('front:statistics_refresh')).status_code == 405
+
+    out = StringIO()
+    call_command('refreshstatistics', '--requested', stdout=out)
+    assert 'Statistics refreshed' in out.getvalue()
+    assert not statistics.refresh_requested()
+    assert 'refresh_requested' not in statistics.get_snapshot()
+    out = StringIO()
+    call_command('refreshstatistics', '--requested', stdout=out)
+    assert 'No refresh requested' in out.getvalue()
+
+
+@pytest.fixture
+def rollup_testdata(transactional_db):
+    """
+    Create two devices of different products in a group and its subgroup,
+    with sessions on two days.
+    """
+    day = datetime(2020, 5, 1, tzinfo=pytz.utc)
+    parent = baker.make(Group, name='parent')
+    child = baker.make(Group, name='child', parent=parent)
+    laptop = baker.make(Device, value='laptop', product__name='Debian')
+    phone = baker.make(Device, value='phone', product__name='Android')
+    parent.devices.add(laptop)
+    child.devices.add(phone)
+    sessions = [
+        (laptop, day + timedelta(hours=1, minutes=5), Action.ALLOW),
+        (laptop, day + timedelta(hours=1, minutes=55), Action.BLOCK),
+        (phone, day + timedelta(hours=2), Action.ALLOW),
+        (phone, day + timedelta(days=1, hours=3), Action.ISOLATE),
+    ]
+    for device, time, recommendation in sessions:
+        session = baker.make(Session, device=device, time=time, recommendation=recommendation,
+                             identity__data='tester')
+        baker.make(Result, session=session, recommendation=recommendation,
+                   policy__name='policy%d' % session.pk)
+    return day, parent, child, laptop.product
+
+
+def test_rollups(rollup_testdata):
+    day, parent, child, debian = rollup_testdata
+    now = day + timedelta(days=2)
+    assert rollups.update(now) == 2 + 2 + 3 + 3
+
+    start = rollups.to_epoch(day)
+    hours = rollups.get_series(rollups.HOUR, start, start + 6 * 3600)
+    assert hours['buckets'] == [start + i * 3600 for i in range(6)]
+    assert hours['series'] == [
+        {'key': Action.ALLOW, 'name': 'ALLOW', 'data': [0, 1, 1, 0, 0, 0]},
+        {'key': Action.BLOCK, 'name': 'BLOCK', 'data': [0, 1, 0, 0, 0, 0]},
+    ]
+
+    days = rollups.get_series(rollups.DAY, start, start + 2 * 86400, by='group')
+    assert days['series'] == [
+        {'key': parent.pk, 'name': 'parent', 'data': [3, 1]},
+        {'key': child.pk, 'name': 'child', 'data': [1, 1]},
+    ]
+    days = rollups.get_series(rollups.DAY, start, start + 2 * 86400, by='product', kind='results')
+    assert [(s['name'], s['data']) for s in days['series']] == [('Android', [1, 1]), ('Debian', [2, 0])]
+    days = rollups.get_series(rollups.DAY, start, start + 2 * 86400, product=debian.pk)
+    assert [(s['name'], s['data']) for s in days['series']] == [('ALLOW', [1, 0]), ('BLOCK', [1, 0])]
+
+    # A late session is rolled up by the next update, recomputing the last day only
+    baker.make(Session, device=Device.objects.get(value='laptop'), time=day + timedelta(days=1, hours=3),
+               recommendation=Action.ISOLATE, identity__data='tester')
+    assert rollups.update(now) == 4
+    days = rollups.get_series(rollups.DAY, start, start + 2 * 86400, group=parent.pk)
+    assert days['series'] == [
+        {'key': Action.ALLOW, 'name': 'ALLOW', 'data': [2, 0]},
+        {'key': Action.ISOLATE, 'name': 'ISOLATE', 'data': [0, 2]},
+        {'key': Action.BLOCK, 'name': 'BLOCK', 'data': [1, 0]},
+    ]
+
+    # A backfill yields the same rollups
+    fields = ('resolution', 'start', 'product', 'group', 'recommendation', 'session_count', 'result_count')
+    before = set(SessionRollup.objects.values_list(*fields))
+    call_command('rollups', 'backfill', stdout=StringIO())
+    assert set(SessionRollup.objects.values_list(*fields)) == before
+
+    # The rollups of pruned sessions are kept by a backfill
+    Session.objects.filter(time__lt=day + timedelta(days=1)).delete()
+    rollups.backfill(now=now)
+    days = rollups.get_series(rollups.DAY, start, start + 2 * 86400, group=parent.pk)
+    assert days['series'] == [
+        {'key': Action.ALLOW, 'name': 'ALLOW', 'data': [2, 0]},
+        {'key': Action.ISOLATE, 'name': 'ISOLATE', 'data': [0, 2]},
+        {'key': Action.BLOCK, 'name': 'BLOCK', 'data': [1, 0]},
+    ]
+    Session.objects.all().delete()
+    assert rollups.backfill(now=now) == 0
+    assert SessionRollup.objects.exists()
+
+    with pytest.raises(ValueError):
+        rollups.get_series(rollups.HOUR, start, start + 3600 * (rollups.MAX_BUCKETS + 1))
+    with pytest.raises(ValueError):
+        rollups.get_series(rollups.DAY, start, start + 86400, by='product', group=parent.pk)
+
+
+def test_trends_view(strongtnc_users, client, rollup_testdata):
+    day, parent, child, debian = rollup_testdata
+    rollups.backfill()
+    client.login(username='readonly-user', password='readonly')
+    url = reverse('front:statistics_trends')
+    start = rollups.to_epoch(day)
+
+    response = client.get(url, {'resolution': 'day', 'start': start, 'end': start + 2 * 86400,
+                                'by': 'product'})
+    assert response.status_code == 200
+    trends = json.loads(response.content.decode('utf-8'))
+    assert trends['buckets'] == [start, start + 86400]
+    assert [(s['name'], s['data']) for s in trends['series']] == [('Android', [1, 1]), ('Debian', [2, 0])]
+
+    assert client.get(url, {'resolution': 'week'}).status_code == 400
+    assert client.get(url, {'by': 'identity'}).status_code == 400
+    assert client.get(url, {'start': 'x'}).status_code == 400
+    assert client.get(url, {'group': parent.pk, 'by': 'product'}).status_code == 400
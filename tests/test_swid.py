@@ -14,11 +14,13 @@ from model_bakery import baker
 
 from apps.core.models import Session, WorkItem
 from apps.core.types import WorkItemType
-from apps.swid.models import Tag, EntityRole, Entity, TagStats
+from apps.devices.models import Device
+from apps.packages.models import Version
+from apps.swid.models import Tag, EntityRole, Entity, TagStats, TagChange, DeviceVulnerability, Event
 from apps.filesystem.models import File, Directory
-from apps.swid import utils
+from apps.swid import utils, vulnerabilities
 from apps.swid.paging import swid_inventory_list_producer, swid_log_list_producer, \
-    swid_inventory_stat_producer
+    swid_inventory_stat_producer, swid_inventory_session_list_producer
 
 ### FIXTURES ###
 
@@ -317,18 +319,22 @@ def tags_and_sessions(transactional_db):
     # intital set: tag 1-4
     s1.tag_set.add(tag1, tag2, tag3, tag4)
     utils.update_tag_stats(s1, [1, 2, 3, 4])
+    utils.update_tag_changes(s1)
 
     # s2, added: tag5;
     s2.tag_set.add(tag1, tag2, tag3, tag4, tag5)
     utils.update_tag_stats(s2, [1, 2, 3, 4, 5])
+    utils.update_tag_changes(s2)
 
     # s3, removed: tag1;
     s3.tag_set.add(tag2, tag3, tag4, tag5)
     utils.update_tag_stats(s3, [2, 3, 4, 5])
+    utils.update_tag_changes(s3)
 
     # s4 added: tag6, tag7; removed: tag2;
     s4.tag_set.add(tag3, tag4, tag5, tag6, tag7)
     utils.update_tag_stats(s4, [3, 4, 5, 6, 7])
+    utils.update_tag_changes(s4)
 
     return {
         'now': now,
@@ -459,6 +465,65 @@ def test_swid_log(transactional_db, tags_and_sessions):
     assert len(data[s1]) == 4
 
 
+def test_swid_inventory_session_list_producer(transactional_db, tags_and_sessions):
+    now = tags_and_sessions['now']
+    params = {
+        'device_id': 1,
+        'from_timestamp': int(format(now - timedelta(days=4), 'U')),
+        'to_timestamp': int(format(now + timedelta(days=4), 'U')),
+    }
+    sessions = swid_inventory_session_list_producer(0, 10, None, params)
+    counts = dict((s.pk, (s.tag_count, s.new_tag_count, s.has_tags)) for s in sessions)
+    assert counts == {
+        1: (4, 4, True),
+        2: (5, 1, True),
+        3: (4, 0, True),
+        4: (5, 2, True),
+        5: (0, 0, False),
+        6: (0, 0, False),
+        7: (0, 0, False),
+    }
+
+
+def test_tag_changes(transactional_db, tags_and_sessions):
+    s1, s2, s3, s4 = tags_and_sessions['sessions']
+
+    def changes(session):
+        return sorted((c.tag.unique_id, c.action) for c in TagChange.objects.filter(session=session))
+
+    assert changes(s1) == [('tag%i' % i, TagChange.ADDED) for i in range(1, 5)]
+    assert changes(s2) == [('tag5', TagChange.ADDED)]
+    assert changes(s3) == [('tag1', TagChange.REMOVED)]
+    assert changes(s4) == [('tag2', TagChange.REMOVED), ('tag6', TagChange.ADDED),
+                           ('tag7', TagChange.ADDED)]
+
+    # An empty measurement (session 7, between s3 and s4) records no changes
+    utils.update_tag_changes(Session.objects.get(pk=7))
+    assert not TagChange.objects.filter(session=7).exists()
+    assert changes(s4) == [('tag2', TagChange.REMOVED), ('tag6', TagChange.ADDED),
+                           ('tag7', TagChange.ADDED)]
+
+    # Rebuilding from the session history yields the same changes
+    recorded = sorted(TagChange.objects.values_list('session', 'tag', 'action'))
+    assert utils.rebuild_tag_changes(1) == len(recorded)
+    assert sorted(TagChange.objects.values_list('session', 'tag', 'action')) == recorded
+
+
+def test_tag_changes_out_of_order(transactional_db, tags_and_sessions):
+    s1, s2, s3, s4 = tags_and_sessions['sessions']
+    tags = tags_and_sessions['tags']
+
+    # Measurement of a session between s3 and s4 reported after s4
+    s = baker.make(Session, identity__data="tester", time=s3.time + timedelta(hours=1), device=s3.device)
+    s.tag_set.add(tags[2], tags[3], tags[4], tags[5])
+    utils.update_tag_changes(s)
+
+    assert sorted(TagChange.objects.filter(session=s).values_list('tag', 'action')) == \
+        [(2, TagChange.REMOVED), (6, TagChange.ADDED)]
+    assert sorted(TagChange.objects.filter(session=s4).values_list('tag', 'action')) == \
+        [(7, TagChange.ADDED)]
+
+
 def test_get_installed_tags_with_time(transactional_db, tags_and_sessions):
     s1 = tags_and_sessions['sessions'][0]  # -3 days old
     s2 = tags_and_sessions['sessions'][1]  # -1 day old
@@ -527,3 +592,49 @@ def test_large_tagstats_update(transactional_db):
     tag_ids = range(2000)
     utils.update_tag_stats(s1, tag_ids)
     assert TagStats.objects.count() == 2000
+
+
+def test_device_vulnerabilities(transactional_db):
+    device = baker.make(Device, inactive=False)
+    session = baker.make(Session, device=device, time=timezone.now(), identity__data='tester')
+    secure, insecure = baker.make(Version, security=False), baker.make(Version, security=True)
+    event = baker.make(Event, device=device, eid=1, epoch=1, timestamp=timezone.now())
+    tags = [baker.make(Tag, unique_id='tag%i' % i, version=v) for i, v in enumerate([secure, insecure])]
+    stats = [baker.make(TagStats, tag=tag, device=device, first_seen=session, last_seen=session,
+                        first_installed=event, last_deleted=None) for tag in tags]
+    # Only installed according to the inventory
+    baker.make(TagStats, tag=baker.make(Tag, version=insecure), device=device, first_seen=session,
+               last_seen=session, first_installed=None, last_deleted=None)
+
+    def vulnerable():
+        return sorted(device.get_vulnerabilities().values_list('tag__unique_id', 'active'))
+
+    assert vulnerable() == [('tag1', True)]
+
+    # Security flag of a version changes
+    secure.security = True
+    secure.save()
+    assert vulnerable() == [('tag0', True), ('tag1', True)]
+
+    # Tag moved to another version
+    tags[1].version = baker.make(Version, security=False)
+    tags[1].save()
+    assert vulnerable() == [('tag0', True)]
+
+    # Device becomes inactive
+    device.inactive = True
+    device.save()
+    assert vulnerable() == [('tag0', False)]
+
+    # Tag deleted
+    stats[0].last_deleted = baker.make(Event, device=device, eid=2, epoch=1, timestamp=timezone.now())
+    stats[0].save()
+    assert vulnerable() == []
+
+    stats[0].last_deleted = None
+    stats[0].save()
+    DeviceVulnerability.objects.all().delete()
+    assert vulnerabilities.refresh(device_ids=[device.pk]) == (1, 0, 0)
+    assert vulnerabilities.refresh() == (0, 0, 0)
+    assert vulnerabilities.rebuild() == 1
+    assert vulnerable() == [('tag0', False)]